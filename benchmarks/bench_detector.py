@@ -0,0 +1,153 @@
+# benchmarks/bench_detector.py
+"""
+Card detector backends compared on latency and crop IoU.
+
+Runs each DETECTOR backend of preprocess_service over synthetic cards
+(synthetic_cards.py, fixed seed) or a labeled directory, and compares the
+detected box with the true card box:
+
+    python benchmarks/bench_detector.py --count 50
+    python benchmarks/bench_detector.py --dataset /tmp/cards --backends contour
+
+The contour backend's box is the extent of the card corners it found, the
+same quantity the synthetic card_box records for a rotated card. Load time
+is the backend's start-up cost (TensorFlow import and SavedModel load);
+a backend that cannot load here is reported as skipped.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+# The service configs only find the repo's shared_data from their own directory
+os.environ.setdefault("SHARED_DATA_PATH", str(REPO_ROOT / "shared_data"))
+os.environ.setdefault("DATA_PATH", str(REPO_ROOT / "shared_data"))
+os.environ.setdefault("MODELS_PATH", str(REPO_ROOT / "models"))
+
+import cv2  # noqa: E402
+
+from bench_micro import quiet  # noqa: E402
+from embedded.pipeline import load_service  # noqa: E402
+from synthetic_cards import generate  # noqa: E402
+
+Box = Tuple[int, int, int, int]
+
+
+def iou(a: Box, b: Box) -> float:
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def synthetic_samples(count: int, seed: int) -> Iterator[Tuple[str, "cv2.Mat", Box]]:
+    for card_id, truth, images in generate(count, seed, font_ne=None):
+        for side, image in images.items():
+            yield f"{card_id}_{side}", image, tuple(truth["render"][side]["card_box"])
+
+
+def dataset_samples(dataset: Path) -> Iterator[Tuple[str, "cv2.Mat", Box]]:
+    """<id>.json labels with render.<side>.card_box, next to <id>_<side>.png."""
+    for label_path in sorted(dataset.glob("*.json")):
+        with open(label_path, "r", encoding="utf-8") as f:
+            label = json.load(f)
+        for side, render in label.get("render", {}).items():
+            image = cv2.imread(str(dataset / f"{label_path.stem}_{side}.png"))
+            if image is not None and render.get("card_box"):
+                yield f"{label_path.stem}_{side}", image, tuple(render["card_box"])
+
+
+def load_backends(names: List[str]) -> Tuple[Dict[str, Tuple[Callable, float]], Dict[str, str]]:
+    """{name: (image -> box, load seconds)}, {skipped name: reason}."""
+    with quiet():
+        mods = load_service("preprocess_service", ("config", "contour_detector", "model_inference"))
+    contour, inference = mods["contour_detector"], mods["model_inference"]
+    backends, skipped = {}, {}
+
+    if "contour" in names:
+        backends["contour"] = (lambda image: contour.detect(image)[1], 0.0)
+
+    if "tensorflow" in names:
+        t = time.perf_counter()
+        try:
+            with quiet():
+                detect_fn = inference.load_model(mods["config"].PATH_TO_MODEL)
+                category_index = inference.parse_labelmap(mods["config"].PATH_TO_LABELS)
+        except (ImportError, RuntimeError) as e:
+            skipped["tensorflow"] = f"{type(e).__name__}: {e}"
+        else:
+            def tensorflow(image):
+                _, tensor = inference.load_image(image)
+                boxes, scores, classes = inference.run_detection(detect_fn, tensor)
+                coords = inference.get_crop_coordinates(scores, boxes, classes, category_index,
+                                                        mods["config"].MIN_SCORE)
+                return inference.box_to_pixels(image.shape, *coords)
+            backends["tensorflow"] = (tensorflow, time.perf_counter() - t)
+    return backends, skipped
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", help="labeled directory (default: generate synthetic cards)")
+    parser.add_argument("--count", type=int, default=25, help="synthetic cards (two images each)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--backends", nargs="*", default=["contour", "tensorflow"])
+    parser.add_argument("--min-iou", type=float, default=0.9, help="IoU counted as a correct detection")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    samples = list(dataset_samples(Path(args.dataset)) if args.dataset else synthetic_samples(args.count, args.seed))
+    backends, skipped = load_backends(args.backends)
+
+    results = {}
+    for name, (detect, load_s) in backends.items():
+        with quiet():
+            detect(samples[0][1])  # first call pays for lazy initialization
+        latencies, ious = [], []
+        for _, image, truth in samples:
+            t = time.perf_counter()
+            with quiet():
+                box = detect(image)
+            latencies.append((time.perf_counter() - t) * 1000)
+            ious.append(iou(tuple(box), truth))
+        results[name] = {
+            "images": len(samples),
+            "load_s": round(load_s, 2),
+            "p50_ms": round(_percentile(latencies, 0.5), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "mean_iou": round(statistics.fmean(ious), 4),
+            "min_iou": round(min(ious), 4),
+            "detected": round(sum(v >= args.min_iou for v in ious) / len(ious), 4),
+        }
+
+    print(f"{'backend':<12} {'images':>7} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'mean IoU':>9} "
+          f"{'min IoU':>8} {f'IoU>={args.min_iou}':>10}")
+    for name, r in results.items():
+        print(f"{name:<12} {r['images']:>7} {r['load_s']:>7.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['mean_iou']:>9.3f} {r['min_iou']:>8.3f} {r['detected']:>10.1%}")
+    for name, reason in skipped.items():
+        print(f"{name:<12} skipped ({reason})")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "skipped": skipped}, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
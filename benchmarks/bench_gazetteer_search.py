@@ -0,0 +1,99 @@
+# benchmarks/bench_gazetteer_search.py
+"""
+Global gazetteer search: n-gram shortlist vs. brute-force extractOne.
+
+Queries are gazetteer names with random OCR-style edits plus unrelated
+strings. Every query is answered both ways; the run fails if any answer
+differs at or above the 90 threshold.
+
+    python benchmarks/bench_gazetteer_search.py --queries 2000 --ngram 2 3
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "llm_service"))
+
+from rapidfuzz.utils import default_process  # noqa: E402
+
+from gazetteer_index import NgramIndex  # noqa: E402
+from post_processing import NepalAddressValidator, best_matches  # noqa: E402
+
+THRESHOLD = 90
+
+
+def perturb(rnd, name, max_edits=3):
+    chars = list(name)
+    for _ in range(rnd.randint(0, max_edits)):
+        if not chars:
+            break
+        i = rnd.randrange(len(chars))
+        op = rnd.random()
+        if op < 0.33:
+            del chars[i]
+        elif op < 0.66:
+            chars[i] = rnd.choice(chars)
+        else:
+            chars.insert(i, rnd.choice(chars))
+    return "".join(chars)
+
+
+def make_queries(rnd, names, count):
+    queries = []
+    for _ in range(count):
+        if rnd.random() < 0.8:
+            queries.append(perturb(rnd, rnd.choice(names)))
+        else:
+            queries.append(perturb(rnd, rnd.choice(names) + rnd.choice(names), 6))
+    return queries
+
+
+def run(validator, script, queries, ngram_sizes):
+    index = validator._global[script]
+
+    start = time.perf_counter()
+    exhaustive = [best_matches([q], index)[0] for q in queries]
+    brute_us = (time.perf_counter() - start) / len(queries) * 1e6
+    print(f"[{script}] {len(index.keys)} names, {len(queries)} queries")
+    print(f"  exhaustive        {brute_us:9.1f} us/query")
+
+    for n in ngram_sizes:
+        ngrams = NgramIndex(index.keys, n=n)
+        keys = [default_process(q) for q in queries]
+
+        shortlisted = [len(ngrams.shortlist(k, THRESHOLD)[0]) for k in keys]
+        start = time.perf_counter()
+        indexed = [ngrams.best_match(k, THRESHOLD) for k in keys]
+        ngram_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+        mismatches = 0
+        for (pos_a, score_a), (pos_b, score_b) in zip(exhaustive, indexed):
+            above_a, above_b = score_a >= THRESHOLD, score_b >= THRESHOLD
+            if above_a != above_b or (above_a and (pos_a, score_a) != (pos_b, score_b)):
+                mismatches += 1
+        accepted = sum(score >= THRESHOLD for _, score in exhaustive)
+        print(f"  {n}-gram index      {ngram_us:9.1f} us/query  "
+              f"speedup {brute_us / ngram_us:5.1f}x  "
+              f"mean shortlist {sum(shortlisted) / len(shortlisted):6.1f}  "
+              f"accepted {accepted}  mismatches {mismatches}")
+        if mismatches:
+            raise SystemExit(f"{n}-gram search disagrees with exhaustive search on {mismatches} queries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--ngram", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    validator = NepalAddressValidator()
+    rnd = random.Random(args.seed)
+    for script, names in (("ne", list(validator.ne_global_map)), ("en", list(validator.en_global_map))):
+        run(validator, script, make_queries(rnd, names, args.queries), args.ngram)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# benchmarks/bench_micro.py
+"""
+Micro-benchmarks for the per-card hot paths, with a saved baseline.
+
+Inputs are synthetic cards (synthetic_cards.py, fixed seed), so runs are
+repeatable. Each case is timed with timeit's autorange and repeated; the
+best per-call time is compared, as it is the least sensitive to noise.
+
+    python benchmarks/bench_micro.py --save-baseline benchmarks/baseline.json
+    # ... change something ...
+    python benchmarks/bench_micro.py --baseline benchmarks/baseline.json --tolerance 0.15
+
+With --baseline the run exits 1 and lists every case more than --tolerance
+slower than its baseline. Cases whose service dependencies are missing
+(e.g. the face cascade on OpenCV builds without it) are reported as skipped.
+Baselines are per machine: save one on the box the comparison runs on.
+
+--alloc adds each case's peak memory allocated in one call (numpy and
+OpenCV buffers, via tracemalloc) and the same as a number of copies of the
+benchmark card; run with --width 4000 to see what a 12 MP upload costs.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+# The service configs only find the repo's shared_data from their own directory
+os.environ.setdefault("SHARED_DATA_PATH", str(REPO_ROOT / "shared_data"))
+os.environ.setdefault("DATA_PATH", str(REPO_ROOT / "shared_data"))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from embedded.pipeline import load_service  # noqa: E402
+from synthetic_cards import generate, load_places  # noqa: E402
+from bench_gazetteer_search import perturb  # noqa: E402
+
+Case = Tuple[str, Callable[[], object]]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Most stages print progress; keep it out of the report (the cost still counts)."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _load_regex_extract():
+    # llm_service/regex-filter.py is not importable by name
+    path = REPO_ROOT / "llm_service" / "regex-filter.py"
+    spec = importlib.util.spec_from_file_location("regex_filter", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.regex_extract
+
+
+def build_cases(seed: int, width: int, queries: int) -> Tuple[List[Case], Dict[str, str]]:
+    """Returns (cases, {skipped case: reason})."""
+    cases: List[Case] = []
+    skipped: Dict[str, str] = {}
+
+    _, _, images = next(generate(1, seed, min_width=width, max_width=width, font_ne=None))
+    card = images["front"]
+    gray = cv2.cvtColor(card, cv2.COLOR_BGR2GRAY)
+
+    with quiet():
+        pre = load_service("preprocess_service", ("preprocessing", "face_detector"))
+    prep = pre["preprocessing"]
+    with quiet():
+        rotated = prep.skew_correction(gray)
+        resized = prep.resize_image(rotated)
+        processed = prep.preprocess_pipeline(card)
+
+    cases += [
+        ("skew_correction", lambda: prep.skew_correction(gray)),
+        ("resize_image", lambda: prep.resize_image(rotated)),
+        ("add_border", lambda: prep.add_border(resized)),
+        ("preprocess_pipeline", lambda: prep.preprocess_pipeline(card)),
+    ]
+
+    face_detector = pre["face_detector"].face_detector
+    try:
+        with quiet():
+            face_detector(processed)
+        cases.append(("face_detector", lambda: face_detector(processed)))
+    except Exception as e:
+        skipped["face_detector"] = f"{type(e).__name__}: {e}"
+
+    with quiet():
+        detector = load_service("preprocess_service", ("contour_detector", "model_inference"))
+    crop_image = detector["model_inference"].crop_image
+    cases += [
+        ("crop_image", lambda: crop_image(card, 0.1, 0.1, 0.9, 0.9)),
+        ("crop_and_preprocess", lambda: prep.preprocess_pipeline(crop_image(card, 0.1, 0.1, 0.9, 0.9))),
+        ("detect_contour", lambda: detector["contour_detector"].detect(card)),
+    ]
+
+    try:
+        with quiet():
+            run_ocr = load_service("ocr_service", ("run_ocr",))["run_ocr"]
+        texts = list(run_ocr._STUB_TEXT.values())
+        cases.append(("_is_valid_ocr_result", lambda: [run_ocr._is_valid_ocr_result(t) for t in texts]))
+    except ImportError as e:
+        skipped["_is_valid_ocr_result"] = f"{type(e).__name__}: {e}"
+        texts = []
+
+    if texts:
+        regex_extract = _load_regex_extract()
+        cases.append(("regex_extract", lambda: regex_extract(texts[0])))
+
+    with quiet():
+        validator = load_service("llm_service", ("post_processing",))["post_processing"].NepalAddressValidator()
+    rnd = random.Random(seed)
+    places = load_places()
+    sample = [rnd.choice(places) for _ in range(queries)]
+    ne_queries = [(perturb(rnd, d, 1), perturb(rnd, m, 2), w) for (d, m, w), _ in sample]
+    en_queries = [(perturb(rnd, m, 2), perturb(rnd, d, 1), w) for _, (d, m, w) in sample]
+
+    def lookups(fn, rows):
+        def run():
+            # Cold lookups: the cache would otherwise answer every repeat
+            validator._resolve_cached.cache_clear()
+            for row in rows:
+                fn(*row)
+        return run
+
+    cases += [
+        (f"address_lookup_ne[{queries}]", lookups(validator.get_nepali_place, ne_queries)),
+        (f"address_lookup_en[{queries}]", lookups(validator.get_english_place, en_queries)),
+    ]
+    return cases, skipped, card.nbytes
+
+
+def measure_alloc(fn: Callable[[], object], image_bytes: int) -> dict:
+    """Peak bytes allocated during one call, beyond what was live before it."""
+    with quiet():
+        fn()  # lazy initialization is not per call
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+    return {"alloc_peak_kib": round(peak / 1024, 1), "alloc_copies": round(peak / image_bytes, 2)}
+
+
+def measure(fn: Callable[[], object], repeat: int) -> dict:
+    timer = timeit.Timer(fn)
+    with quiet():
+        loops, _ = timer.autorange()
+        times = [t / loops for t in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        "best_us": round(min(times) * 1e6, 2),
+        "median_us": round(statistics.median(times) * 1e6, 2),
+        "loops": loops,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["best_us"] / base["best_us"] if base["best_us"] else 1.0
+        result["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {base['best_us']:.1f} -> {result['best_us']:.1f} us ({ratio:.2f}x)")
+    return regressions
+
+
+def _environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--width", type=int, default=1400, help="card width of the benchmark image, pixels")
+    parser.add_argument("--queries", type=int, default=200, help="address lookups per lookup case")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="run only cases whose name starts with one of these")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    parser.add_argument("--alloc", action="store_true", help="also measure peak allocation per call")
+    args = parser.parse_args()
+
+    cases, skipped, image_bytes = build_cases(args.seed, args.width, args.queries)
+    if args.only:
+        cases = [c for c in cases if c[0].startswith(tuple(args.only))]
+
+    results = {}
+    for name, fn in cases:
+        results[name] = measure(fn, args.repeat)
+        if args.alloc:
+            results[name].update(measure_alloc(fn, image_bytes))
+
+    baseline: Optional[dict] = None
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+
+    alloc_header = f" {'peak KiB':>10} {'copies':>7}" if args.alloc else ""
+    print(f"{'case':<28} {'best us':>12} {'median us':>12} {'loops':>7} {'vs base':>8}{alloc_header}")
+    for name, r in results.items():
+        vs = f"{r['vs_baseline']:.2f}x" if "vs_baseline" in r else ""
+        alloc = f" {r['alloc_peak_kib']:>10.1f} {r['alloc_copies']:>7.2f}" if args.alloc else ""
+        print(f"{name:<28} {r['best_us']:>12.1f} {r['median_us']:>12.1f} {r['loops']:>7} {vs:>8}{alloc}")
+    for name, reason in skipped.items():
+        print(f"{name:<28} skipped ({reason})")
+
+    if args.save_baseline:
+        report = {"environment": _environment(), "args": {"seed": args.seed, "width": args.width,
+                                                          "queries": args.queries},
+                  "results": results, "skipped": skipped}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if regressions:
+        print(f"\nREGRESSIONS (more than {args.tolerance:.0%} slower than {args.baseline}):", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        sys.exit(1)
+    if baseline is not None and baseline.get("environment") != _environment():
+        print("\nNote: baseline was recorded on a different environment", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
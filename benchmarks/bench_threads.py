@@ -0,0 +1,155 @@
+# benchmarks/bench_threads.py
+"""
+Throughput of the CPU stages over a workers x threads grid.
+
+Runs decode, preprocess and OCR (embedded.Pipeline.read, the work of the
+preprocess and OCR services) over synthetic cards in a pool of worker
+processes, once per combination of worker count and CPU_THREADS per worker,
+and reports cards per second and per-card latency for each:
+
+    python benchmarks/bench_threads.py --workers 1 2 4 8 --threads 1 2 4
+    OCR_ENGINE=tesseract python benchmarks/bench_threads.py --pin --out sweep.json
+
+Each configuration gets a fresh pool of spawned processes whose budget is
+set before they import OpenCV, numpy or an OCR engine, exactly as the
+services' cpu_budget applies it; --pin adds CPU_AFFINITY=auto. The best
+throughput is marked; combinations asking for more threads than there are
+CPUs (workers x threads > CPU count) are marked as oversubscribed, which is
+usually where throughput falls off. The OCR engine is the one configured
+(OCR_ENGINE): the stub engine only sleeps, so use paddle or tesseract for
+numbers that mean anything.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+# The service configs only find the repo's shared_data from their own directory
+os.environ.setdefault("SHARED_DATA_PATH", str(REPO_ROOT / "shared_data"))
+os.environ.setdefault("DATA_PATH", str(REPO_ROOT / "shared_data"))
+os.environ.setdefault("MODELS_PATH", str(REPO_ROOT / "models"))
+
+# Nothing native is imported at module level: spawned workers import this
+# module before _init_worker has set their budget.
+
+_pipeline = None
+
+
+def _init_worker(threads: int, pin: bool, slot_dir: str, warm_image: bytes):
+    global _pipeline
+    os.environ["CPU_THREADS"] = str(threads)
+    os.environ["CPU_AFFINITY"] = "auto" if pin else ""
+    os.environ["CPU_SLOT_DIR"] = slot_dir
+    from bench_micro import quiet
+    from embedded.pipeline import Pipeline, PipelineError
+
+    with quiet():
+        _pipeline = Pipeline()
+        try:
+            _pipeline.read(warm_image, {})  # loads every module and model before timing starts
+        except PipelineError:
+            pass
+
+
+def _read(image: bytes) -> float:
+    from bench_micro import quiet
+    from embedded.pipeline import PipelineError
+
+    t = time.perf_counter()
+    try:
+        with quiet():
+            _pipeline.read(image, {})
+    except PipelineError:
+        pass  # a rejected card still did the work up to the rejection
+    return (time.perf_counter() - t) * 1000
+
+
+def load_images(count: int, seed: int, dataset: str = None) -> List[bytes]:
+    import cv2
+    from synthetic_cards import generate
+
+    if dataset:
+        paths = sorted(p for p in Path(dataset).iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+        return [p.read_bytes() for p in paths[:count * 2]]
+    images = []
+    for _, _, sides in generate(count, seed):
+        for image in sides.values():
+            ok, buf = cv2.imencode(".png", image)
+            images.append(buf.tobytes())
+    return images
+
+
+def run_config(images: List[bytes], workers: int, threads: int, pin: bool, rounds: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory(prefix="cpu-slots-") as slot_dir:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                                 initargs=(threads, pin, slot_dir, images[0])) as pool:
+            # Start every worker (and its warm-up) before the clock does
+            list(pool.map(time.sleep, [0.05] * workers))
+            work = images * rounds
+            t = time.perf_counter()
+            latencies = list(pool.map(_read, work))
+            elapsed = time.perf_counter() - t
+    ordered = sorted(latencies)
+    return {
+        "workers": workers,
+        "threads": threads,
+        "cards_per_s": round(len(work) / elapsed, 2),
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pin", action="store_true", help="pin each worker to its own cores (CPU_AFFINITY=auto)")
+    parser.add_argument("--count", type=int, default=8, help="synthetic cards (two images each)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dataset", help="directory of card images instead of synthetic cards")
+    parser.add_argument("--rounds", type=int, default=2, help="passes over the images per configuration")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    images = load_images(args.count, args.seed, args.dataset)
+    print(f"{len(images)} images x {args.rounds} rounds, {cpus} CPUs, "
+          f"OCR_ENGINE={os.getenv('OCR_ENGINE', 'paddle')}{', pinned' if args.pin else ''}", file=sys.stderr)
+
+    results = []
+    for workers in args.workers:
+        for threads in args.threads:
+            result = run_config(images, workers, threads, args.pin, args.rounds)
+            result["oversubscribed"] = workers * threads > cpus
+            results.append(result)
+            print(f"  {workers} workers x {threads} threads: {result['cards_per_s']} cards/s", file=sys.stderr)
+
+    best = max(results, key=lambda r: r["cards_per_s"])
+    print(f"{'workers':>7} {'threads':>7} {'cards/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in results:
+        marks = (" best" if r is best else "") + (" oversubscribed" if r["oversubscribed"] else "")
+        print(f"{r['workers']:>7} {r['threads']:>7} {r['cards_per_s']:>8.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}"
+              f"{marks}")
+    print(f"Best: {best['workers']} workers x CPU_THREADS={best['threads']} "
+          f"({best['cards_per_s']} cards/s)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"cpus": cpus, "pinned": args.pin, "results": results, "best": best}, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+# benchmarks/eval_pipeline.py
+"""
+Field-level accuracy vs. latency across pipeline configurations.
+
+Runs a labeled card set through embedded.Pipeline once per variant and
+reports, per variant, exact-match and edit-distance similarity for every
+extracted field next to p50/p95 per-card latency and throughput, marking
+the variants on the accuracy/latency Pareto front.
+
+    python benchmarks/synthetic_cards.py --count 100 --out /tmp/cards --font-ne ...
+    python benchmarks/eval_pipeline.py --dataset /tmp/cards --out report.json
+    python benchmarks/eval_pipeline.py --dataset /tmp/cards --variants baseline no-deskew rules
+
+A dataset is a directory of <id>.json files ({"expected": {"front": {...},
+"back": {...}}} in post_process's output shapes, as synthetic_cards.py
+writes them) with images named <id>_front.<ext> / <id>_back.<ext>; real
+labeled scans can use the same layout.
+
+Each variant runs in a fresh process, since the services read their
+settings from the environment at import. A variant is an environment
+overlay (OCR_ENGINE, DESKEW, EXTRACTION_MODE, ADDRESS_CACHE_SIZE, ...) plus
+an extraction choice: "llm" (the service path) or "rules" (regex_extract
+from llm_service/regex-filter.py, then the same address post-processing;
+it only reads Nepali fronts). --variants-file adds or overrides variants:
+
+    {"paddle-exhaustive": {"env": {"GAZETTEER_SEARCH": "exhaustive"}, "extract": "llm"}}
+
+--oracle-crop crops with the labeled card box and takes the side from the
+label, measuring OCR and extraction without the detector.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+
+VARIANTS = {
+    "baseline": {"env": {}, "extract": "llm"},
+    "no-deskew": {"env": {"DESKEW": "0"}, "extract": "llm"},
+    "tesseract": {"env": {"OCR_ENGINE": "tesseract"}, "extract": "llm"},
+    "constrained": {"env": {"EXTRACTION_MODE": "constrained"}, "extract": "llm"},
+    "rules": {"env": {}, "extract": "rules"},
+    "no-address-cache": {"env": {"ADDRESS_CACHE_SIZE": "0"}, "extract": "llm"},
+    "exhaustive-search": {"env": {"GAZETTEER_SEARCH": "exhaustive"}, "extract": "llm"},
+}
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+# Canonical field -> where post_process puts it, per side
+FIELDS = {
+    "front": {
+        "name": ("Name",),
+        "number": ("Citizenship Number",),
+        "dob": ("Date of Birth (DOB)",),
+        "father": ("Father's Name",),
+        "mother": ("Mother's Name",),
+        "gender": ("Gender",),
+        "spouse": ("Spouse Name",),
+        "birth_district": ("Birth Place", "District"),
+        "birth_municipality": ("Birth Place", "Municipality/VDC"),
+        "birth_ward": ("Birth Place", "Ward"),
+        "permanent_district": ("Permanent Address", "District"),
+        "permanent_municipality": ("Permanent Address", "Municipality/VDC"),
+        "permanent_ward": ("Permanent Address", "Ward"),
+    },
+    "back": {
+        "name": ("Name",),
+        "number": ("Citizenship Number",),
+        "dob": ("Date of Birth (DOB)",),
+        "gender": ("Gender",),
+        "birth_district": ("Birth Place District",),
+        "birth_municipality": ("Birth Place MetroPolitan/Sub-MetroPolitan/Municipality/VDC",),
+        "birth_ward": ("Birth Place Ward",),
+        "permanent_district": ("Permanent District",),
+        "permanent_municipality": ("Permanent MetroPolitan/Sub-MetroPolitan/Municipality/VDC",),
+        "permanent_ward": ("Permanent Ward",),
+        "issued": ("Issued Date",),
+    },
+}
+DIGIT_FIELDS = {"number", "dob", "issued", "birth_ward", "permanent_ward"}
+
+_ASCII_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+_GENDERS = (("female", "female"), ("महिला", "female"), ("male", "male"), ("पुरुष", "male"),
+            ("other", "other"), ("अन्य", "other"))
+
+
+# --- dataset ---
+
+def load_samples(dataset: Path) -> List[dict]:
+    """[{id, side, image, expected, card_box}] in id order."""
+    samples = []
+    for label_path in sorted(dataset.glob("*.json")):
+        with open(label_path, "r", encoding="utf-8") as f:
+            label = json.load(f)
+        card_id = label.get("id", label_path.stem)
+        for side, expected in label.get("expected", {}).items():
+            image = next((dataset / f"{card_id}_{side}{ext}" for ext in IMAGE_EXTENSIONS
+                          if (dataset / f"{card_id}_{side}{ext}").exists()), None)
+            if image is None:
+                continue
+            samples.append({
+                "id": card_id, "side": side, "image": str(image), "expected": expected,
+                "card_box": label.get("render", {}).get(side, {}).get("card_box"),
+            })
+    return samples
+
+
+# --- scoring ---
+
+def _lookup(result: dict, path: Tuple[str, ...]):
+    value = result
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def flatten(result: dict, side: str) -> Dict[str, Optional[str]]:
+    result = result.get("final_clean", result) if isinstance(result, dict) else {}
+    return {field: _lookup(result, path) for field, path in FIELDS[side].items()}
+
+
+def normalize(field: str, value) -> str:
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFC", str(value)).translate(_ASCII_DIGITS)
+    if field in DIGIT_FIELDS:
+        # Dates and numbers are compared on their digits ("२०४५ महिना ०२" == "2045-02")
+        return re.sub(r"\D", "", text)
+    text = " ".join(text.casefold().split())
+    if field == "gender":
+        return next((g for token, g in _GENDERS if token in text), text)
+    return text
+
+
+def score(samples: List[dict], records: List[dict]) -> dict:
+    from rapidfuzz.distance import Levenshtein
+
+    by_key = {(r["id"], r["side"]): r for r in records}
+    exact: Dict[str, List[float]] = {}
+    similarity: Dict[str, List[float]] = {}
+    for sample in samples:
+        record = by_key.get((sample["id"], sample["side"]))
+        if record is None:
+            continue
+        got = flatten(record.get("result") or {}, sample["side"])
+        want = flatten(sample["expected"], sample["side"])
+        for field in FIELDS[sample["side"]]:
+            a, b = normalize(field, got[field]), normalize(field, want[field])
+            exact.setdefault(field, []).append(float(a == b))
+            similarity.setdefault(field, []).append(Levenshtein.normalized_similarity(a, b))
+
+    all_exact = [v for values in exact.values() for v in values]
+    all_similarity = [v for values in similarity.values() for v in values]
+    return {
+        "exact": round(statistics.fmean(all_exact), 4) if all_exact else 0.0,
+        "similarity": round(statistics.fmean(all_similarity), 4) if all_similarity else 0.0,
+        "fields": {field: {"exact": round(statistics.fmean(exact[field]), 4),
+                           "similarity": round(statistics.fmean(similarity[field]), 4)}
+                   for field in exact},
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def summarize(name: str, samples: List[dict], records: List[dict], timed_s: float) -> dict:
+    latencies = [r["latency_ms"] for r in records if "error" not in r]
+    summary = {"variant": name, "cards": len(records),
+               "errors": sum("error" in r for r in records),
+               "p50_ms": round(_percentile(latencies, 0.5), 1),
+               "p95_ms": round(_percentile(latencies, 0.95), 1),
+               "throughput": round(len(records) / timed_s, 3) if timed_s else 0.0}
+    summary.update(score(samples, records))
+    return summary
+
+
+def mark_pareto(summaries: List[dict]):
+    """A variant is on the front unless another is at least as accurate and as fast, and better at one."""
+    for s in summaries:
+        s["pareto"] = not any(
+            o is not s and o["exact"] >= s["exact"] and o["p95_ms"] <= s["p95_ms"]
+            and (o["exact"] > s["exact"] or o["p95_ms"] < s["p95_ms"])
+            for o in summaries)
+
+
+# --- worker (one variant, in its own process) ---
+
+def _load_regex_extract():
+    import importlib.util
+
+    # llm_service/regex-filter.py is not importable by name
+    spec = importlib.util.spec_from_file_location("regex_filter", REPO_ROOT / "llm_service" / "regex-filter.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.regex_extract
+
+
+def _rules_extract(pipeline, regex_extract, text: str, side: str) -> dict:
+    found = regex_extract(text)
+    raw = {
+        "Name": found["Name"],
+        "Citizenship_Number": found["Citizenship Number"],
+        "Date_of_Birth_DOB": found["Date of Birth (DOB)"],
+        "Fathers_Name": found["Father's Name"],
+        "Mothers_Name": found["Mother's Name"],
+        "Gender": found["Gender"],
+        "Spouse_Name": found["Spouse Name"],
+        "Birth_Place_District": found["Birth Place District"],
+        "Birth_Place_MetroPolitan_Sub_MetroPolitan_Municipality_VDC": found["Birth Place Municipality"],
+        "Birth_Place_Ward": found["Birth Place Ward"],
+        "Permanent_District": found["Permanent District"],
+        "Permanent_MetroPolitan_Sub_MetroPolitan_Municipality_VDC": found["Permanent Municipality"],
+        "Permanent_Ward": found["Permanent Ward"],
+    }
+    return pipeline.validator.post_process(raw, side)
+
+
+def run_worker(variant: dict, samples: List[dict], out_path: str, oracle_crop: bool, warmup: int):
+    sys.path.insert(0, str(REPO_ROOT))
+    import uuid
+
+    import cv2
+
+    from embedded.pipeline import Pipeline, load_service
+
+    pipeline = Pipeline()
+    preprocessing = load_service("preprocess_service", ("preprocessing",))["preprocessing"] if oracle_crop else None
+    regex_extract = _load_regex_extract() if variant.get("extract") == "rules" else None
+
+    def process(sample: dict) -> dict:
+        request_id = uuid.uuid4().hex
+        timings = {}
+        start = time.perf_counter()
+        if oracle_crop:
+            img = cv2.imread(sample["image"])
+            if sample["card_box"]:
+                left, top, right, bottom = sample["card_box"]
+                img = img[top:bottom, left:right]
+            side = sample["side"]
+            text, engine = pipeline.ocr(preprocessing.preprocess_pipeline(img), side)
+            timings["ocr"] = 0.0
+        else:
+            text, side, engine = pipeline.read(sample["image"], timings)
+
+        if regex_extract is not None:
+            result = _rules_extract(pipeline, regex_extract, text, side)
+        else:
+            result = pipeline.finish(request_id, text, side, engine, timings)["result"]
+        return {"latency_ms": (time.perf_counter() - start) * 1000, "result": result,
+                "detected_side": side, "ocr_engine": engine}
+
+    for sample in samples[:warmup]:
+        try:
+            process(sample)
+        except Exception:
+            pass
+
+    with open(out_path, "w", encoding="utf-8") as out:
+        for sample in samples:
+            record = {"id": sample["id"], "side": sample["side"]}
+            try:
+                record.update(process(sample))
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+
+def run_variant(name: str, variant: dict, args, log_dir: Path) -> Tuple[List[dict], float]:
+    env = dict(os.environ)
+    # The service configs only find the repo's shared_data from their own directory
+    env.setdefault("SHARED_DATA_PATH", str(REPO_ROOT / "shared_data"))
+    env.setdefault("DATA_PATH", str(REPO_ROOT / "shared_data"))
+    env.update(variant.get("env", {}))
+
+    out_path = log_dir / f"{name}.jsonl"
+    log_path = log_dir / f"{name}.log"
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--worker", json.dumps(variant),
+           "--worker-out", str(out_path), "--dataset", args.dataset, "--warmup", str(args.warmup)]
+    if args.limit:
+        cmd += ["--limit", str(args.limit)]
+    if args.oracle_crop:
+        cmd.append("--oracle-crop")
+
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+    if proc.returncode != 0 or not out_path.exists():
+        tail = log_path.read_text(encoding="utf-8", errors="replace").splitlines()[-5:]
+        print(f"[eval] {name} failed (exit {proc.returncode}); log {log_path}:\n  " + "\n  ".join(tail),
+              file=sys.stderr)
+        return [], 0.0
+
+    with open(out_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    # Throughput from the timed cards only, not interpreter and model start-up
+    timed = sum(r.get("latency_ms", 0) for r in records) / 1000
+    return records, timed
+
+
+def print_report(summaries: List[dict]):
+    print(f"\n{'variant':<20} {'exact':>7} {'sim':>7} {'p50 ms':>9} {'p95 ms':>9} {'cards/s':>8} {'errors':>7}  pareto")
+    for s in sorted(summaries, key=lambda s: s["p95_ms"]):
+        print(f"{s['variant']:<20} {s['exact']:>7.1%} {s['similarity']:>7.1%} {s['p50_ms']:>9.1f} "
+              f"{s['p95_ms']:>9.1f} {s['throughput']:>8.2f} {s['errors']:>7}  {'*' if s['pareto'] else ''}")
+
+    fields = sorted({f for s in summaries for f in s["fields"]})
+    if not fields:
+        return
+    print(f"\n{'exact match by field':<24}" + "".join(f"{s['variant'][:12]:>13}" for s in summaries))
+    for field in fields:
+        row = "".join(f"{s['fields'][field]['exact']:>13.1%}" if field in s["fields"] else f"{'-':>13}"
+                      for s in summaries)
+        print(f"{field:<24}{row}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", required=True, help="directory of labeled cards")
+    parser.add_argument("--variants", nargs="*", help=f"variants to run (default: all of {', '.join(VARIANTS)})")
+    parser.add_argument("--variants-file", help="JSON object of extra or overriding variants")
+    parser.add_argument("--limit", type=int, help="use only the first N images")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed images run first in each variant")
+    parser.add_argument("--oracle-crop", action="store_true", help="crop with the labeled box instead of the detector")
+    parser.add_argument("--out", help="write the full report (summaries and per-field scores) as JSON")
+    parser.add_argument("--keep-logs", help="directory for per-variant worker logs and raw outputs")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    samples = load_samples(Path(args.dataset))
+    if args.limit:
+        samples = samples[:args.limit]
+
+    if args.worker:
+        run_worker(json.loads(args.worker), samples, args.worker_out, args.oracle_crop, args.warmup)
+        return
+
+    if not samples:
+        parser.error(f"no labeled images in {args.dataset}")
+
+    variants = dict(VARIANTS)
+    if args.variants_file:
+        with open(args.variants_file, "r", encoding="utf-8") as f:
+            variants.update(json.load(f))
+    names = args.variants or list(variants)
+    unknown = [n for n in names if n not in variants]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)}")
+
+    log_dir = Path(args.keep_logs) if args.keep_logs else Path(tempfile.mkdtemp(prefix="eval_pipeline_"))
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    summaries = []
+    for name in names:
+        print(f"[eval] {name}: {len(samples)} images ...", file=sys.stderr, flush=True)
+        records, timed_s = run_variant(name, variants[name], args, log_dir)
+        if records:
+            summaries.append(summarize(name, samples, records, timed_s))
+    mark_pareto(summaries)
+    print_report(summaries)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"dataset": args.dataset, "images": len(samples), "oracle_crop": args.oracle_crop,
+                       "variants": {n: variants[n] for n in names}, "summaries": summaries}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"\nReport saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
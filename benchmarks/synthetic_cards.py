@@ -0,0 +1,311 @@
+# benchmarks/synthetic_cards.py
+"""
+Synthetic citizenship cards for benchmarks and accuracy runs.
+
+Each card is a person drawn from fixed name lists plus birth and permanent
+addresses drawn from the gazetteer (Nepali and English names of the same
+place), rendered as a Devanagari front and an English back, then placed on a
+background with random skew, blur and resolution. The ground truth is
+written next to the images in the shapes post_process returns, with the
+card's bounding box in the final image.
+
+    python benchmarks/synthetic_cards.py --count 50 --out /tmp/cards --seed 7
+
+writes card_0000_front.png, card_0000_back.png and card_0000.json, ...
+
+Devanagari needs a font that covers it (Noto Sans Devanagari, Lohit,
+Mangal; see --font-ne). Without one the front is drawn with Pillow's
+default font, which is fine for timing but gives unreadable text.
+The photo box is a flat placeholder, so face detection finds no face on
+synthetic fronts.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+GAZETTEER_NE = REPO_ROOT / "shared_data" / "nepal_municipalities_by_district.json"
+GAZETTEER_EN = REPO_ROOT / "shared_data" / "en_nepal_municipalities_by_district.json"
+
+# Card (ID-1 aspect) before placement and distortion
+CARD_W, CARD_H = 1000, 630
+
+FONT_CANDIDATES_NE = [
+    "/usr/share/fonts/truetype/noto/NotoSansDevanagari-Regular.ttf",
+    "/usr/share/fonts/noto/NotoSansDevanagari-Regular.ttf",
+    "/usr/share/fonts/truetype/lohit-devanagari/Lohit-Devanagari.ttf",
+    "/usr/share/fonts/truetype/fonts-deva-extra/kalimati.ttf",
+    "C:/Windows/Fonts/mangal.ttf",
+    "/System/Library/Fonts/Supplemental/Devanagari Sangam MN.ttc",
+]
+FONT_CANDIDATES_EN = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+]
+
+# (Nepali, English, gender)
+FIRST_NAMES = [
+    ("राम", "Ram", "M"), ("हरि", "Hari", "M"), ("कृष्ण", "Krishna", "M"), ("बिनोद", "Binod", "M"),
+    ("प्रकाश", "Prakash", "M"), ("दीपक", "Deepak", "M"), ("सुरेश", "Suresh", "M"), ("गणेश", "Ganesh", "M"),
+    ("सीता", "Sita", "F"), ("गीता", "Gita", "F"), ("सुनिता", "Sunita", "F"), ("सरिता", "Sarita", "F"),
+    ("अनिता", "Anita", "F"), ("कमला", "Kamala", "F"), ("लक्ष्मी", "Laxmi", "F"), ("मीना", "Mina", "F"),
+]
+MIDDLE_NAMES = {
+    "M": [("बहादुर", "Bahadur"), ("प्रसाद", "Prasad"), ("कुमार", "Kumar"), ("", "")],
+    "F": [("कुमारी", "Kumari"), ("देवी", "Devi"), ("", "")],
+}
+SURNAMES = [
+    ("थापा", "Thapa"), ("श्रेष्ठ", "Shrestha"), ("गुरुङ", "Gurung"), ("तामाङ", "Tamang"), ("राई", "Rai"),
+    ("अधिकारी", "Adhikari"), ("पौडेल", "Poudel"), ("खड्का", "Khadka"), ("मगर", "Magar"), ("शर्मा", "Sharma"),
+]
+GENDER = {"M": ("पुरुष", "Male"), "F": ("महिला", "Female")}
+
+_NE_DIGITS = str.maketrans("0123456789", "०१२३४५६७८९")
+
+
+def ne_digits(text: str) -> str:
+    return text.translate(_NE_DIGITS)
+
+
+def _clean(name: str) -> str:
+    return " ".join(name.split())
+
+
+def load_places() -> List[Tuple[Tuple[str, str, str], Tuple[str, str, str]]]:
+    """[((district, municipality, ward) in Nepali, the same in English)], paired by gazetteer order."""
+    with open(GAZETTEER_NE, "r", encoding="utf-8") as f:
+        ne = json.load(f)
+    with open(GAZETTEER_EN, "r", encoding="utf-8") as f:
+        en = json.load(f)
+
+    places = []
+    for ne_province, en_province in zip(ne.values(), en.values()):
+        for (ne_district, ne_munis), (en_district, en_munis) in zip(ne_province.items(), en_province.items()):
+            # The two files disagree on a district or two; only pair exact matches
+            if [len(w) for w in ne_munis.values()] != [len(w) for w in en_munis.values()]:
+                continue
+            for (ne_muni, wards), en_muni in zip(ne_munis.items(), en_munis):
+                for ward in wards:
+                    places.append(((_clean(ne_district), _clean(ne_muni), ward),
+                                   (_clean(en_district), _clean(en_muni), ward)))
+    return places
+
+
+def make_person(rnd: random.Random, places) -> dict:
+    first_ne, first_en, gender = rnd.choice(FIRST_NAMES)
+    middle_ne, middle_en = rnd.choice(MIDDLE_NAMES[gender])
+    last_ne, last_en = rnd.choice(SURNAMES)
+    father_ne, father_en, _ = rnd.choice([n for n in FIRST_NAMES if n[2] == "M"])
+    mother_ne, mother_en, _ = rnd.choice([n for n in FIRST_NAMES if n[2] == "F"])
+
+    dob_ad = (rnd.randint(1960, 2006), rnd.randint(1, 12), rnd.randint(1, 28))
+    issued = (dob_ad[0] + rnd.randint(16, 18), rnd.randint(1, 12), rnd.randint(1, 28))
+    # Bikram Sambat runs about 56 years 8 months ahead; close enough for synthetic data
+    dob_bs = (dob_ad[0] + 57, rnd.randint(1, 12), rnd.randint(1, 30))
+
+    return {
+        "name": (" ".join(p for p in (first_ne, middle_ne, last_ne) if p),
+                 " ".join(p for p in (first_en, middle_en, last_en) if p)),
+        "father": (f"{father_ne} {last_ne}", f"{father_en} {last_en}"),
+        "mother": (f"{mother_ne} {last_ne}", f"{mother_en} {last_en}"),
+        "gender": GENDER[gender],
+        "number": f"{rnd.randint(1, 77):02d}-{rnd.randint(1, 99):02d}-{rnd.randint(60, 80):02d}-{rnd.randint(0, 99999):05d}",
+        "dob_bs": "{:04d}-{:02d}-{:02d}".format(*dob_bs),
+        "dob_ad": "{:04d}-{:02d}-{:02d}".format(*dob_ad),
+        "issued": "{:04d}-{:02d}-{:02d}".format(*issued),
+        "birth": rnd.choice(places),
+        "permanent": rnd.choice(places),
+    }
+
+
+def ground_truth(person: dict) -> dict:
+    """Expected post_process output for each side."""
+    (b_ne, b_en), (p_ne, p_en) = person["birth"], person["permanent"]
+    return {
+        "front": {
+            "Name": person["name"][0],
+            "Citizenship Number": ne_digits(person["number"]),
+            "Date of Birth (DOB)": ne_digits(person["dob_bs"]),
+            "Father's Name": person["father"][0],
+            "Mother's Name": person["mother"][0],
+            "Gender": person["gender"][0],
+            "Spouse Name": None,
+            "Birth Place": {"District": b_ne[0], "Municipality/VDC": b_ne[1], "Ward": ne_digits(b_ne[2])},
+            "Permanent Address": {"District": p_ne[0], "Municipality/VDC": p_ne[1], "Ward": ne_digits(p_ne[2])},
+        },
+        "back": {
+            "Name": person["name"][1],
+            "Citizenship Number": person["number"],
+            "Date of Birth (DOB)": person["dob_ad"].replace("-", "/"),
+            "Gender": person["gender"][1],
+            "Birth Place District": b_en[0],
+            "Birth Place MetroPolitan/Sub-MetroPolitan/Municipality/VDC": b_en[1],
+            "Birth Place Ward": b_en[2],
+            "Permanent District": p_en[0],
+            "Permanent MetroPolitan/Sub-MetroPolitan/Municipality/VDC": p_en[1],
+            "Permanent Ward": p_en[2],
+            "Issued Date": person["issued"].replace("-", "/"),
+        },
+    }
+
+
+def card_lines(person: dict, side: str) -> List[str]:
+    (b_ne, b_en), (p_ne, p_en) = person["birth"], person["permanent"]
+    if side == "front":
+        y, m, d = ne_digits(person["dob_bs"]).split("-")
+        return [
+            f"ना.प्र.नं. {ne_digits(person['number'])}",
+            f"नाम थर: {person['name'][0]}",
+            f"लिङ्ग: {person['gender'][0]}",
+            "जन्म स्थान",
+            f"जिल्ला: {b_ne[0]}  न.पा.: {b_ne[1]}  वडा नं. {ne_digits(b_ne[2])}",
+            "स्थायी बासस्थान",
+            f"जिल्ला: {p_ne[0]}  न.पा.: {p_ne[1]}  वडा नं. {ne_digits(p_ne[2])}",
+            f"जन्म मिति: साल {y} महिना {m} गते {d}",
+            f"बाबुको नाम थर: {person['father'][0]}",
+            f"आमाको नाम थर: {person['mother'][0]}",
+        ]
+    y, m, d = person["dob_ad"].split("-")
+    return [
+        f"Citizenship Certificate No. {person['number']}",
+        f"Full Name: {person['name'][1]}",
+        f"Sex: {person['gender'][1]}",
+        f"Birth Place: District: {b_en[0]}",
+        f"Municipality: {b_en[1]} Ward No. {b_en[2]}",
+        f"Permanent Address: District: {p_en[0]}",
+        f"Municipality: {p_en[1]} Ward No. {p_en[2]}",
+        f"Date of Birth (AD): Year {y} Month {m} Day {d}",
+        f"Date of Issue: {person['issued'].replace('-', '/')}",
+    ]
+
+
+def find_font(candidates: List[str], override: Optional[str] = None) -> Optional[str]:
+    for path in ([override] if override else []) + candidates:
+        if path and Path(path).exists():
+            return path
+    return None
+
+
+def _font(path: Optional[str], size: int):
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+
+def render_card(person: dict, side: str, fonts: Dict[str, Optional[str]]) -> np.ndarray:
+    """The flat card, CARD_W x CARD_H, as BGR."""
+    card = Image.new("RGB", (CARD_W, CARD_H), (236, 232, 218))
+    draw = ImageDraw.Draw(card)
+    draw.rectangle((8, 8, CARD_W - 9, CARD_H - 9), outline=(150, 40, 40), width=4)
+
+    font_path = fonts["ne"] if side == "front" else fonts["en"]
+    title = "नेपाल सरकार" if side == "front" else "Government of Nepal"
+    draw.text((CARD_W // 2, 40), title, font=_font(font_path, 40), fill=(150, 40, 40), anchor="mt")
+
+    left = 40
+    if side == "front":
+        # Photo placeholder
+        draw.rectangle((40, 110, 240, 360), fill=(200, 200, 205), outline=(90, 90, 90), width=2)
+        draw.ellipse((95, 150, 185, 250), fill=(170, 170, 178))
+        draw.ellipse((70, 260, 210, 380), fill=(170, 170, 178))
+        left = 270
+
+    body = _font(font_path, 26)
+    y = 110
+    for line in card_lines(person, side):
+        draw.text((left, y), line, font=body, fill=(20, 20, 20))
+        y += 46
+    return cv2.cvtColor(np.asarray(card), cv2.COLOR_RGB2BGR)
+
+
+def place(rnd: random.Random, card: np.ndarray, width: int, skew_deg: float, blur_sigma: float):
+    """Scale the card, put it on a noisy background, rotate and blur; returns (image, card box)."""
+    scale = width / CARD_W
+    card = cv2.resize(card, (width, round(CARD_H * scale)), interpolation=cv2.INTER_AREA)
+    h, w = card.shape[:2]
+
+    margin_x, margin_y = int(w * rnd.uniform(0.05, 0.2)), int(h * rnd.uniform(0.05, 0.2))
+    bg_color = np.array([rnd.randint(30, 120), rnd.randint(30, 120), rnd.randint(30, 120)], dtype=np.int16)
+    canvas_h, canvas_w = h + 2 * margin_y, w + 2 * margin_x
+    noise = np.random.default_rng(rnd.getrandbits(32)).integers(-12, 13, (canvas_h, canvas_w, 3), dtype=np.int16)
+    canvas = np.clip(bg_color + noise, 0, 255).astype(np.uint8)
+    canvas[margin_y:margin_y + h, margin_x:margin_x + w] = card
+
+    center = (canvas_w / 2, canvas_h / 2)
+    matrix = cv2.getRotationMatrix2D(center, skew_deg, 1.0)
+    image = cv2.warpAffine(canvas, matrix, (canvas_w, canvas_h), flags=cv2.INTER_LINEAR,
+                           borderMode=cv2.BORDER_REPLICATE)
+    if blur_sigma > 0:
+        image = cv2.GaussianBlur(image, (0, 0), blur_sigma)
+
+    corners = np.array([[margin_x, margin_y, 1], [margin_x + w, margin_y, 1],
+                        [margin_x, margin_y + h, 1], [margin_x + w, margin_y + h, 1]], dtype=np.float64)
+    moved = corners @ matrix.T
+    box = [max(0, math.floor(moved[:, 0].min())), max(0, math.floor(moved[:, 1].min())),
+           min(canvas_w, math.ceil(moved[:, 0].max())), min(canvas_h, math.ceil(moved[:, 1].max()))]
+    return image, box
+
+
+def generate(count: int, seed: int = 0, min_width: int = 700, max_width: int = 2000,
+             max_skew: float = 8.0, max_blur: float = 1.5,
+             font_ne: Optional[str] = None, font_en: Optional[str] = None) -> Iterator[Tuple[str, dict, Dict[str, np.ndarray]]]:
+    """Yield (card id, truth, {"front": image, "back": image}), deterministic for a seed."""
+    rnd = random.Random(seed)
+    places = load_places()
+    fonts = {"ne": find_font(FONT_CANDIDATES_NE, font_ne), "en": find_font(FONT_CANDIDATES_EN, font_en)}
+    if fonts["ne"] is None:
+        print("No Devanagari font found (see --font-ne); front text will not be readable", file=sys.stderr)
+
+    for i in range(count):
+        person = make_person(rnd, places)
+        truth = {"id": f"card_{i:04d}", "expected": ground_truth(person), "render": {}}
+        images = {}
+        for side in ("front", "back"):
+            width = rnd.randint(min_width, max_width)
+            skew = rnd.uniform(-max_skew, max_skew)
+            blur = rnd.uniform(0, max_blur)
+            images[side], box = place(rnd, render_card(person, side, fonts), width, skew, blur)
+            truth["render"][side] = {
+                "card_width": width, "skew_deg": round(skew, 3), "blur_sigma": round(blur, 3),
+                "card_box": box, "font": fonts["ne" if side == "front" else "en"],
+            }
+        yield truth["id"], truth, images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-width", type=int, default=700, help="narrowest card, pixels")
+    parser.add_argument("--max-width", type=int, default=2000, help="widest card, pixels")
+    parser.add_argument("--max-skew", type=float, default=8.0, help="degrees either way")
+    parser.add_argument("--max-blur", type=float, default=1.5, help="largest Gaussian sigma")
+    parser.add_argument("--font-ne", help="TTF/OTF font with Devanagari coverage")
+    parser.add_argument("--font-en", help="TTF/OTF font for the English side")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    for card_id, truth, images in generate(args.count, args.seed, args.min_width, args.max_width,
+                                           args.max_skew, args.max_blur, args.font_ne, args.font_en):
+        for side, image in images.items():
+            cv2.imwrite(str(out / f"{card_id}_{side}.png"), image)
+        with open(out / f"{card_id}.json", "w", encoding="utf-8") as f:
+            json.dump(truth, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {args.count} cards to {out}")
+
+
+if __name__ == "__main__":
+    main()
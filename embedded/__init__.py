@@ -0,0 +1,4 @@
+# embedded/__init__.py
+from .pipeline import Pipeline, PipelineError, load_service
+
+__all__ = ["Pipeline", "PipelineError", "load_service"]
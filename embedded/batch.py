@@ -0,0 +1,283 @@
+# embedded/batch.py
+"""
+Offline batch run of the card pipeline over a directory or a manifest.
+
+    python -m embedded.batch /archive/2024-06 -o results.jsonl --workers 16
+    python -m embedded.batch --manifest cards.txt -o results.csv
+
+A process pool decodes, detects, preprocesses and OCRs each card (every
+worker loads its own detector and OCR models once, and by default gets an
+equal share of the cores as its CPU budget). The text goes through a
+bounded queue to a set of extraction threads, which wait on the LLM, and
+their results through a second queue to one writer. Bounded queues and a cap
+on cards submitted to the pool keep memory flat however large the archive.
+
+Rows are written as they finish (so not in input order), one per card:
+JSONL rows carry the full embedded.Pipeline output; CSV rows a fixed set of
+columns with the result as a JSON string. The output file is the checkpoint:
+rerunning the same command skips every image already in it, so a crashed or
+interrupted run resumes where it stopped. Rejected cards (no card found, low
+resolution, ...) are written as error rows and only retried with
+--retry-errors, which appends the new row; the last row for an image wins.
+
+A manifest is a text file with one image path per line, relative paths
+being resolved against the manifest's directory.
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import List, Optional, Set
+
+from .pipeline import Pipeline, PipelineError
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+CSV_FIELDS = ("image", "request_id", "status_code", "error", "card_side", "ocr_engine", "result", "timings_ms")
+
+_DONE = object()
+_pipeline: Optional[Pipeline] = None
+
+
+def _init_worker(threads: int = 0, pin_cpus: bool = False):
+    global _pipeline
+    # Read by the services' cpu_budget, which loads with the pipeline's stages
+    if threads:
+        os.environ["CPU_THREADS"] = str(threads)
+    if pin_cpus:
+        os.environ["CPU_AFFINITY"] = "auto"
+    _pipeline = Pipeline()
+
+
+def read_card(image: str) -> dict:
+    """Pool task: decode, preprocess and OCR one image."""
+    if _pipeline is None:
+        _init_worker()
+
+    request_id = uuid.uuid4().hex
+    timings = {}
+    try:
+        text, side, engine = _pipeline.read(image, timings)
+    except PipelineError as e:
+        return {"image": image, "request_id": request_id, "status_code": e.status_code, "error": e.detail}
+    except Exception as e:
+        return {"image": image, "request_id": request_id, "status_code": 500, "error": f"{type(e).__name__}: {e}"}
+    return {"image": image, "request_id": request_id, "text": text, "card_side": side,
+            "ocr_engine": engine, "timings": timings}
+
+
+def find_images(root: Path) -> List[str]:
+    return sorted(str(p.resolve()) for p in root.rglob("*")
+                  if p.suffix.lower() in IMAGE_EXTENSIONS and p.is_file())
+
+
+def read_manifest(path: Path) -> List[str]:
+    images = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                images.append(str((path.parent / line).resolve()))
+    return images
+
+
+def _truncate_partial_row(path: Path):
+    """Drop a last row cut off by a crash so the file ends on a newline."""
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+
+def completed_images(path: Path, fmt: str, retry_errors: bool) -> Set[str]:
+    """Images already in an earlier run's output file."""
+    if not path.exists():
+        return set()
+    _truncate_partial_row(path)
+
+    done = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if fmt == "csv" else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if retry_errors and row.get("error"):
+                continue
+            done.add(row["image"])
+    return done
+
+
+class Writer:
+    def __init__(self, path: Path, fmt: str):
+        self.fmt = fmt
+        is_new = not path.exists() or path.stat().st_size == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if is_new:
+                self._csv.writeheader()
+
+    def write(self, row: dict):
+        if self._csv is None:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else:
+            metadata = row.get("result", {}).get("metadata", {})
+            self._csv.writerow({
+                "image": row["image"],
+                "request_id": row["request_id"],
+                "status_code": row.get("status_code", 200),
+                "error": json.dumps(row["error"], ensure_ascii=False) if isinstance(row.get("error"), dict)
+                else row.get("error", ""),
+                "card_side": metadata.get("card_side", ""),
+                "ocr_engine": metadata.get("ocr_engine", ""),
+                "result": json.dumps(row["result"], ensure_ascii=False) if "result" in row else "",
+                "timings_ms": json.dumps(row.get("timings_ms", {})),
+            })
+        # One flush per card: a crash loses at most the rows still in flight
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    def __init__(self, total: int, skipped: int, interval: float, out=sys.stderr):
+        self.total = total
+        self.skipped = skipped
+        self.interval = interval
+        self.out = out
+        self.done = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, row: dict, force: bool = False):
+        if row is not None:
+            self.done += 1
+            self.errors += "error" in row
+        now = time.perf_counter()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.done
+        eta = f"{remaining / rate / 60:.1f} min" if rate else "?"
+        print(f"[batch] {self.done}/{self.total} cards ({self.skipped} already done), "
+              f"{self.errors} errors, {rate:.2f} cards/s, ETA {eta}", file=self.out, flush=True)
+
+
+def _extract_worker(pipeline: Pipeline, inbox: queue.Queue, outbox: queue.Queue):
+    while True:
+        card = inbox.get()
+        if card is _DONE:
+            return
+        if "error" in card:
+            outbox.put(card)
+            continue
+        try:
+            row = pipeline.finish(card["request_id"], card["text"], card["card_side"],
+                                  card["ocr_engine"], card["timings"])
+        except Exception as e:
+            row = {"request_id": card["request_id"], "status_code": 500,
+                   "error": f"Extraction failed: {type(e).__name__}: {e}"}
+        outbox.put({"image": card["image"], **row})
+
+
+def _write_results(writer: Writer, progress: Progress, results: queue.Queue):
+    while True:
+        row = results.get()
+        if row is _DONE:
+            return
+        writer.write(row)
+        progress.update(row)
+
+
+def run_batch(images: List[str], output: Path, fmt: str, workers: int, extract_threads: int,
+              max_inflight: int, retry_errors: bool = False, progress_interval: float = 10.0,
+              threads_per_worker: int = 0, pin_cpus: bool = False) -> Progress:
+    done = completed_images(output, fmt, retry_errors)
+    todo = [image for image in images if image not in done]
+    progress = Progress(len(todo), len(images) - len(todo), progress_interval)
+
+    pipeline = Pipeline()
+    pipeline.llm_modules  # load the gazetteer before the threads need it
+    to_extract: queue.Queue = queue.Queue(maxsize=2 * extract_threads)
+    results: queue.Queue = queue.Queue(maxsize=2 * extract_threads)
+    writer = Writer(output, fmt)
+
+    extractors = [threading.Thread(target=_extract_worker, args=(pipeline, to_extract, results),
+                                   name=f"extract-{i}", daemon=True)
+                  for i in range(extract_threads)]
+    writer_thread = threading.Thread(target=_write_results, args=(writer, progress, results),
+                                     name="writer", daemon=True)
+    for t in extractors + [writer_thread]:
+        t.start()
+
+    try:
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(threads, pin_cpus)) as pool:
+            pending = set()
+            for image in todo:
+                if len(pending) >= max_inflight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        # Blocks while extraction is behind, which stops new submissions
+                        to_extract.put(future.result())
+                pending.add(pool.submit(read_card, image))
+            for future in wait(pending).done:
+                to_extract.put(future.result())
+    finally:
+        for _ in extractors:
+            to_extract.put(_DONE)
+        for t in extractors:
+            t.join()
+        results.put(_DONE)
+        writer_thread.join()
+        writer.close()
+
+    progress.update(None, force=True)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", help="directory searched recursively for card images")
+    source.add_argument("--manifest", help="text file with one image path per line")
+    parser.add_argument("-o", "--output", required=True, help="results file; .csv writes CSV, anything else JSONL")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="override the format implied by --output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for decode/detect/preprocess/OCR (default: CPU count)")
+    parser.add_argument("--threads-per-worker", type=int, default=0,
+                        help="CPU_THREADS of each worker (default: CPU count / workers)")
+    parser.add_argument("--pin-cpus", action="store_true", help="pin each worker to its own cores (CPU_AFFINITY=auto)")
+    parser.add_argument("--extract-threads", type=int, default=4,
+                        help="concurrent LLM extractions (default: 4)")
+    parser.add_argument("--max-inflight", type=int, help="cards submitted to the pool at once (default: 2x workers)")
+    parser.add_argument("--retry-errors", action="store_true", help="reprocess cards that failed in an earlier run")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    fmt = args.format or ("csv" if output.suffix.lower() == ".csv" else "jsonl")
+    images = read_manifest(Path(args.manifest)) if args.manifest else find_images(Path(args.directory))
+    if not images:
+        parser.error("no images found")
+
+    progress = run_batch(images, output, fmt, args.workers, args.extract_threads,
+                         args.max_inflight or 2 * args.workers, args.retry_errors, args.progress_interval,
+                         args.threads_per_worker, args.pin_cpus)
+    elapsed = time.perf_counter() - progress.started
+    print(f"Processed {progress.done} cards ({progress.errors} errors) in {elapsed:.1f}s → {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
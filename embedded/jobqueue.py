@@ -0,0 +1,245 @@
+# embedded/jobqueue.py
+"""
+A durable work queue in one SQLite file, for the queued pipeline topology.
+
+A job is one card; it moves through the stages preprocess -> ocr ->
+extract as one task at a time. A worker claims the oldest ready task of
+its stage under a lease, and then either
+
+  acks it     the next stage's task is created in the same transaction,
+              or, after the last stage, the job is done with its result;
+  rejects it  the card itself is unusable (a PipelineError, e.g. no card
+              found): the job fails with that status, nothing is retried;
+  fails it    anything else (a crash, the LLM unreachable, ...): the task
+              is retried after RETRY_BACKOFF_S, doubling per attempt, and
+              after MAX_ATTEMPTS it is dead-lettered and the job fails.
+
+A task whose lease runs out (its worker died) is handed out again and
+counts as an attempt, so a card that keeps killing workers ends up dead
+too. Dead tasks stay in the table until requeue_dead() puts them back.
+A worker that finishes after losing its lease is ignored: its task now
+belongs to whoever claimed it again.
+
+WAL mode lets any number of worker processes on one host share the file;
+for workers on several nodes the file must be on storage with working
+locks (not NFS), or the queue swapped for a networked one.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", str(REPO_ROOT / "shared_data" / "jobs.sqlite3"))
+LEASE_S = float(os.getenv("JOB_LEASE_S", "600"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_S = float(os.getenv("JOB_RETRY_BACKOFF_S", "5"))
+
+STAGES = ("preprocess", "ocr", "extract")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,          -- queued, running, done, failed
+    stage TEXT,
+    status_code INTEGER,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,           -- ready, leased, dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_by_stage ON tasks (stage, state, available_at);
+"""
+
+
+class Task:
+    def __init__(self, row: sqlite3.Row):
+        self.id = row["id"]
+        self.job_id = row["job_id"]
+        self.stage = row["stage"]
+        self.payload = json.loads(row["payload"])
+        self.attempts = row["attempts"]
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class JobQueue:
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_s: float = LEASE_S, max_attempts: int = MAX_ATTEMPTS,
+                 retry_backoff_s: float = RETRY_BACKOFF_S):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.retry_backoff_s = retry_backoff_s
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db.executescript(_SCHEMA)
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections are not shared across threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self):
+        db = self._db
+        # IMMEDIATE takes the write lock up front, so two workers never claim the same task
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    # --- producers ---
+
+    def submit(self, job_id: str, payload: dict, stage: str = STAGES[0]):
+        now = time.time()
+        with self._tx() as db:
+            db.execute("INSERT INTO jobs (id, status, stage, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                       (job_id, stage, now, now))
+            db.execute("INSERT INTO tasks (job_id, stage, payload, state, available_at) VALUES (?, ?, ?, 'ready', ?)",
+                       (job_id, stage, _dumps(payload), now))
+
+    # --- consumers ---
+
+    def claim(self, stage: str) -> Optional[Task]:
+        """The oldest ready task of the stage, leased to the caller, or None."""
+        now = time.time()
+        with self._tx() as db:
+            while True:
+                row = db.execute(
+                    "SELECT * FROM tasks WHERE stage = ? AND ((state = 'ready' AND available_at <= ?)"
+                    " OR (state = 'leased' AND lease_until < ?)) ORDER BY available_at, id LIMIT 1",
+                    (stage, now, now)).fetchone()
+                if row is None:
+                    return None
+                if row["state"] == "leased" and row["attempts"] >= self.max_attempts:
+                    # Its worker died on every attempt
+                    self._dead(db, row["id"], row["job_id"], "lease expired on every attempt", now)
+                    continue
+                db.execute("UPDATE tasks SET state = 'leased', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                           (now + self.lease_s, row["id"]))
+                db.execute("UPDATE jobs SET status = 'running', stage = ?, updated = ? WHERE id = ?",
+                           (stage, now, row["job_id"]))
+                task = Task(row)
+                task.attempts += 1
+                return task
+
+    @staticmethod
+    def _release(db: sqlite3.Connection, task: Task) -> bool:
+        """Delete the task if the caller still holds its lease."""
+        cur = db.execute("DELETE FROM tasks WHERE id = ? AND state = 'leased' AND attempts = ?",
+                         (task.id, task.attempts))
+        return cur.rowcount == 1
+
+    def ack(self, task: Task, next_stage: Optional[str] = None, payload: Optional[dict] = None,
+            result: Optional[dict] = None) -> bool:
+        """Task done: hand payload to next_stage, or finish the job with result. False if the lease was lost."""
+        now = time.time()
+        with self._tx() as db:
+            if not self._release(db, task):
+                return False
+            if next_stage:
+                db.execute("INSERT INTO tasks (job_id, stage, payload, state, available_at)"
+                           " VALUES (?, ?, ?, 'ready', ?)", (task.job_id, next_stage, _dumps(payload), now))
+                db.execute("UPDATE jobs SET status = 'queued', stage = ?, updated = ? WHERE id = ?",
+                           (next_stage, now, task.job_id))
+            else:
+                db.execute("UPDATE jobs SET status = 'done', status_code = 200, result = ?, error = NULL, updated = ?"
+                           " WHERE id = ?",
+                           (_dumps(result), now, task.job_id))
+        return True
+
+    def reject(self, task: Task, status_code: int, detail: Union[str, dict]):
+        """The card is unusable: fail the job with the status /preprocess would return."""
+        now = time.time()
+        with self._tx() as db:
+            if not self._release(db, task):
+                return
+            db.execute("UPDATE jobs SET status = 'failed', status_code = ?, error = ?, updated = ? WHERE id = ?",
+                       (status_code, _dumps(detail), now, task.job_id))
+
+    def fail(self, task: Task, error: str) -> bool:
+        """Retry the task later, or dead-letter it after max_attempts; True if it will be retried."""
+        now = time.time()
+        with self._tx() as db:
+            owned = db.execute("SELECT 1 FROM tasks WHERE id = ? AND state = 'leased' AND attempts = ?",
+                               (task.id, task.attempts)).fetchone()
+            if owned is None:
+                return False
+            if task.attempts >= self.max_attempts:
+                self._dead(db, task.id, task.job_id, error, now)
+                return False
+            delay = self.retry_backoff_s * 2 ** (task.attempts - 1)
+            db.execute("UPDATE tasks SET state = 'ready', available_at = ?, lease_until = NULL, error = ? WHERE id = ?",
+                       (now + delay, error, task.id))
+            db.execute("UPDATE jobs SET status = 'queued', error = ?, updated = ? WHERE id = ?",
+                       (_dumps(error), now, task.job_id))
+            return True
+
+    def _dead(self, db: sqlite3.Connection, task_id: int, job_id: str, error: str, now: float):
+        db.execute("UPDATE tasks SET state = 'dead', lease_until = NULL, error = ? WHERE id = ?", (error, task_id))
+        db.execute("UPDATE jobs SET status = 'failed', status_code = 500, error = ?, updated = ? WHERE id = ?",
+                   (_dumps(error), now, job_id))
+
+    # --- operators ---
+
+    def requeue_dead(self, stage: Optional[str] = None) -> int:
+        """Give dead-lettered tasks (of one stage, or all) a fresh set of attempts; returns how many."""
+        now = time.time()
+        where, args = ("state = 'dead'", ()) if stage is None else ("state = 'dead' AND stage = ?", (stage,))
+        with self._tx() as db:
+            jobs = [r["job_id"] for r in db.execute(f"SELECT job_id FROM tasks WHERE {where}", args)]
+            db.execute(f"UPDATE tasks SET state = 'ready', attempts = 0, available_at = ? WHERE {where}",
+                       (now, *args))
+            db.executemany("UPDATE jobs SET status = 'queued', status_code = NULL, error = NULL, updated = ?"
+                           " WHERE id = ?", [(now, job_id) for job_id in jobs])
+        return len(jobs)
+
+    def job(self, job_id: str) -> Optional[dict]:
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {"job_id": row["id"], "status": row["status"], "stage": row["stage"],
+               "created": row["created"], "updated": row["updated"]}
+        if row["status_code"] is not None:
+            job["status_code"] = row["status_code"]
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = json.loads(row["error"])
+        return job
+
+    def stats(self) -> dict:
+        """Tasks per stage and state (ready, leased, dead) and jobs per status."""
+        tasks = {stage: {"ready": 0, "leased": 0, "dead": 0} for stage in STAGES}
+        for row in self._db.execute("SELECT stage, state, COUNT(*) AS n FROM tasks GROUP BY stage, state"):
+            tasks.setdefault(row["stage"], {})[row["state"]] = row["n"]
+        jobs = {row["status"]: row["n"] for row in self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        return {"tasks": tasks, "jobs": jobs}
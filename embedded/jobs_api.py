@@ -0,0 +1,73 @@
+# embedded/jobs_api.py
+"""
+HTTP front for the queued topology (see workers.py): takes uploads, hands
+out job results.
+
+    uvicorn embedded.jobs_api:app --port 8010
+
+    POST /jobs                  multipart "file"; 202 {"job_id", "status", "status_url"}
+    GET  /jobs/{job_id}         {"job_id", "status", "stage", ...}; status is queued,
+                                running, done (with "result") or failed (with
+                                "status_code" and "error")
+    GET  /queue                 tasks per stage and state, jobs per status
+    POST /queue/requeue-dead    retry dead-lettered tasks (?stage= for one stage)
+
+The upload is streamed into object storage and only its key is queued, so
+this process does no image work and answers in milliseconds however busy
+the workers are.
+"""
+import os
+import re
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from .jobqueue import STAGES, JobQueue
+from .pipeline import load_service
+
+app = FastAPI()
+jobs = JobQueue()
+storage = load_service("preprocess_service", ("storage",))["storage"]
+
+_EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,5}$")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    try:
+        key = await run_in_threadpool(storage.storage.put_stream, file.file,
+                                      ext if _EXTENSION_RE.match(ext) else ".img")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store upload: {type(e).__name__}: {e}")
+    job_id = uuid.uuid4().hex
+    await run_in_threadpool(jobs.submit, job_id, {"image_key": key})
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(jobs.job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return JSONResponse(job)
+
+
+@app.get("/queue")
+async def queue_stats():
+    return await run_in_threadpool(jobs.stats)
+
+
+@app.post("/queue/requeue-dead")
+async def requeue_dead(stage: Optional[str] = None):
+    if stage is not None and stage not in STAGES:
+        raise HTTPException(status_code=422, detail=f"stage must be one of {list(STAGES)}")
+    return {"requeued": await run_in_threadpool(jobs.requeue_dead, stage)}
+
+
+@app.get("/health")
+def health():
+    return {"status": "running", "service": "jobs_api"}
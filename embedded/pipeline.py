@@ -0,0 +1,292 @@
+# embedded/pipeline.py
+"""
+The preprocess -> OCR -> LLM chain as one in-process Python object.
+
+    from embedded import Pipeline
+
+    pipeline = Pipeline()
+    out = pipeline.run("card.jpg")          # path, encoded bytes or BGR ndarray
+    out["result"]["final_clean"], out["timings_ms"]
+
+The three services are imported straight from their directories, so the
+stages are the same functions the HTTP services call: detect_card,
+preprocess_pipeline, face_detector, run_ocr_for_image (the engine logic of
+run_ocr_for_path), llm_extract and NepalAddressValidator.post_process.
+Every model is loaded on first use of its stage, through the service's
+model registry and its MODEL_* settings (budget, idle TTL, pins).
+
+The output mirrors the /preprocess response: "result" is what /extract
+returns, with the metadata /ocr adds. Only the HTTP artifacts differ: no
+upload, processed image, OCR text or LLM debug files are written, so their
+paths are absent, as are the ocr_call/llm_call hop timings.
+"""
+import importlib
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Tuple, Union
+
+import cv2
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+ImageInput = Union[np.ndarray, bytes, bytearray, str, Path]
+
+# load_service rewrites sys.path and sys.modules; one service at a time
+_load_lock = threading.RLock()
+
+
+class PipelineError(Exception):
+    """A card the HTTP pipeline would reject; status_code is the status /preprocess returns."""
+
+    def __init__(self, status_code: int, detail: Union[str, dict]):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def load_service(service: str, modules: Iterable[str]) -> Dict[str, object]:
+    """
+    Import modules from one service directory.
+
+    The services use flat imports ("from config import ...") and share module
+    names, so each service is imported with its directory first on sys.path
+    and its modules are then re-keyed as "<service>__<module>" in sys.modules.
+    The next service's "config" therefore resolves to its own file, while the
+    modules loaded here keep the references they bound at import time.
+    """
+    service_dir = (REPO_ROOT / service).resolve()
+    local_names = {p.stem for p in service_dir.glob("*.py")}
+    with _load_lock:
+        shadowed = {name: sys.modules.pop(name) for name in local_names if name in sys.modules}
+        sys.path.insert(0, str(service_dir))
+        try:
+            loaded = {name: importlib.import_module(name) for name in modules}
+        finally:
+            sys.path.remove(str(service_dir))
+            for name in local_names:
+                if name in sys.modules:
+                    sys.modules[f"{service}__{name}"] = sys.modules.pop(name)
+            sys.modules.update(shadowed)
+    return loaded
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _configure_models(modules: Dict[str, object]):
+    """Apply the service's MODEL_* settings to its model registry, as its app does at startup."""
+    config = modules["config"]
+    modules["model_registry"].models.configure(config.MODEL_MEMORY_BUDGET_MB, config.MODEL_IDLE_TTL_S,
+                                               config.MODEL_PIN)
+
+
+class Pipeline:
+    def __init__(self):
+        self._preprocess = None
+        self._ocr = None
+        self._llm = None
+        self._validator = None
+
+    # --- service modules, loaded on first use ---
+
+    @property
+    def preprocess_modules(self):
+        with _load_lock:
+            if self._preprocess is None:
+                self._preprocess = load_service(
+                    "preprocess_service",
+                    ("config", "quality", "contour_detector", "model_inference", "preprocessing", "face_detector",
+                     "model_registry"))
+                _configure_models(self._preprocess)
+        return self._preprocess
+
+    @property
+    def ocr_modules(self):
+        with _load_lock:
+            if self._ocr is None:
+                self._ocr = load_service("ocr_service", ("run_ocr", "config", "model_registry"))
+                _configure_models(self._ocr)
+        return self._ocr
+
+    @property
+    def llm_modules(self):
+        with _load_lock:
+            if self._llm is None:
+                llm = load_service("llm_service", ("config", "extraction", "post_processing"))
+                self._validator = llm["post_processing"].NepalAddressValidator()
+                self._llm = llm
+        return self._llm
+
+    @property
+    def validator(self):
+        """The NepalAddressValidator extract() post-processes with."""
+        self.llm_modules
+        return self._validator
+
+    def warm_up(self):
+        """Load every stage's modules and models now rather than on the first card."""
+        if self.preprocess_modules["config"].DETECTOR == "tensorflow":
+            self.preprocess_modules["model_inference"].load_model()
+        run_ocr = self.ocr_modules["run_ocr"]
+        if run_ocr.OCR_ENGINE not in ("stub", "tesseract"):
+            for side in ("front", "back"):
+                run_ocr.get_paddleocr(side)
+        self.llm_modules
+
+    # --- stages ---
+
+    def decode(self, image: ImageInput) -> np.ndarray:
+        if isinstance(image, np.ndarray):
+            img = image
+        elif isinstance(image, (bytes, bytearray)):
+            img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            img = cv2.imread(str(image))
+
+        if img is None:
+            raise PipelineError(400, "Could not read uploaded image")
+        if img.shape[1] < self.preprocess_modules["config"].MIN_RESOLUTION:
+            raise PipelineError(422, "Low Image quality. Try with higher resolution image.")
+        return img
+
+    def check_quality(self, img: np.ndarray, timings: Dict[str, float]) -> dict:
+        """The /preprocess quality gate: 422 with the failed checks, else the quality measures."""
+        mods = self.preprocess_modules
+        if not mods["config"].QUALITY_GATE:
+            return {}
+
+        t = time.perf_counter()
+        metrics = mods["quality"].assess_quality(img)
+        timings["quality"] = _elapsed_ms(t)
+        issues = mods["quality"].quality_issues(metrics)
+        if issues:
+            raise PipelineError(422, {
+                "message": " ".join(issue["message"] for issue in issues),
+                "reasons": issues,
+                "quality": metrics,
+            })
+        return metrics
+
+    def preprocess(self, img: np.ndarray, timings: Dict[str, float], return_detail: bool = False) -> tuple:
+        """
+        Detect, crop, deskew and side-detect; returns (processed image, card side),
+        or (processed image, card side, detail image or None) with return_detail.
+        """
+        mods = self.preprocess_modules
+
+        t = time.perf_counter()
+        try:
+            cropped = mods["model_inference"].detect_card(img)
+        except Exception as e:
+            raise PipelineError(500, f"Detection error: {e}")
+        if cropped is None:
+            raise PipelineError(404, "No ID card detected")
+        timings["detect"] = _elapsed_ms(t)
+
+        t = time.perf_counter()
+        try:
+            processed, detail = mods["preprocessing"].preprocess_pipeline(cropped, return_detail=True)
+            processed = np.ascontiguousarray(processed, dtype=np.uint8)
+        except Exception as e:
+            raise PipelineError(500, f"Preprocessing error: {e}")
+        timings["preprocess"] = _elapsed_ms(t)
+
+        t = time.perf_counter()
+        side = mods["face_detector"].face_detector(processed)
+        timings["side_detect"] = _elapsed_ms(t)
+        if return_detail:
+            return processed, side, detail
+        return processed, side
+
+    def ocr(self, processed: np.ndarray, card_side: str, detail=None) -> Tuple[str, str]:
+        """Returns (text, engine used); detail is what low-confidence lines are re-read from."""
+        try:
+            return self.ocr_modules["run_ocr"].run_ocr_for_image(processed, card_side, detail)
+        except Exception as e:
+            raise PipelineError(500, f"OCR failed: {e}")
+
+    def extract(self, text: str, card_side: str, request_id: str) -> dict:
+        """LLM extraction plus address post-processing, shaped like the /extract response."""
+        mods = self.llm_modules
+
+        t = time.perf_counter()
+        raw_json, extraction_stats = mods["extraction"].llm_extract(text, card_side)
+        llm_ms = _elapsed_ms(t)
+
+        t = time.perf_counter()
+        try:
+            result = self._validator.post_process(raw_json, card_side)
+        except Exception as e:
+            result = {"error": "post-process failed", "details": str(e), "raw": raw_json}
+        post_process_ms = _elapsed_ms(t)
+
+        result["metadata"] = {
+            "request_id": request_id,
+            "detected_card_side": card_side,
+            "extraction_method": f"Instructor+Ollama({mods['config'].OLLAMA_MODEL})",
+            "extraction_stats": extraction_stats,
+            "timings_ms": {
+                "llm": round(llm_ms, 2),
+                "post_process": round(post_process_ms, 2),
+            },
+        }
+        return result
+
+    def read(self, image: ImageInput, timings: Dict[str, float]) -> Tuple[str, str, str]:
+        """Decode, preprocess and OCR one card; returns (text, card side, OCR engine)."""
+        t = time.perf_counter()
+        img = self.decode(image)
+        timings["decode"] = _elapsed_ms(t)
+        self.check_quality(img, timings)
+
+        processed, side, detail = self.preprocess(img, timings, return_detail=True)
+
+        t = time.perf_counter()
+        text, engine = self.ocr(processed, side, detail)
+        timings["ocr"] = _elapsed_ms(t)
+        return text, side, engine
+
+    def finish(self, request_id: str, text: str, card_side: str, engine: str, timings: Dict[str, float]) -> dict:
+        """Extract from read()'s output and assemble the final response."""
+        result = self.extract(text, card_side, request_id)
+        metadata = result["metadata"]
+        metadata["request_id"] = request_id
+        metadata["ocr_engine"] = engine
+        metadata["card_side"] = card_side
+        metadata["timings_ms"]["ocr"] = round(timings.pop("ocr"), 2)
+
+        return {
+            "request_id": request_id,
+            "result": result,
+            "timings_ms": {stage: round(ms, 2) for stage, ms in timings.items()},
+        }
+
+    def run(self, image: ImageInput, request_id: str = None) -> dict:
+        """Full chain for one card; raises PipelineError where /preprocess returns an error status."""
+        request_id = request_id or uuid.uuid4().hex
+        timings = {}
+        text, side, engine = self.read(image, timings)
+        return self.finish(request_id, text, side, engine, timings)
+
+
+# CLI for quick testing
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Run the full card pipeline in-process.")
+    parser.add_argument("images", nargs="+", help="card image paths")
+    args = parser.parse_args()
+
+    pipeline = Pipeline()
+    for path in args.images:
+        try:
+            out = pipeline.run(path)
+        except PipelineError as e:
+            out = {"error": e.detail, "status_code": e.status_code}
+        print(json.dumps({"image": path, **out}, ensure_ascii=False, indent=2))
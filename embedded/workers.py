@@ -0,0 +1,214 @@
+# embedded/workers.py
+"""
+Queued topology: each pipeline stage as a consumer of embedded.jobqueue.
+
+    python -m embedded.workers --stage preprocess
+    python -m embedded.workers --stage ocr
+    python -m embedded.workers --stage extract --consumers 8
+    uvicorn embedded.jobs_api:app --port 8010
+
+In the HTTP services /preprocess waits on /ocr, which waits on the LLM, so
+a slow extraction holds a slot in every stage. Here the stages hand work on
+through the queue instead: a slow LLM call holds one extract consumer and
+nothing else, and each stage is scaled on its own. Consumers are threads,
+which suits extract (it waits on Ollama); the CPU-bound preprocess and ocr
+stages scale by starting more processes. --stage all runs every stage in
+one process, for a single box.
+Each process takes its CPU_THREADS / CPU_AFFINITY budget from the
+environment, as the services do (cpu_budget.py).
+
+Images go from stage to stage by key through the services' object storage
+(preprocess_service/storage.py), as /preprocess hands them to /ocr; with
+STORAGE_BACKEND=s3 the stages can run on different nodes. A job's result
+is what /preprocess returns: request_id, result, quality, processed_key
+and timings_ms (without the ocr_call hop).
+
+Cards the pipeline rejects (PipelineError below 500: unreadable, low
+quality, no card) fail their job at once; other errors are retried and
+eventually dead-lettered, see jobqueue.py. SIGINT/SIGTERM let every
+consumer finish its current task before exiting.
+"""
+import argparse
+import signal
+import sys
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+
+from .jobqueue import JOB_QUEUE_PATH, STAGES, JobQueue, Task
+from .pipeline import Pipeline, PipelineError, load_service
+
+StageResult = Tuple[Optional[str], dict]
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+class StageHandlers:
+    """One method per stage: task in, (next stage and its payload) or (None, the job result) out."""
+
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.storage = load_service("preprocess_service", ("storage",))["storage"]
+
+    def _local_path(self, key: str) -> str:
+        try:
+            return self.storage.storage.local_path(key)
+        except (ValueError, self.storage.ObjectNotFound):
+            raise PipelineError(404, f"Image does not exist: {key}")
+
+    def preprocess(self, task: Task) -> StageResult:
+        payload, timings = task.payload, {}
+        t = time.perf_counter()
+        img = self.pipeline.decode(self._local_path(payload["image_key"]))
+        timings["decode"] = _elapsed_ms(t)
+        quality = self.pipeline.check_quality(img, timings)
+        processed, side, detail = self.pipeline.preprocess(img, timings, return_detail=True)
+
+        t = time.perf_counter()
+        ok, buf = cv2.imencode(".png", processed)
+        if not ok:
+            raise RuntimeError("Failed to encode processed image")
+        key = self.storage.put_bytes(buf, ".png")
+        timings["store"] = _elapsed_ms(t)
+
+        detail_key = None
+        if detail is not None:
+            t = time.perf_counter()
+            buf, suffix = self.pipeline.preprocess_modules["preprocessing"].encode_detail(detail)
+            detail_key = self.storage.put_bytes(buf, suffix)
+            timings["store_detail"] = _elapsed_ms(t)
+        return "ocr", {"image_key": key, "detail_key": detail_key, "card_side": side, "quality": quality,
+                       "timings_ms": timings}
+
+    def _detail_path(self, key: str):
+        """The detail image's path, or None: OCR goes on without it."""
+        try:
+            return self._local_path(key)
+        except PipelineError as e:
+            print(f"Warning: {e.detail}")
+            return None
+
+    def ocr(self, task: Task) -> StageResult:
+        payload = task.payload
+        processed = cv2.imread(self._local_path(payload["image_key"]))
+        if processed is None:
+            raise RuntimeError(f"Cannot load image: {payload['image_key']}")
+        t = time.perf_counter()
+        # Fetched only if a low-confidence line is re-read from it
+        detail_key = payload.get("detail_key")
+        detail = partial(self._detail_path, detail_key) if detail_key else None
+        text, engine = self.pipeline.ocr(processed, payload["card_side"], detail)
+        timings = {**payload["timings_ms"], "ocr": _elapsed_ms(t)}
+        return "extract", {**payload, "text": text, "ocr_engine": engine, "timings_ms": timings}
+
+    def extract(self, task: Task) -> StageResult:
+        payload = task.payload
+        out = self.pipeline.finish(task.job_id, payload["text"], payload["card_side"], payload["ocr_engine"],
+                                   dict(payload["timings_ms"]))
+        out["processed_key"] = payload["image_key"]
+        out["quality"] = payload["quality"]
+        return None, out
+
+    def warm_up(self, stage: str):
+        """Load the models a stage needs before it takes its first task."""
+        if stage == "preprocess":
+            if self.pipeline.preprocess_modules["config"].DETECTOR == "tensorflow":
+                self.pipeline.preprocess_modules["model_inference"].load_model()
+        elif stage == "ocr":
+            run_ocr = self.pipeline.ocr_modules["run_ocr"]
+            if run_ocr.OCR_ENGINE not in ("stub", "tesseract"):
+                for side in ("front", "back"):
+                    run_ocr.get_paddleocr(side)
+        else:
+            self.pipeline.llm_modules
+
+
+def consume(jobs: JobQueue, stage: str, handler: Callable[[Task], StageResult], stop: threading.Event,
+            poll_interval: float):
+    """Claim, run and ack tasks of one stage until stop is set."""
+    while not stop.is_set():
+        task = jobs.claim(stage)
+        if task is None:
+            stop.wait(poll_interval)
+            continue
+
+        t = time.perf_counter()
+        try:
+            next_stage, payload = handler(task)
+        except PipelineError as e:
+            if e.status_code < 500:
+                jobs.reject(task, e.status_code, e.detail)
+                print(f"[{stage}] job {task.job_id} rejected ({e.status_code})", file=sys.stderr, flush=True)
+                continue
+            error = f"{e.status_code}: {e.detail}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        else:
+            if next_stage:
+                acked = jobs.ack(task, next_stage, payload=payload)
+            else:
+                acked = jobs.ack(task, result=payload)
+            if not acked:
+                print(f"[{stage}] job {task.job_id}: lease lost, result dropped", file=sys.stderr, flush=True)
+            else:
+                print(f"[{stage}] job {task.job_id} done in {time.perf_counter() - t:.2f}s",
+                      file=sys.stderr, flush=True)
+            continue
+
+        retried = jobs.fail(task, error)
+        print(f"[{stage}] job {task.job_id} attempt {task.attempts} failed: {error}"
+              f"{'' if retried else ' (dead-lettered)'}", file=sys.stderr, flush=True)
+
+
+def run_workers(stages: List[str], consumers: Dict[str, int], stop: threading.Event,
+                queue_path: str = JOB_QUEUE_PATH, poll_interval: float = 0.5) -> List[threading.Thread]:
+    """Start the consumer threads, which run until stop is set; returns them for joining."""
+    jobs = JobQueue(queue_path)
+    handlers = StageHandlers(Pipeline())
+    threads = []
+    for stage in stages:
+        handlers.warm_up(stage)
+        handler = getattr(handlers, stage)
+        for i in range(consumers.get(stage, 1)):
+            threads.append(threading.Thread(target=consume, args=(jobs, stage, handler, stop, poll_interval),
+                                            name=f"{stage}-{i}"))
+    for t in threads:
+        t.start()
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stage", nargs="+", choices=STAGES + ("all",), required=True)
+    parser.add_argument("--consumers", type=int, default=1, help="consumer threads per stage (default: 1)")
+    parser.add_argument("--queue", default=JOB_QUEUE_PATH, help="queue database (default: JOB_QUEUE_PATH)")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between polls of an empty queue")
+    parser.add_argument("--requeue-dead", action="store_true",
+                        help="give this stage's dead-lettered tasks fresh attempts, then exit")
+    args = parser.parse_args()
+    stages = list(STAGES) if "all" in args.stage else args.stage
+
+    if args.requeue_dead:
+        jobs = JobQueue(args.queue)
+        count = sum(jobs.requeue_dead(stage) for stage in stages)
+        print(f"Requeued {count} dead-lettered tasks", file=sys.stderr)
+        return
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    threads = run_workers(stages, {stage: args.consumers for stage in stages}, stop, args.queue, args.poll_interval)
+    print(f"[workers] consuming {', '.join(stages)} from {args.queue}", file=sys.stderr, flush=True)
+    while not stop.is_set():
+        stop.wait(1.0)
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# llm_service/address_bulk.py
+"""
+Bulk address resolution for backfilling already-extracted records.
+
+Input is NDJSON, one row per line, either an object
+
+    {"id": 17, "district": "ललितपुर", "municipality": "गोदावरी", "ward": "3", "script": "ne"}
+
+or an array [district, municipality, ward, script]. "script" defaults to
+"ne"; "id" is optional and echoed back. Output is NDJSON in input order
+(blank lines skipped), one result per row:
+
+    {"id": 17, "script": "ne", "district": ..., "municipality": ..., "ward": ...,
+     "ward_valid": ..., "type": ..., "confidence": ...}
+
+Rows that cannot be parsed yield {"error": ...} in their place.
+
+Lines are cut into batches in the calling process and resolved by a process
+pool; each worker parses its batch, calls resolve_batch once per script and
+returns the serialized lines, so the parent only moves bytes.
+
+    python address_bulk.py records.ndjson -o resolved.ndjson --workers 8
+    cat records.ndjson | python address_bulk.py - > resolved.ndjson
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
+
+from config import BULK_WORKERS, BULK_BATCH_SIZE, BULK_MAX_INFLIGHT
+from post_processing import NepalAddressValidator
+
+# Results beyond this many bytes are spooled to disk rather than memory
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+_validator: Optional[NepalAddressValidator] = None
+
+
+def _init_worker():
+    global _validator
+    _validator = NepalAddressValidator()
+
+
+def _text(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def _parse_row(line: bytes) -> dict:
+    row = json.loads(line)
+    if isinstance(row, list):
+        row = dict(zip(("district", "municipality", "ward", "script"), row))
+    elif not isinstance(row, dict):
+        raise ValueError("row must be a JSON object or array")
+
+    script = row.get("script") or "ne"
+    if script not in ("ne", "en"):
+        raise ValueError(f"unknown script: {script}")
+    return {
+        "id": row.get("id"),
+        "script": script,
+        "district": _text(row.get("district")),
+        "municipality": _text(row.get("municipality")),
+        "ward": _text(row.get("ward")),
+    }
+
+
+def resolve_lines(lines: List[bytes]) -> bytes:
+    """Resolve one batch of NDJSON lines; returns the NDJSON result lines."""
+    if _validator is None:
+        _init_worker()
+
+    out: List[Optional[dict]] = [None] * len(lines)
+    by_script = {"ne": [], "en": []}
+    for i, line in enumerate(lines):
+        try:
+            row = _parse_row(line)
+        except (ValueError, TypeError) as e:
+            out[i] = {"error": f"invalid row: {e}"}
+            continue
+        by_script[row["script"]].append((i, row))
+
+    for script, rows in by_script.items():
+        if not rows:
+            continue
+        resolved = _validator.resolve_batch(
+            [(r["district"], r["municipality"], r["ward"]) for _, r in rows], script)
+        for (i, row), result in zip(rows, resolved):
+            record = {"id": row["id"]} if row["id"] is not None else {}
+            record["script"] = script
+            record.update(result)
+            out[i] = record
+
+    return b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in out)
+
+
+def make_pool(workers: int = BULK_WORKERS) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def _batches(lines: Iterable[bytes], batch_size: int) -> Iterator[List[bytes]]:
+    batch = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_stream(lines: Iterable[bytes], pool: ProcessPoolExecutor,
+                   batch_size: int = BULK_BATCH_SIZE, max_inflight: int = BULK_MAX_INFLIGHT) -> Iterator[bytes]:
+    """Yield resolved NDJSON chunks in input order, keeping at most max_inflight batches queued."""
+    pending = deque()
+    for batch in _batches(lines, batch_size):
+        if len(pending) >= max_inflight:
+            yield pending.popleft().result()
+        pending.append(pool.submit(resolve_lines, batch))
+    while pending:
+        yield pending.popleft().result()
+
+
+async def _split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    tail = b""
+    async for chunk in chunks:
+        parts = (tail + chunk).split(b"\n")
+        tail = parts.pop()
+        for part in parts:
+            yield part
+    if tail:
+        yield tail
+
+
+async def resolve_stream_async(chunks: AsyncIterator[bytes], pool: ProcessPoolExecutor,
+                               batch_size: int = BULK_BATCH_SIZE,
+                               max_inflight: int = BULK_MAX_INFLIGHT) -> AsyncIterator[bytes]:
+    """Async resolve_stream over a raw byte stream (e.g. a request body)."""
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    batch = []
+
+    async for line in _split_lines(chunks):
+        line = line.strip()
+        if not line:
+            continue
+        batch.append(line)
+        if len(batch) < batch_size:
+            continue
+        if len(pending) >= max_inflight:
+            yield await pending.popleft()
+        pending.append(loop.run_in_executor(pool, resolve_lines, batch))
+        batch = []
+
+    if batch:
+        pending.append(loop.run_in_executor(pool, resolve_lines, batch))
+    while pending:
+        yield await pending.popleft()
+
+
+async def spool_results(chunks: AsyncIterator[bytes], pool: ProcessPoolExecutor) -> tempfile.SpooledTemporaryFile:
+    """
+    Resolve a request body while it uploads and collect the output. Servers
+    reporting ASGI < 2.4 read the body and watch for disconnects on the same
+    channel, so the response can only start once the body is consumed.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        async for result in resolve_stream_async(chunks, pool):
+            spool.write(result)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def iter_spool(spool, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="NDJSON file of rows, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    dst = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    start = time.perf_counter()
+    rows = 0
+    try:
+        with make_pool(args.workers) as pool:
+            for chunk in resolve_stream(src, pool, args.batch_size, max_inflight=2 * args.workers):
+                dst.write(chunk)
+                rows += chunk.count(b"\n")
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is not sys.stdout.buffer:
+            dst.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Resolved {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
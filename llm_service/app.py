@@ -1,22 +1,43 @@
 # llm_service/app.py
+# Sets the thread limits the native libraries read at import, so it comes first
+from cpu_budget import budget
 import asyncio
 import json
 import os
+import threading
+import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Optional
 
-import instructor
-from fastapi import FastAPI
-from openai import OpenAI
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL, DATA_DIR
-from post_processing import NepalAddressValidator
-from prompts import FRONT_PROMPT, BACK_PROMPT
-from schema import FrontSideCard, BackSideCard
+from address_bulk import iter_spool, make_pool, spool_results
+from admission import admission
+from config import (
+    OLLAMA_MODEL, DATA_DIR, EXTRACTION_MODE,
+    PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS,
+    ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT_S,
+    MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_TTL_S, MODEL_PIN, MODEL_PRELOAD,
+)
+from extraction import llm_extract
+from metrics import registry
+from model_registry import models
+from post_processing import ADDRESS_FIELDS, NepalAddressValidator
+from profiling import profiler
 
 app = FastAPI(title="LLM Extraction Service (Ollama + Instructor)")
+admission.install(app, ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT_S, registry,
+                  batch_paths=("/resolve-addresses",))
+profiler.install(app, "llm_service", PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS)
+registry.install(app, "llm_service")
+registry.register("cpu_threads", "gauge", lambda: budget.threads)
+
+# The address gazetteer is the service's resident model (MODEL_PRELOAD loads it at startup)
+models.register("gazetteer", NepalAddressValidator)
+models.install(app, MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_TTL_S, MODEL_PIN, MODEL_PRELOAD, registry)
 
 SHARED_DATA_DIR = DATA_DIR
 os.makedirs(SHARED_DATA_DIR, exist_ok=True)
@@ -24,58 +45,52 @@ os.makedirs(SHARED_DATA_DIR, exist_ok=True)
 # Global executor for non-blocking I/O and processing
 executor = ThreadPoolExecutor(max_workers=4)
 
-# Initialize Validator once
-validator = NepalAddressValidator()
+# Process pool for /resolve-addresses, started on first use
+bulk_pool = None
 
-# Ensure `ollama run gemma2:2b` is running in your terminal/background.
-client = OpenAI(
-    base_url=OLLAMA_BASE_URL,
-    api_key="ollama"
-)
+# Jobs submitted to the executor that no worker has picked up yet
+_queued = 0
+_queued_lock = threading.Lock()
 
-# Patch OpenAI client with Instructor for structured output
-patched_client = instructor.from_openai(client, mode=instructor.Mode.JSON_SCHEMA)
 
-def llm_extract(text: str, side:str) -> Dict[str, Any]:
-    """
-    Sends text to Ollama (gemma2:2b) via Instructor to get structured JSON.
-    """    
-    if side == "front":
-        response_model = FrontSideCard
-        system_content = FRONT_PROMPT
-    else:
-        # Default to front if unknown
-        response_model = BackSideCard
-        system_content = BACK_PROMPT
+def _count_queued(delta: int):
+    global _queued
+    with _queued_lock:
+        _queued += delta
 
-    try:
-        # Instructor handles the heavy lifting of validation and retries
-        result = patched_client.chat.completions.create(
-            model=OLLAMA_MODEL,
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": f"""Extract all information from this Nepali Citizenship Card OCR text.
-                Text:
-                {text}
-
-                Return only valid JSON matching the exact schema. No explanations, no markdown, no extra text."""}
-            ],
-            response_model=response_model,
-            temperature=0.0,
-            max_tokens=500,
-        )
-        return result.model_dump()
 
-    except Exception as e:
-        print(f"Extraction failed: {e}")
-        # Return empty model on failure to prevent API 500 errors
-        return response_model().model_dump()
+def run_in_executor(fn: Callable, *args) -> asyncio.Future:
+    """loop.run_in_executor on the shared executor, counting the job while it waits for a worker."""
+    def run():
+        _count_queued(-1)
+        return fn(*args)
+
+    def done(future):
+        if future.cancelled():  # cancelled while queued, so run never did
+            _count_queued(-1)
+
+    _count_queued(1)
+    future = executor.submit(run)
+    future.add_done_callback(done)
+    return asyncio.wrap_future(future)
+
+
+registry.register("executor_queue_depth", "gauge", lambda: _queued)
+
+
+def address_cache_stats() -> dict:
+    validator = models.loaded("gazetteer")
+    return validator.cache_stats() if validator is not None else {}
+
+
+registry.register("address_cache", "counter", address_cache_stats, label="result")
 
 
 def post_process_result(raw_llm: dict, side: str ) -> dict:
     """Wrapper to run validation safely."""
     try:
-        return validator.post_process(raw_llm, side)
+        with models.use("gazetteer") as validator:
+            return validator.post_process(raw_llm, side)
     except Exception as e:
         return {"error": "post-process failed", "details": str(e), "raw": raw_llm}
 
@@ -84,39 +99,119 @@ class ExtractInput(BaseModel):
     text: str
     card_side: str = "unknown"
 
-@app.post("/extract")
-async def extract_data(input: ExtractInput) -> Dict:
-    loop = asyncio.get_running_loop()
-    
+
+def ndjson(event: str, **data) -> bytes:
+    return json.dumps({"event": event, **data}, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class PartialExtraction:
+    """
+    The fields of one streamed extraction as the LLM completes them. on_field
+    runs on the extraction thread, and resolves each address as soon as its
+    three fields are in, while the remaining tokens keep arriving (the final
+    post-processing then finds it in the address cache). emit, if given,
+    receives "field" and "address" events, and "retry" when the attempt they
+    came from failed validation and a new one starts; setting cancel stops
+    generation.
+    """
+
+    def __init__(self, side: str, emit: Optional[Callable[..., None]] = None):
+        self.side = side
+        self.emit = emit
+        self.fields: Dict[str, Any] = {}
+        self.addresses: Dict[str, dict] = {}
+        self.cancel = threading.Event()
+
+    def on_retry(self, attempt: int):
+        # Fields and addresses of the failed attempt are void; the new one resolves its own
+        self.fields.clear()
+        self.addresses.clear()
+        if self.emit is not None:
+            self.emit("retry", attempt=attempt)
+
+    def on_field(self, name: str, value: Any):
+        self.fields[name] = value
+        if self.emit is not None:
+            self.emit("field", name=name, value=value)
+        for address, keys in ADDRESS_FIELDS.items():
+            if address not in self.addresses and all(key in self.fields for key in keys):
+                self.addresses[address] = self._resolve(address)
+
+    def _resolve(self, address: str) -> dict:
+        t = time.perf_counter()
+        try:
+            with models.use("gazetteer") as validator:
+                resolved = validator.resolve_address(self.fields, address, self.side)
+        except Exception as e:
+            resolved = {"error": "post-process failed", "details": str(e)}
+        registry.observe("address_early", (time.perf_counter() - t) * 1000)
+        if self.emit is not None:
+            self.emit("address", address=address, value=resolved)
+        return resolved
+
+
+async def run_extraction(input: ExtractInput, request: Request,
+                         progress: Optional[PartialExtraction] = None) -> Dict:
+    """What /extract returns; with progress the completion is streamed into it."""
     # 1. Detect side 
     side = input.card_side
     
     # 2. Setup Debugging
-    request_id = uuid.uuid4().hex[:12]
-    debug_file = f"extract_{request_id}.txt"
+    # The request id comes from the client, so the file is named by the server
+    # and the id is written inside it
+    request_id = request.state.request_id
+    debug_file = f"extract_{uuid.uuid4().hex}.txt"
     debug_path = os.path.join(SHARED_DATA_DIR, debug_file)
 
     try:
         # 3. Run LLM Extraction (CPU/Network bound, so run in executor)
-        raw_json = await asyncio.wait_for(
-            loop.run_in_executor(executor, llm_extract, input.text, side),
-            timeout=120, # Timeout if Ollama hangs
-        )
+        t_llm = time.perf_counter()
+        on_field, on_retry, cancel = ((progress.on_field, progress.on_retry, progress.cancel) if progress is not None
+                                      else (None, None, None))
+        try:
+            raw_json, extraction_stats = await asyncio.wait_for(
+                run_in_executor(llm_extract, input.text, side, on_field, on_retry, cancel),
+                timeout=120, # Timeout if Ollama hangs
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Stop a streamed generation instead of leaving it running in the executor
+            if cancel is not None:
+                cancel.set()
+            raise
+        llm_ms = (time.perf_counter() - t_llm) * 1000
+        registry.observe("llm", llm_ms)
+        registry.inc("llm_retries", extraction_stats.get("retries", 0))
+        registry.inc("llm_repairs", extraction_stats.get("repairs", 0))
+        if extraction_stats.get("fallback_empty"):
+            registry.inc("llm_fallback_empty")
+        if "first_field_ms" in extraction_stats:
+            registry.observe("llm_first_field", extraction_stats["first_field_ms"])
+        if extraction_stats.get("stopped_early"):
+            registry.inc("llm_stopped_early")
 
         # 4. Save Raw Output for Debugging
         with open(debug_path, "w", encoding="utf-8") as f:
             f.write("=== LLM OUTPUT ===\n")
+            f.write(f"Request ID: {request_id}\n")
             f.write(json.dumps(raw_json, indent=2, ensure_ascii=False))
 
         # 5. Post-Process (Address cleaning, normalization)
-        result = await loop.run_in_executor(executor, post_process_result, raw_json, side)
+        t_post = time.perf_counter()
+        result = await run_in_executor(post_process_result, raw_json, side)
+        post_process_ms = (time.perf_counter() - t_post) * 1000
+        registry.observe("post_process", post_process_ms)
 
         # 6. Attach Metadata
         result["metadata"] = {
             "request_id": request_id,
             "detected_card_side": side,
             "extraction_method": f"Instructor+Ollama({OLLAMA_MODEL})",
+            "extraction_stats": extraction_stats,
             "debug_file": debug_file,
+            "timings_ms": {
+                "llm": round(llm_ms, 2),
+                "post_process": round(post_process_ms, 2),
+            },
         }
         return result
 
@@ -125,9 +220,78 @@ async def extract_data(input: ExtractInput) -> Dict:
     except Exception as e:
         return {"error": "Unexpected error", "details": str(e), "debug_file": debug_file}
 
+
+@app.post("/extract")
+async def extract_data(input: ExtractInput, request: Request) -> Dict:
+    progress = PartialExtraction(input.card_side) if EXTRACTION_MODE == "streaming" else None
+    return await run_extraction(input, request, progress)
+
+
+@app.post("/extract/stream")
+async def extract_stream(input: ExtractInput, request: Request):
+    """
+    /extract with the completion streamed, as NDJSON events: "field" as the
+    LLM completes each schema field, "address" as each address is resolved
+    (while the later fields are still being generated), "retry" when that
+    output failed validation and the fields and addresses sent so far are
+    void, then "result" with what /extract returns. Generation stops once
+    every field is in, or when the client disconnects.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, **data):
+        loop.call_soon_threadsafe(queue.put_nowait, ndjson(event, **data))
+
+    progress = PartialExtraction(input.card_side, emit)
+
+    async def run():
+        try:
+            await queue.put(ndjson("result", result=await run_extraction(input, request, progress)))
+        finally:
+            await queue.put(None)
+
+    task = asyncio.ensure_future(run())
+
+    async def events():
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        except asyncio.CancelledError:
+            registry.inc("stream_disconnects")
+            print(f"Client disconnected, cancelled {request.state.request_id}")
+            raise
+        finally:
+            if not task.done():
+                progress.cancel.set()
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/resolve-addresses")
+async def resolve_addresses(request: Request):
+    """
+    Bulk address normalization. Body: NDJSON rows of district, municipality,
+    ward, script (see address_bulk.py). Rows are resolved in batches as the
+    body arrives; the NDJSON results are streamed back in input order.
+    """
+    global bulk_pool
+    if bulk_pool is None:
+        bulk_pool = make_pool()
+    spool = await spool_results(request.stream(), bulk_pool)
+    return StreamingResponse(iter_spool(spool), media_type="application/x-ndjson")
+
+
+@app.on_event("shutdown")
+def shutdown_bulk_pool():
+    if bulk_pool is not None:
+        bulk_pool.shutdown(cancel_futures=True)
+
+
 @app.get("/health")
 def health():
-    return {"status": "running", "backend": "ollama", "model": OLLAMA_MODEL}
+    return {"status": "running", "backend": "ollama", "model": OLLAMA_MODEL, "extraction_mode": EXTRACTION_MODE,
+            "capacity": admission.capacity()}
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 # Ollama Configuration (Docker-aware)
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "localhost")
@@ -6,6 +7,18 @@ OLLAMA_PORT = os.getenv("OLLAMA_PORT", "11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b")
 OLLAMA_BASE_URL = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1"
 
+# Extraction mode:
+#   "instructor"  - Instructor validates and re-generates on failure (default)
+#   "constrained" - JSON schema is sent as response_format and near-valid
+#                   output is repaired locally before any re-generation
+#   "streaming"   - constrained, with the completion streamed: addresses are
+#                   resolved as soon as their fields are generated and
+#                   generation stops once every field is in (always used by
+#                   /extract/stream)
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "instructor")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_TOKENS = 500
+
 # Shared Data Directory
 DATA_DIR = os.getenv("DATA_PATH", "/app/shared_data")
 
@@ -22,4 +35,53 @@ VDC_JSON = os.path.join(DATA_DIR, "nepal_vdcs_by_district.json")
 
 # Location in English
 EN_MUNI_JSON = os.path.join(DATA_DIR, "en_nepal_municipalities_by_district.json")
-EN_VDC_JSON = os.path.join(DATA_DIR, "en_nepal_vdcs_by_district.json")
\ No newline at end of file
+EN_VDC_JSON = os.path.join(DATA_DIR, "en_nepal_vdcs_by_district.json")
+
+# Bounded cache of resolved (district, municipality) lookups
+ADDRESS_CACHE_SIZE = int(os.getenv("ADDRESS_CACHE_SIZE", "4096"))
+
+# Global (district-less) place search: "ngram" shortlists candidates with an
+# n-gram index before scoring, "exhaustive" scores every gazetteer name
+GAZETTEER_SEARCH = os.getenv("GAZETTEER_SEARCH", "ngram")
+GAZETTEER_NGRAM = int(os.getenv("GAZETTEER_NGRAM", "2"))
+
+# Compiled gazetteer (see gazetteer_artifact.py). Loaded via mmap when its
+# checksum matches the JSON above, rebuilt otherwise; empty disables it
+GAZETTEER_ARTIFACT = os.getenv("GAZETTEER_ARTIFACT", os.path.join(DATA_DIR, "gazetteer.bin"))
+
+# Request profiling (see profiling.py): requests with "X-Profile: 1", plus
+# this fraction of all requests, are sampled every PROFILE_INTERVAL_MS
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# Bulk /resolve-addresses and address_bulk.py: worker processes, rows per
+# batch, and batches queued ahead of the output
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(os.cpu_count() or 1)))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+BULK_MAX_INFLIGHT = int(os.getenv("BULK_MAX_INFLIGHT", str(2 * BULK_WORKERS)))
+
+# Admission control (see admission.py): requests running at once, requests
+# allowed to wait for a slot, and how long they may wait before a 429
+ADMISSION_LIMIT = int(os.getenv("ADMISSION_LIMIT", "4"))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "60"))
+
+# Model lifecycle (see model_registry.py): models are loaded on first use.
+# Loading one evicts the least recently used others to stay within
+# MODEL_MEMORY_BUDGET_MB (0: no budget); models unused for MODEL_IDLE_TTL_S
+# are evicted (0: never). MODEL_PIN names models never evicted,
+# MODEL_PRELOAD models loaded at startup (comma-separated; see GET /models).
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+MODEL_IDLE_TTL_S = float(os.getenv("MODEL_IDLE_TTL_S", "0"))
+MODEL_PIN = [m.strip() for m in os.getenv("MODEL_PIN", "").split(",") if m.strip()]
+MODEL_PRELOAD = [m.strip() for m in os.getenv("MODEL_PRELOAD", "gazetteer").split(",") if m.strip()]
+
+# CPU budget (see cpu_budget.py): threads each native library (OpenCV,
+# OpenMP/BLAS, TensorFlow, PaddleOCR, Tesseract) may use in this process;
+# 0 splits the available CPUs between the WEB_CONCURRENCY uvicorn workers.
+# CPU_AFFINITY pins the process: "auto" (a free slot of CPU_THREADS cores,
+# claimed through lock files in CPU_SLOT_DIR), a CPU list ("0-3,8") or "" (none)
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "")
+CPU_SLOT_DIR = os.getenv("CPU_SLOT_DIR", tempfile.gettempdir())
@@ -0,0 +1,121 @@
+# cpu_budget.py
+"""
+One CPU budget per process for every native library that runs threads.
+
+OpenCV, OpenMP and the BLAS libraries behind numpy, TensorFlow, PaddleOCR
+and Tesseract each size their thread pools from the machine's core count,
+so a node running several workers ends up with many times more busy
+threads than cores. This module is imported before any of them
+(app.py's first import) and gives all of them the same number of threads,
+CPU_THREADS: the thread-count environment variables that OpenMP, BLAS and
+TensorFlow read when they start, OMP_THREAD_LIMIT for the Tesseract
+subprocesses, and `threads` for the calls that take a count at runtime
+(cv2.setNumThreads, tf.config.threading, PaddleOCR's cpu_threads,
+rapidfuzz's workers).
+
+CPU_THREADS=0 splits the CPUs available to the process evenly between the
+WEB_CONCURRENCY uvicorn workers. CPU_AFFINITY pins the process:
+  ""        no pinning (the default)
+  "auto"    each process takes the first free slot of CPU_THREADS cores;
+            slots are lock files in CPU_SLOT_DIR, released when the process
+            exits, so workers of every service on the node share them out
+  "0-3,8"   exactly these CPUs
+
+Libraries already loaded when the budget is applied keep the pools they
+started with, except those set at runtime; benchmarks/bench_threads.py
+measures which workers x threads split gives the best throughput.
+"""
+import fcntl
+import os
+from typing import List, Optional
+
+from config import CPU_THREADS, CPU_AFFINITY, CPU_SLOT_DIR
+
+# Read by OpenMP (and so Paddle's MKL-DNN), OpenBLAS, MKL, numexpr and TensorFlow at start-up
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+               "TF_NUM_INTRAOP_THREADS")
+
+
+def parse_cpus(spec: str) -> List[int]:
+    """CPU list syntax as in taskset/cgroups: "0-3,8" -> [0, 1, 2, 3, 8]."""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def available_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        return list(range(os.cpu_count() or 1))
+
+
+class CpuBudget:
+    def __init__(self, threads: int = CPU_THREADS, affinity: str = CPU_AFFINITY, slot_dir: str = CPU_SLOT_DIR):
+        cpus = available_cpus()
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1") or 1))
+        self.threads = threads if threads > 0 else max(1, len(cpus) // workers)
+        self.cpus: Optional[List[int]] = None
+        self.slot: Optional[int] = None
+        self._slot_file = None
+
+        if affinity == "auto":
+            self.cpus = self._claim_slot(cpus, slot_dir)
+        elif affinity:
+            self.cpus = parse_cpus(affinity)
+        if self.cpus:
+            try:
+                os.sched_setaffinity(0, self.cpus)
+            except (AttributeError, OSError) as e:
+                print(f"Warning: CPU_AFFINITY {affinity!r} not applied: {e}")
+                self.cpus = None
+
+        for name in _THREAD_ENV:
+            os.environ[name] = str(self.threads)
+        os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+        # Tesseract runs as a subprocess and inherits these
+        os.environ["OMP_THREAD_LIMIT"] = str(self.threads)
+        print(f"[CPU] {self.threads} threads per library"
+              + (f", pinned to CPUs {self.cpus}" + (f" (slot {self.slot})" if self.slot is not None else "")
+                 if self.cpus else ""))
+
+    def _claim_slot(self, cpus: List[int], slot_dir: str) -> Optional[List[int]]:
+        """Lock the first free slot of self.threads CPUs; None (no pinning) if all are taken."""
+        # The embedded pipeline imports several services' copies of this module into one process
+        owner, _, claimed = os.environ.get("CPU_BUDGET_SLOT", "").partition(":")
+        if owner == str(os.getpid()):
+            self.slot = int(claimed)
+            return sorted(os.sched_getaffinity(0))
+        os.makedirs(slot_dir, exist_ok=True)
+        for slot in range(len(cpus) // self.threads):
+            f = open(os.path.join(slot_dir, f"nagarikta-cpu-slot-{slot}.lock"), "w")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            # Held open for the life of the process; the lock goes with it
+            self._slot_file, self.slot = f, slot
+            os.environ["CPU_BUDGET_SLOT"] = f"{os.getpid()}:{slot}"
+            return cpus[slot * self.threads:(slot + 1) * self.threads]
+        print(f"Warning: no free CPU slot of {self.threads} cores among {len(cpus)} CPUs; not pinned")
+        return None
+
+    def tensorflow(self, tf):
+        """Size TensorFlow's pools (only possible before its first op)."""
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            pass  # already initialized; TF_NUM_*_THREADS applied
+
+    def snapshot(self) -> dict:
+        return {"threads": self.threads, "cpus": self.cpus, "slot": self.slot}
+
+
+budget = CpuBudget()
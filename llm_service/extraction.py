@@ -0,0 +1,246 @@
+# llm_service/extraction.py
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, Any, Optional, Tuple, Type
+
+import instructor
+from openai import OpenAI
+from pydantic import BaseModel, ValidationError
+from tenacity import Retrying, retry_if_exception_type, stop_after_attempt
+
+from config import OLLAMA_BASE_URL, OLLAMA_MODEL, EXTRACTION_MODE, LLM_MAX_RETRIES, LLM_MAX_TOKENS
+from json_repair import repair_json, repair_field
+from partial_json import PartialObject
+from prompts import FRONT_PROMPT, BACK_PROMPT
+from schema import FrontSideCard, BackSideCard
+
+# Ensure `ollama run gemma2:2b` is running in your terminal/background.
+client = OpenAI(
+    base_url=OLLAMA_BASE_URL,
+    api_key="ollama"
+)
+
+# Patch OpenAI client with Instructor for structured output
+patched_client = instructor.from_openai(client, mode=instructor.Mode.JSON_SCHEMA)
+
+# JSON schemas are static, build them once
+_RESPONSE_FORMATS = {
+    model: {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "schema": model.model_json_schema()},
+    }
+    for model in (FrontSideCard, BackSideCard)
+}
+
+
+def select_schema(side: str) -> Tuple[Type[BaseModel], str]:
+    """Return (response_model, system_prompt) for a card side."""
+    if side == "front":
+        return FrontSideCard, FRONT_PROMPT
+    # Anything that is not front is treated as back
+    return BackSideCard, BACK_PROMPT
+
+
+def build_messages(text: str, system_content: str) -> list:
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": f"""Extract all information from this Nepali Citizenship Card OCR text.
+        Text:
+        {text}
+
+        Return only valid JSON matching the exact schema. No explanations, no markdown, no extra text."""}
+    ]
+
+
+def _extract_instructor(text: str, side: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    response_model, system_content = select_schema(side)
+
+    # Instructor handles the heavy lifting of validation and retries; our own
+    # Retrying bounds them like the other modes and counts the attempts made
+    retrying = Retrying(
+        stop=stop_after_attempt(LLM_MAX_RETRIES + 1),
+        retry=retry_if_exception_type(ValueError),  # validation and JSON errors
+        reraise=True,
+    )
+    try:
+        result = patched_client.chat.completions.create(
+            model=OLLAMA_MODEL,
+            messages=build_messages(text, system_content),
+            response_model=response_model,
+            temperature=0.0,
+            max_tokens=LLM_MAX_TOKENS,
+            max_retries=retrying,
+        )
+    finally:
+        stats["retries"] += max(0, retrying.statistics.get("attempt_number", 1) - 1)
+    return result.model_dump()
+
+
+def _extract_constrained(text: str, side: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send the JSON schema as a format constraint so the backend only samples valid
+    tokens. Output that still fails validation (truncation, aliased keys, Literal
+    mismatches) is repaired locally; the model is only asked again if repair fails.
+    """
+    response_model, system_content = select_schema(side)
+    messages = build_messages(text, system_content)
+
+    last_error = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if attempt:
+            stats["retries"] += 1
+
+        completion = client.chat.completions.create(
+            model=OLLAMA_MODEL,
+            messages=messages,
+            response_format=_RESPONSE_FORMATS[response_model],
+            temperature=0.0,
+            max_tokens=LLM_MAX_TOKENS,
+        )
+        content = completion.choices[0].message.content or ""
+
+        result, last_error = _validated(content, response_model, stats, attempt)
+        if result is not None:
+            return result
+
+    raise RuntimeError(f"No valid output after {LLM_MAX_RETRIES + 1} attempts: {last_error}")
+
+
+def _validated(content: str, response_model: Type[BaseModel], stats: Dict[str, Any],
+               attempt: int) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+    """(the validated output, None), repairing it locally if needed, or (None, the error)."""
+    try:
+        return response_model.model_validate_json(content).model_dump(), None
+    except ValidationError as e:
+        last_error = e
+
+    repaired, fixes = repair_json(content, response_model)
+    if repaired is None:
+        print(f"Attempt {attempt + 1}: output could not be repaired")
+        return None, last_error
+    try:
+        result = response_model.model_validate(repaired)
+    except ValidationError as e:
+        return None, e
+
+    stats["repairs"] += 1
+    stats["repair_steps"].extend(fixes)
+    return result.model_dump(), None
+
+
+# Called with (schema field name, value) as each field of the output completes
+FieldCallback = Callable[[str, Any], None]
+
+
+def _extract_streaming(text: str, side: str, stats: Dict[str, Any], on_field: Optional[FieldCallback] = None,
+                       on_retry: Optional[Callable[[int], None]] = None,
+                       cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Constrained extraction with the completion streamed: the JSON is parsed as
+    tokens arrive, each field is handed to on_field as soon as it is complete,
+    and the stream is closed (which stops Ollama generating) once every schema
+    field is in or the object is closed, instead of waiting for the model to
+    finish on its own. Validation and repair then work as in constrained mode.
+    When an attempt fails validation, on_retry gets the next attempt's number
+    before its fields come in: what on_field got so far is void. Setting
+    cancel stops generation at the next token.
+    """
+    response_model, system_content = select_schema(side)
+    messages = build_messages(text, system_content)
+    fields = response_model.model_fields
+
+    last_error = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if attempt:
+            stats["retries"] += 1
+            if on_retry is not None:
+                on_retry(attempt)
+
+        t = time.perf_counter()
+        stream = client.chat.completions.create(
+            model=OLLAMA_MODEL,
+            messages=messages,
+            response_format=_RESPONSE_FORMATS[response_model],
+            temperature=0.0,
+            max_tokens=LLM_MAX_TOKENS,
+            stream=True,
+        )
+        parser, seen, fixes = PartialObject(), set(), []
+        stats["stopped_early"] = False
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    stats["cancelled"] = True
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                try:
+                    members = parser.feed(delta)
+                except ValueError:
+                    break  # not parseable as it streams; validation below repairs or retries
+                for key, value in members:
+                    name, value = repair_field(key, value, response_model, fixes)
+                    if name is None or name in seen:
+                        continue
+                    seen.add(name)
+                    if "first_field_ms" not in stats:
+                        stats["first_field_ms"] = round((time.perf_counter() - t) * 1000, 2)
+                    if on_field is not None:
+                        on_field(name, value)
+                if parser.closed or len(seen) == len(fields):
+                    stats["stopped_early"] = chunk.choices[0].finish_reason is None
+                    break
+        finally:
+            stream.close()
+        if stats.get("cancelled"):
+            raise RuntimeError("Extraction cancelled")
+
+        result, last_error = _validated(parser.text, response_model, stats, attempt)
+        if result is not None:
+            return result
+
+    raise RuntimeError(f"No valid output after {LLM_MAX_RETRIES + 1} attempts: {last_error}")
+
+
+def llm_extract(text: str, side: str, on_field: Optional[FieldCallback] = None,
+                on_retry: Optional[Callable[[int], None]] = None,
+                cancel: Optional[threading.Event] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Sends text to Ollama (gemma2:2b) to get structured JSON.
+
+    With on_field (or EXTRACTION_MODE=streaming) the completion is streamed,
+    see _extract_streaming; on_field then gets each field as it completes,
+    and on_retry is told when a new attempt makes those fields void.
+
+    Returns:
+        (data, stats) where stats records the extraction mode, how many
+        generations were retried, how many outputs were repaired locally and
+        whether the empty-model fallback was used.
+    """
+    mode = "streaming" if on_field is not None else EXTRACTION_MODE
+    stats = {
+        "mode": mode,
+        "retries": 0,
+        "repairs": 0,
+        "repair_steps": [],
+        "fallback_empty": False,
+    }
+    if mode == "streaming":
+        extract = partial(_extract_streaming, on_field=on_field, on_retry=on_retry, cancel=cancel)
+    elif mode == "constrained":
+        extract = _extract_constrained
+    else:
+        extract = _extract_instructor
+
+    try:
+        return extract(text, side, stats), stats
+
+    except Exception as e:
+        print(f"Extraction failed: {e}")
+        stats["fallback_empty"] = True
+        stats["error"] = str(e)
+        # Return empty model on failure to prevent API 500 errors
+        response_model, _ = select_schema(side)
+        return response_model().model_dump(), stats
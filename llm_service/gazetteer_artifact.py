@@ -0,0 +1,248 @@
+# llm_service/gazetteer_artifact.py
+"""
+Compiled gazetteer artifact.
+
+The four gazetteer JSON files are compiled once into a single versioned
+binary holding every distinct name, normalized key and ward label once,
+entry and district tables with per-district offsets, and the n-gram
+postings of the global search index. Services load it via mmap instead of
+re-parsing the JSON and rebuilding the indexes on every start; the numeric
+tables stay as read-only views of the mapped file, shared between workers.
+
+A checksum of the source JSON (plus format version and n-gram size) is
+stored in the header. A stale or foreign artifact is ignored and rebuilt.
+
+    python gazetteer_artifact.py              # compile to GAZETTEER_ARTIFACT
+    python gazetteer_artifact.py --out x.bin
+
+Layout (little endian, sections 8-byte aligned):
+
+    header    magic "NGAZ", u16 version, u16 ngram, u32 sections, 32B sha256
+    sections  12B name, u64 offset, u64 nbytes       (one per section)
+    strings   UTF-8, NUL separated; every other section refers to these ids
+    entries   base, full, district, key, ward_start, ward_count (-1 = None), type
+    wards     string id per ward label
+    <script>.districts   name, key, entry_start, entry_count
+    <script>.global      entry id per global name, in map order
+    <script>.grams / .offsets / .postings   CSR n-gram postings
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from config import GAZETTEER_ARTIFACT
+from gazetteer_index import CandidateIndex, NgramIndex
+
+MAGIC = b"NGAZ"
+FORMAT_VERSION = 1
+SCRIPTS = ("ne", "en")
+PLACE_TYPES = ("modern", "muni", "vdc")
+
+_HEADER = struct.Struct("<4sHHI32s")
+_SECTION = struct.Struct("<12sQQ")
+_ALIGN = 8
+
+_ENTRY = np.dtype([
+    ("base", "<u4"), ("full", "<u4"), ("district", "<u4"), ("key", "<u4"),
+    ("ward_start", "<u4"), ("ward_count", "<i4"), ("type", "u1"),
+], align=True)
+_DISTRICT = np.dtype([
+    ("name", "<u4"), ("key", "<u4"), ("entry_start", "<u4"), ("entry_count", "<u4"),
+])
+
+
+class ScriptIndexes(NamedTuple):
+    """Everything one script's lookups search: districts, places per district, global names."""
+    districts: CandidateIndex
+    places: Dict[str, CandidateIndex]
+    global_places: CandidateIndex
+    global_ngrams: NgramIndex
+
+
+def source_checksum(paths: Iterable[str], ngram: int) -> bytes:
+    digest = hashlib.sha256(struct.pack("<HH", FORMAT_VERSION, ngram))
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest.update(struct.pack("<Q", len(data)))
+        digest.update(data)
+    return digest.digest()
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+
+    def __call__(self, s: str) -> int:
+        if "\0" in s:
+            raise ValueError(f"NUL in gazetteer string: {s!r}")
+        return self.ids.setdefault(s, len(self.ids))
+
+    def blob(self) -> bytes:
+        return "\0".join(self.ids).encode("utf-8")
+
+
+def write_artifact(path: str, checksum: bytes, ngram: int, indexes: Dict[str, ScriptIndexes]):
+    """Serialize per-script indexes; the file is replaced atomically."""
+    intern = _StringTable()
+    entries, wards = [], []
+    entry_ids = {}
+    sections = {}
+
+    for script in SCRIPTS:
+        idx = indexes[script]
+        districts = []
+        for name, key in zip(idx.districts.names, idx.districts.keys):
+            places = idx.places[name]
+            start = len(entries)
+            for entry, place_key in zip(places.entries, places.keys):
+                entry_ids[id(entry)] = len(entries)
+                ward_list = entry["wards"]
+                entries.append((
+                    intern(entry["base"]), intern(entry["full"]), intern(entry["district"]), intern(place_key),
+                    len(wards), -1 if ward_list is None else len(ward_list), PLACE_TYPES.index(entry["type"]),
+                ))
+                wards.extend(intern(str(w)) for w in ward_list or ())
+            districts.append((intern(name), intern(key), start, len(entries) - start))
+        sections[f"{script}.districts"] = np.array(districts, dtype=_DISTRICT)
+        sections[f"{script}.global"] = np.array(
+            [entry_ids[id(e)] for e in idx.global_places.entries], dtype="<u4")
+
+        grams, offsets, postings = [], [0], []
+        for gram, positions in idx.global_ngrams.postings().items():
+            grams.append(intern(gram))
+            postings.append(np.asarray(positions, dtype="<u4"))
+            offsets.append(offsets[-1] + len(positions))
+        sections[f"{script}.grams"] = np.array(grams, dtype="<u4")
+        sections[f"{script}.offsets"] = np.array(offsets, dtype="<u4")
+        sections[f"{script}.postings"] = np.concatenate(postings) if postings else np.zeros(0, dtype="<u4")
+
+    # Zero-filled so struct padding is deterministic
+    sections["entries"] = np.zeros(len(entries), dtype=_ENTRY)
+    sections["entries"][:] = entries
+    sections["wards"] = np.array(wards, dtype="<u4")
+    payloads = [("strings", intern.blob())] + [(name, arr.tobytes()) for name, arr in sections.items()]
+
+    start = _HEADER.size + _SECTION.size * len(payloads)
+    table, body = [], bytearray()
+    for name, data in payloads:
+        body += b"\0" * (-(start + len(body)) % _ALIGN)
+        table.append(_SECTION.pack(name.encode("ascii"), start + len(body), len(data)))
+        body += data
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".gazetteer-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, ngram, len(payloads), checksum))
+            f.write(b"".join(table))
+            f.write(body)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_artifact(path: str, checksum: bytes, ngram: int) -> Optional[Dict[str, ScriptIndexes]]:
+    """Load per-script indexes, or None if the artifact is missing, stale or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(buf) < _HEADER.size:
+        return None
+    magic, version, stored_ngram, count, stored_checksum = _HEADER.unpack_from(buf, 0)
+    if (magic, version, stored_ngram, stored_checksum) != (MAGIC, FORMAT_VERSION, ngram, checksum):
+        return None
+
+    sections = {}
+    for i in range(count):
+        name, offset, nbytes = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+        if offset + nbytes > len(buf):
+            return None
+        sections[name.rstrip(b"\0").decode("ascii")] = (offset, nbytes)
+
+    def view(name, dtype):
+        offset, nbytes = sections[name]
+        return np.frombuffer(buf, dtype=dtype, count=nbytes // np.dtype(dtype).itemsize, offset=offset)
+
+    offset, nbytes = sections["strings"]
+    strings = buf[offset:offset + nbytes].decode("utf-8").split("\0")
+
+    table = view("entries", _ENTRY)
+    ward_ids = view("wards", "<u4").tolist()
+    entries = []
+    for base, full, district, _, ward_start, ward_count, kind in table.tolist():
+        ward_list = None if ward_count < 0 else [strings[w] for w in ward_ids[ward_start:ward_start + ward_count]]
+        entries.append({
+            "base": strings[base],
+            "full": strings[full],
+            "district": strings[district],
+            "type": PLACE_TYPES[kind],
+            "wards": ward_list,
+            "ward_set": frozenset(ward_list) if ward_list else None,
+        })
+    entry_keys = [strings[k] for k in table["key"].tolist()]
+
+    indexes = {}
+    for script in SCRIPTS:
+        districts = view(f"{script}.districts", _DISTRICT).tolist()
+        places = {
+            strings[name]: CandidateIndex(
+                tuple(e["base"] for e in entries[start:start + n]),
+                tuple(entry_keys[start:start + n]),
+                tuple(entries[start:start + n]),
+            )
+            for name, _, start, n in districts
+        }
+        global_ids = view(f"{script}.global", "<u4").tolist()
+        global_places = CandidateIndex(
+            tuple(entries[i]["base"] for i in global_ids),
+            tuple(entry_keys[i] for i in global_ids),
+            tuple(entries[i] for i in global_ids),
+        )
+
+        postings_flat = view(f"{script}.postings", "<u4")
+        offsets = view(f"{script}.offsets", "<u4").tolist()
+        postings = {
+            strings[gram]: postings_flat[offsets[i]:offsets[i + 1]]
+            for i, gram in enumerate(view(f"{script}.grams", "<u4").tolist())
+        }
+        indexes[script] = ScriptIndexes(
+            districts=CandidateIndex(
+                tuple(strings[name] for name, _, _, _ in districts),
+                tuple(strings[key] for _, key, _, _ in districts),
+                (None,) * len(districts),
+            ),
+            places=places,
+            global_places=global_places,
+            global_ngrams=NgramIndex(global_places.keys, n=ngram, postings=postings),
+        )
+    return indexes
+
+
+def main():
+    # Imported here: post_processing itself imports this module
+    from post_processing import NepalAddressValidator
+
+    parser = argparse.ArgumentParser(description="Compile the gazetteer JSON into a binary artifact.")
+    parser.add_argument("--out", default=GAZETTEER_ARTIFACT, help="artifact path (default: GAZETTEER_ARTIFACT)")
+    args = parser.parse_args()
+    if not args.out:
+        raise SystemExit("No output path: set GAZETTEER_ARTIFACT or pass --out")
+
+    NepalAddressValidator(artifact=None).compile_artifact(args.out)
+    print(f"Wrote {args.out} ({os.path.getsize(args.out)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
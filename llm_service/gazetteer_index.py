@@ -0,0 +1,143 @@
+# llm_service/gazetteer_index.py
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz
+
+# Spelling variants folded together before n-grams are taken. Every mapping
+# replaces one character by exactly one character, so edit distance between
+# folded strings never exceeds the distance between the originals and the
+# count-filter bound below stays valid.
+_FOLD = {
+    # Nukta consonants -> base consonant (ऩ ऱ ऴ क़ ख़ ग़ ज़ ड़ ढ़ फ़ य़)
+    "\u0929": "\u0928", "\u0931": "\u0930", "\u0934": "\u0933",
+    "\u0958": "\u0915", "\u0959": "\u0916", "\u095A": "\u0917", "\u095B": "\u091C",
+    "\u095C": "\u0921", "\u095D": "\u0922", "\u095E": "\u092B", "\u095F": "\u092F",
+    # Long independent vowels -> short (ई ऊ ॠ)
+    "\u0908": "\u0907", "\u090A": "\u0909", "\u0960": "\u090B",
+}
+# Matras, nukta, virama and other combining signs collapse to a space, which is
+# what rapidfuzz's default_process already does to them in the keys.
+for _cp in list(range(0x0900, 0x0904)) + list(range(0x093A, 0x0950)) + list(range(0x0951, 0x0958)) + [0x0962, 0x0963]:
+    _FOLD[chr(_cp)] = " "
+_FOLD_TABLE = str.maketrans(_FOLD)
+
+
+def normalize(key: str) -> str:
+    """Fold Devanagari matra and nukta variants that OCR and transliteration confuse."""
+    return key.translate(_FOLD_TABLE)
+
+
+class CandidateIndex(NamedTuple):
+    """
+    Immutable search space for one fuzzy lookup.
+    names/keys/entries are parallel: keys[i] is default_process(names[i]) and
+    entries[i] is the place dict for that name (None for district lists).
+    """
+    names: Tuple[str, ...]
+    keys: Tuple[str, ...]
+    entries: Tuple[Optional[dict], ...]
+
+
+class NgramIndex:
+    """
+    Character n-gram inverted index over preprocessed gazetteer keys.
+
+    For a query, shared n-gram counts give every key an upper bound on its
+    fuzz.ratio score (count filter: strings within Indel distance d share at
+    least len - n + 1 - n*d n-grams). Only keys whose bound reaches the
+    threshold are scored, best bound first, and scoring stops once no
+    remaining key can beat the best score found. The result is identical to
+    scoring every key with process.extractOne whenever the best score reaches
+    the threshold.
+    """
+
+    def __init__(self, keys: Iterable[str], n: int = 3, postings: Dict[str, np.ndarray] = None):
+        self.keys = tuple(keys)
+        self.n = n
+        self._len = np.array([len(k) for k in self.keys], dtype=np.float64)
+        # Folding is length preserving
+        self._folded_len = self._len
+
+        if postings is None:
+            lists = defaultdict(list)
+            for pos, key in enumerate(normalize(k) for k in self.keys):
+                for gram in dict.fromkeys(self._grams(key)):
+                    lists[gram].append(pos)
+            postings = {gram: np.array(p, dtype=np.int64) for gram, p in lists.items()}
+        self._postings = postings
+
+    def postings(self) -> Dict[str, np.ndarray]:
+        """Gram -> ascending key positions; pass back in to skip the rebuild."""
+        return self._postings
+
+    def _grams(self, s: str):
+        return [s[i:i + self.n] for i in range(len(s) - self.n + 1)]
+
+    def _bounds(self, positions, shared, folded_len: int, key_len: int) -> np.ndarray:
+        """Upper bound of fuzz.ratio for the keys at `positions` given their shared gram counts."""
+        longest = np.maximum(self._folded_len[positions], folded_len)
+        min_distance = np.maximum.reduce([
+            np.ceil((longest - self.n + 1 - shared) / self.n),
+            np.abs(self._len[positions] - key_len),
+            np.zeros(len(shared)),
+        ])
+        total = self._len[positions] + key_len
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(total > 0, 100.0 * (1.0 - min_distance / total), 100.0)
+
+    def shortlist(self, key: str, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Positions that could score >= threshold after rounding, best bound
+        first, with their bounds.
+        """
+        cutoff = threshold - 0.5 - 1e-9
+        folded = normalize(key)
+        counts = Counter(self._grams(folded))
+        hits = [(self._postings[g], c) for g, c in counts.items() if g in self._postings]
+
+        shared = np.zeros(len(self.keys))
+        if hits:
+            # Over-counts repeated grams, which only loosens the bound
+            merged = np.concatenate([p for p, _ in hits])
+            weights = np.repeat([float(c) for _, c in hits], [len(p) for p, _ in hits])
+            shared = np.bincount(merged, weights=weights, minlength=len(self.keys))
+
+        # Any key that can reach the cutoff is within max_distance edits of the
+        # query and so shares at least min_shared grams with it. When that
+        # bound is not positive (very short queries) every key is bounded.
+        c = cutoff / 100
+        longest_key = len(key) * (2 - c) / c if c > 0 else np.inf
+        max_distance = (1 - c) * (len(key) + longest_key)
+        min_shared = len(folded) - self.n + 1 - self.n * max_distance
+        if min_shared > 0:
+            positions = np.flatnonzero(shared >= min_shared)
+        else:
+            positions = np.arange(len(self.keys))
+        shared = shared[positions]
+
+        bounds = self._bounds(positions, shared, len(folded), len(key))
+        keep = bounds >= cutoff
+        positions, bounds = positions[keep], bounds[keep]
+        order = np.lexsort((positions, -bounds))
+        return positions[order], bounds[order]
+
+    def best_match(self, key: str, threshold: float) -> Tuple[Optional[int], int]:
+        """
+        Best (position, rounded score) for an already preprocessed key, or
+        (None, 0) if no key can reach the threshold.
+        """
+        positions, bounds = self.shortlist(key, threshold)
+        best_pos, best_score = None, -1.0
+        for pos, bound in zip(positions.tolist(), bounds.tolist()):
+            if bound < best_score - 1e-9:
+                break
+            score = fuzz.ratio(key, self.keys[pos])
+            # Ties go to the earliest position, like extractOne
+            if score > best_score or (score == best_score and pos < best_pos):
+                best_pos, best_score = pos, score
+
+        if best_pos is None:
+            return None, 0
+        return best_pos, int(round(best_score))
@@ -0,0 +1,167 @@
+# llm_service/json_repair.py
+import json
+import re
+import typing
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+# Equivalent spellings of each gender; the schema decides which one is kept
+# (FrontSideCard uses English Literals, BackSideCard uses Devanagari ones).
+GENDER_SYNONYMS = [
+    {"male", "m", "पुरुष"},
+    {"female", "f", "महिला"},
+    {"other", "अन्य"},
+]
+
+NULL_STRINGS = {"", "null", "none", "n/a", "na", "-"}
+
+
+def _canonical_key(key: str) -> str:
+    """'Citizenship Number', 'Citizenship_Number' and "citizenship-number" map to the same key."""
+    return re.sub(r"[\W_]+", "", key).lower()
+
+
+def _strip_wrapping(raw: str) -> str:
+    """Remove markdown fences and any prose before the first '{'."""
+    text = raw.strip()
+    text = re.sub(r"^```(?:json)?\s*", "", text)
+    text = re.sub(r"\s*```$", "", text)
+    start = text.find("{")
+    return text[start:] if start != -1 else text
+
+
+def _close_truncated(text: str) -> str:
+    """
+    Close a JSON object that was cut off mid-generation (e.g. max_tokens hit).
+    Unterminated strings are closed, a dangling key (cut off before or after
+    its colon) or trailing comma is dropped and open brackets are closed in order.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    end = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                # Complete object - ignore trailing text
+                end = i + 1
+                break
+
+    if end is not None:
+        return text[:end]
+
+    if in_string:
+        text += '"'
+
+    # A string directly after '{' or ',' of an object is a key cut off before its ':'
+    if stack and stack[-1] == "}":
+        text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*$', r"\1", text)
+
+    # Drop a trailing comma or a key that never got its value
+    text = re.sub(r',\s*$', "", text.rstrip())
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    return text + "".join(reversed(stack))
+
+
+def _literal_choices(annotation) -> Tuple[str, ...]:
+    """Return the allowed values if the annotation is (Optional of) a Literal."""
+    if typing.get_origin(annotation) is typing.Literal:
+        return typing.get_args(annotation)
+    for arg in typing.get_args(annotation):
+        choices = _literal_choices(arg)
+        if choices:
+            return choices
+    return ()
+
+
+def _coerce_literal(value: str, choices: Tuple[str, ...]) -> Optional[str]:
+    """Map values like 'Male (पुरुष)' or 'M' onto the schema's Literal values."""
+    if value in choices:
+        return value
+    tokens = set(re.findall(r"[\w\u0900-\u097F]+", value.lower()))
+    for group in GENDER_SYNONYMS:
+        if tokens & group:
+            for choice in choices:
+                if choice.lower() in group:
+                    return choice
+    return None
+
+
+def repair_json(raw: str, response_model: Type[BaseModel]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Try to turn near-valid LLM output into a dict that validates against `response_model`.
+
+    Returns:
+        (data, fixes) where data is None if the output could not be parsed at all,
+        and fixes lists the repairs that were applied.
+    """
+    fixes = []
+    text = _strip_wrapping(raw or "")
+    if text != (raw or "").strip():
+        fixes.append("stripped_wrapping")
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        closed = _close_truncated(text)
+        try:
+            data = json.loads(closed)
+            fixes.append("closed_truncated")
+        except json.JSONDecodeError:
+            return None, fixes
+
+    if not isinstance(data, dict):
+        return None, fixes
+
+    repaired = {}
+    for key, value in data.items():
+        name, value = repair_field(key, value, response_model, fixes)
+        if name is not None:
+            repaired[name] = value
+
+    return repaired, fixes
+
+
+def repair_field(key: str, value: Any, response_model: Type[BaseModel], fixes: List[str]) -> Tuple[Optional[str], Any]:
+    """
+    One member of the output as repair_json keeps it: (schema field name, value),
+    or (None, None) for a key that matches no field. Applied repairs are appended to fixes.
+    """
+    fields = response_model.model_fields
+    name = key if key in fields else {_canonical_key(n): n for n in fields}.get(_canonical_key(key))
+    if name is None:
+        fixes.append(f"dropped_key:{key}")
+        return None, None
+    if name != key:
+        fixes.append(f"aliased_key:{key}")
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+        fixes.append(f"stringified:{name}")
+    elif isinstance(value, str) and value.strip().lower() in NULL_STRINGS:
+        value = None
+    elif value is not None and not isinstance(value, str):
+        value = None
+        fixes.append(f"nulled:{name}")
+
+    choices = _literal_choices(fields[name].annotation)
+    if choices and value is not None and value not in choices:
+        value = _coerce_literal(value, choices)
+        fixes.append(f"coerced_literal:{name}")
+
+    return name, value
@@ -0,0 +1,164 @@
+# metrics.py
+"""
+In-process request metrics, served in Prometheus text format from /metrics.
+
+Each service keeps its own registry: per-stage latency histograms, event
+counters and gauges read at scrape time (queue depths, cache stats). The
+request id arriving in the X-Request-ID header (or generated here at
+ingress) is exposed as request.state.request_id and echoed on the response
+so one card can be followed across preprocess -> ocr -> llm.
+"""
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_MAX_LEN = 64
+_REQUEST_ID_RE = re.compile(rf"^[A-Za-z0-9_-]{{1,{REQUEST_ID_MAX_LEN}}}$")
+
+# Histogram bucket upper bounds, milliseconds
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def request_id_from(value: Optional[str]) -> str:
+    """Reuse an upstream request id if it is safe to log and forward, else start a new one."""
+    if value and _REQUEST_ID_RE.match(value):
+        return value
+    return uuid.uuid4().hex
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(name: str, labels: Labels, value) -> str:
+    if labels:
+        inner = ",".join(f'{k}="{v}"' for k, v in labels)
+        return f"{name}{{{inner}}} {value}"
+    return f"{name} {value}"
+
+
+class Registry:
+    def __init__(self, prefix: str = "nagarikta"):
+        self.prefix = prefix
+        self.service = "unknown"
+        self._lock = threading.Lock()
+        self._histograms: Dict[Labels, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._callbacks: Dict[str, Tuple[str, Optional[str], Callable[[], object]]] = {}
+        self.in_flight = 0
+
+    def observe(self, stage: str, ms: float):
+        """Record one stage duration in milliseconds."""
+        key = _labels({"stage": stage})
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(BUCKETS_MS) + 2)
+            for i, bound in enumerate(BUCKETS_MS):
+                if ms <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += ms
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def register(self, name: str, kind: str, fn: Callable[[], object], label: Optional[str] = None):
+        """
+        Add a metric read at scrape time. kind is "gauge" or "counter"; fn
+        returns a number, or {label value: number} when label is given.
+        """
+        self._callbacks[name] = (kind, label, fn)
+
+    def render(self) -> str:
+        base = (("service", self.service),)
+        lines = []
+
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            counters = {n: dict(s) for n, s in self._counters.items()}
+
+        name = f"{self.prefix}_stage_duration_ms"
+        lines.append(f"# TYPE {name} histogram")
+        for labels, hist in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS, hist):
+                cumulative += count
+                lines.append(_format(f"{name}_bucket", base + labels + (("le", str(bound)),), cumulative))
+            lines.append(_format(f"{name}_bucket", base + labels + (("le", "+Inf"),), hist[-1]))
+            lines.append(_format(f"{name}_sum", base + labels, round(hist[-2], 3)))
+            lines.append(_format(f"{name}_count", base + labels, hist[-1]))
+
+        for short, series in sorted(counters.items()):
+            name = f"{self.prefix}_{short}_total"
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(_format(name, base + labels, value))
+
+        for short, (kind, label, fn) in sorted(self._callbacks.items()):
+            name = f"{self.prefix}_{short}_total" if kind == "counter" else f"{self.prefix}_{short}"
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Metric {short} failed: {e}")
+                continue
+            lines.append(f"# TYPE {name} {kind}")
+            if label:
+                for label_value, v in sorted(value.items()):
+                    lines.append(_format(name, base + ((label, str(label_value)),), v))
+            else:
+                lines.append(_format(name, base, value))
+
+        return "\n".join(lines) + "\n"
+
+    def install(self, app: FastAPI, service: str):
+        """Add request-id/in-flight middleware and the /metrics route to an app."""
+        self.service = service
+        self.register("requests_in_flight", "gauge", lambda: self.in_flight)
+
+        @app.middleware("http")
+        async def request_context(request: Request, call_next):
+            request.state.request_id = request_id_from(request.headers.get(REQUEST_ID_HEADER))
+            if request.url.path == "/metrics":
+                return await call_next(request)
+
+            self.in_flight += 1
+            status = 500
+            try:
+                response = await call_next(request)
+                status = response.status_code
+            finally:
+                self.in_flight -= 1
+                # Route templates keep label cardinality bounded
+                route = request.scope.get("route")
+                self.inc("http_requests", path=getattr(route, "path", "unmatched"), status=status)
+            response.headers[REQUEST_ID_HEADER] = request.state.request_id
+            return response
+
+        @app.get("/metrics", response_class=PlainTextResponse)
+        def metrics():
+            return self.render()
+
+
+registry = Registry()
@@ -0,0 +1,97 @@
+# llm_service/partial_json.py
+"""
+Incremental parsing of a JSON object as it is generated.
+
+The LLM streams the card as one flat JSON object. PartialObject is fed the
+text chunk by chunk and returns each top-level member as soon as its value
+is complete, so callers can act on a field while later ones are still being
+generated. A value counts as complete once the character after it (a comma
+or the closing brace) has arrived: "12" may still become "123".
+
+Text before the opening brace (markdown fences, prose) is skipped. Once the
+object is closed the rest of the stream is ignored; `closed` tells the
+caller it can stop generation.
+"""
+import json
+from typing import Any, List, Tuple
+
+_WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+class PartialObject:
+    def __init__(self):
+        self.text = ""
+        self.closed = False
+        self._pos = 0
+        # "start": before '{'; "key": expecting a key or '}'; "colon"; "value";
+        # "next": expecting ',' or '}' after a value
+        self._state = "start"
+        self._key = None
+
+    def _skip_whitespace(self):
+        while self._pos < len(self.text) and self.text[self._pos] in _WHITESPACE:
+            self._pos += 1
+
+    def _decode(self):
+        """The JSON value at the position and its end, or None if it is not complete yet."""
+        try:
+            value, end = _decoder.raw_decode(self.text, self._pos)
+        except json.JSONDecodeError:
+            return None
+        # A number or literal is only finished once something follows it
+        rest = self.text[end:].lstrip(_WHITESPACE)
+        if not rest:
+            return None
+        return value, end
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add generated text; returns the (key, value) members completed by it."""
+        self.text += chunk
+        completed = []
+        while not self.closed:
+            self._skip_whitespace()
+            if self._pos >= len(self.text):
+                break
+            ch = self.text[self._pos]
+
+            if self._state == "start":
+                if ch == "{":
+                    self._state = "key"
+                self._pos += 1
+            elif self._state == "key":
+                if ch == "}":
+                    self.closed = True
+                    self._pos += 1
+                    break
+                if ch == ",":  # tolerate a stray comma
+                    self._pos += 1
+                    continue
+                decoded = self._decode()
+                if decoded is None:
+                    break
+                key, self._pos = decoded
+                self._key = str(key)
+                self._state = "colon"
+            elif self._state == "colon":
+                if ch != ":":
+                    raise ValueError(f"Expected ':' after key {self._key!r} at offset {self._pos}")
+                self._pos += 1
+                self._state = "value"
+            elif self._state == "value":
+                decoded = self._decode()
+                if decoded is None:
+                    break
+                value, self._pos = decoded
+                completed.append((self._key, value))
+                self._state = "next"
+            else:  # "next"
+                if ch == ",":
+                    self._state = "key"
+                elif ch == "}":
+                    self.closed = True
+                else:
+                    raise ValueError(f"Expected ',' or '}}' at offset {self._pos}")
+                self._pos += 1
+        return completed
@@ -1,19 +1,104 @@
 # post_processing.py
 import json
-from thefuzz import process, fuzz
-from config import MUNI_JSON, VDC_JSON, EN_MUNI_JSON, EN_VDC_JSON
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple, List, Iterable
+
+import numpy as np
+from rapidfuzz import process, fuzz
+from rapidfuzz.utils import default_process
+from cpu_budget import budget
+from config import (
+    MUNI_JSON, VDC_JSON, EN_MUNI_JSON, EN_VDC_JSON,
+    ADDRESS_CACHE_SIZE, GAZETTEER_SEARCH, GAZETTEER_NGRAM, GAZETTEER_ARTIFACT,
+)
+from gazetteer_artifact import ScriptIndexes, read_artifact, source_checksum, write_artifact
+from gazetteer_index import CandidateIndex, NgramIndex
+
+
+def build_index(names: Iterable[str], entries: Iterable[Optional[dict]] = None) -> CandidateIndex:
+    names = tuple(names)
+    entries = tuple(entries) if entries is not None else (None,) * len(names)
+    return CandidateIndex(names, tuple(default_process(n) for n in names), entries)
+
+
+def best_matches(queries: List[str], index: CandidateIndex) -> List[Tuple[Optional[int], int]]:
+    """
+    Best (position, score) for each query against an index.
+
+    Equivalent to thefuzz's process.extractOne(query, names, scorer=fuzz.ratio):
+    same preprocessing, first maximum wins ties, score rounded to int. Choices
+    are preprocessed once at build time and many queries are scored in one
+    vectorized cdist call.
+    """
+    if not index.keys:
+        return [(None, 0)] * len(queries)
+
+    keys = [default_process(q) for q in queries]
+    if len(keys) == 1:
+        _, score, position = process.extractOne(keys[0], index.keys, scorer=fuzz.ratio, processor=None)
+        return [(position, int(round(score)))]
+
+    scores = process.cdist(keys, index.keys, scorer=fuzz.ratio, processor=None, dtype=np.float64,
+                           workers=budget.threads)
+    best = scores.argmax(axis=1)
+    return [(int(pos), int(round(scores[row, pos]))) for row, pos in enumerate(best)]
+
+
+class Resolution(NamedTuple):
+    district: str
+    place: Optional[dict]
+    confidence: int
+
+
+# Per-script matching thresholds: (district, place within district, global place)
+_RULES = {
+    "ne": (70, 70, 90),
+    "en": (75, 75, 90),
+}
+
+# Schema fields of each address on the card: (district, municipality/VDC, ward)
+ADDRESS_FIELDS = {
+    "Birth Place": ("Birth_Place_District", "Birth_Place_MetroPolitan_Sub_MetroPolitan_Municipality_VDC",
+                    "Birth_Place_Ward"),
+    "Permanent Address": ("Permanent_District", "Permanent_MetroPolitan_Sub_MetroPolitan_Municipality_VDC",
+                          "Permanent_Ward"),
+}
+
 
 class NepalAddressValidator:
-    def __init__(self):
+    def __init__(self, artifact: Optional[str] = GAZETTEER_ARTIFACT):
+        """
+        Loads the compiled gazetteer artifact when it matches the source JSON;
+        otherwise builds from the JSON and (re)writes the artifact. Pass
+        artifact=None to always build from the JSON.
+        """
+        self.source_checksum = source_checksum((MUNI_JSON, VDC_JSON, EN_MUNI_JSON, EN_VDC_JSON), GAZETTEER_NGRAM)
+
+        indexes = read_artifact(artifact, self.source_checksum, GAZETTEER_NGRAM) if artifact else None
+        if indexes is not None:
+            self._use_indexes(indexes)
+            self._hierarchies_from_indexes()
+            return
+
+        self._load_json()
+        self._use_indexes(self._build_indexes())
+        if artifact:
+            try:
+                self.compile_artifact(artifact)
+                print(f"Compiled gazetteer artifact: {artifact}")
+            except OSError as e:
+                print(f"Could not write gazetteer artifact {artifact}: {e}")
+
+    def _load_json(self):
         with open(MUNI_JSON, 'r', encoding='utf-8') as f:
-            self.muni = json.load(f)
+            muni = json.load(f)
         with open(VDC_JSON, 'r', encoding='utf-8') as f:
-            self.vdc = json.load(f)
+            vdc = json.load(f)
 
         with open(EN_MUNI_JSON, 'r', encoding='utf-8') as f:
-            self.en_muni = json.load(f)
+            en_muni = json.load(f)
         with open(EN_VDC_JSON, 'r', encoding='utf-8') as f:
-            self.en_vdc = json.load(f)
+            en_vdc = json.load(f)
 
         self.ne_district_list = []
         self.ne_hierarchy = {}  
@@ -21,13 +106,12 @@ class NepalAddressValidator:
 
         suffixes_ne = [" गाउँपालिका", " नगरपालिका", " उपमहानगरपालिका", " महानगरपालिका"]
 
-        for provinces, districts in self.muni.items():
+        for provinces, districts in muni.items():
             for dist, munis in districts.items():
 
-                if dist not in self.ne_district_list:
-                    self.ne_district_list.append(dist)
-                
+                # District list and hierarchy keys are always added together
                 if dist not in self.ne_hierarchy:
+                    self.ne_district_list.append(dist)
                     self.ne_hierarchy[dist] = []
 
                 for full_muni_name, wards in munis.items():
@@ -59,17 +143,15 @@ class NepalAddressValidator:
         suffixes_en = [" Metropolitan City", " Sub-Metropolitan City", " Municipality", " Rural Municipality"]
 
         # 1. Build Municipality Hierarchy
-        for provinces,districts in self.en_muni.items():
+        for provinces,districts in en_muni.items():
             for raw_dist_name, munis_dict in districts.items():
                 dist_norm = raw_dist_name.strip().title()
 
-                if dist_norm not in self.en_district_list:
-                    self.en_district_list.append(dist_norm)
-
                 if dist_norm not in self.en_hierarchy:
+                    self.en_district_list.append(dist_norm)
                     self.en_hierarchy[dist_norm] = {"munis": [], "vdcs": []}
 
-                for raw_muni_key in munis_dict.keys():
+                for raw_muni_key, wards in munis_dict.items():
                     full_name = raw_muni_key.strip() 
                     
                     # Extract Base Name
@@ -83,7 +165,8 @@ class NepalAddressValidator:
                         "base": base,       
                         "full": full_name,  
                         "district": dist_norm,
-                        "type": "muni"
+                        "type": "muni",
+                        "wards": wards
                     }
 
                     self.en_hierarchy[dist_norm]["munis"].append(entry)
@@ -91,13 +174,11 @@ class NepalAddressValidator:
                     self.en_global_map[base] = entry
 
         # Build VDC Hierarchy
-        for dist, vdc_list in self.en_vdc.items():
+        for dist, vdc_list in en_vdc.items():
             dist_norm = dist.strip().title()
 
-            if dist_norm not in self.en_district_list:
-                self.en_district_list.append(dist_norm)
-
             if dist_norm not in self.en_hierarchy:
+                self.en_district_list.append(dist_norm)
                 self.en_hierarchy[dist_norm] = {"munis": [], "vdcs": []}
 
             for vdc_raw in vdc_list:
@@ -108,7 +189,8 @@ class NepalAddressValidator:
                     "base": base,      
                     "full": full_name, 
                     "district": dist_norm,
-                    "type": "vdc"
+                    "type": "vdc",
+                    "wards": None
                 }
                 self.en_hierarchy[dist_norm]["vdcs"].append(entry)
 
@@ -116,11 +198,9 @@ class NepalAddressValidator:
                     self.en_global_map[base] = entry
 
         # B. Process VDCs
-        for dist, vdcs in self.vdc.items():
-            if dist not in self.ne_district_list:
-                self.ne_district_list.append(dist)
-            
+        for dist, vdcs in vdc.items():
             if dist not in self.ne_hierarchy:
+                self.ne_district_list.append(dist)
                 self.ne_hierarchy[dist] = []
 
             for vdc_name in vdcs:
@@ -138,154 +218,233 @@ class NepalAddressValidator:
                 if vdc_name not in self.ne_global_map:
                     self.ne_global_map[vdc_name] = entry
 
+    def _build_indexes(self) -> Dict[str, ScriptIndexes]:
+        """Precompute every candidate list the lookups search, once."""
+        for entries in self.ne_hierarchy.values():
+            for entry in entries:
+                entry["ward_set"] = frozenset(str(w) for w in entry["wards"]) if entry["wards"] else None
+        for local_data in self.en_hierarchy.values():
+            for entry in local_data["munis"] + local_data["vdcs"]:
+                entry["ward_set"] = frozenset(str(w) for w in entry["wards"]) if entry["wards"] else None
+
+        places = {
+            "ne": {
+                dist: build_index([x["base"] for x in entries], entries)
+                for dist, entries in self.ne_hierarchy.items()
+            },
+            # Combine Munis and VDCs for search (Munis are usually preferred)
+            "en": {
+                dist: build_index([x["base"] for x in d["munis"] + d["vdcs"]], d["munis"] + d["vdcs"])
+                for dist, d in self.en_hierarchy.items()
+            },
+        }
+        global_places = {
+            "ne": build_index(self.ne_global_map.keys(), self.ne_global_map.values()),
+            "en": build_index(self.en_global_map.keys(), self.en_global_map.values()),
+        }
+        return {
+            "ne": ScriptIndexes(build_index(self.ne_district_list), places["ne"], global_places["ne"],
+                                NgramIndex(global_places["ne"].keys, n=GAZETTEER_NGRAM)),
+            "en": ScriptIndexes(build_index(self.en_district_list), places["en"], global_places["en"],
+                                NgramIndex(global_places["en"].keys, n=GAZETTEER_NGRAM)),
+        }
 
-    def get_nepali_place(self, raw_district, raw_muni, raw_ward):
-        raw_district = (raw_district or "").strip()
-        raw_muni = (raw_muni or "").strip()
-
-        # Output defaults
-        result = {
-            "district": raw_district,
-            "municipality": raw_muni,
-            "ward": raw_ward,
-            "ward_valid": None,
-            "type": "unmatched",
-            "confidence": 0
+    def _use_indexes(self, indexes: Dict[str, ScriptIndexes]):
+        self._indexes = indexes
+        self._districts = {script: idx.districts for script, idx in indexes.items()}
+        self._district_sets = {script: frozenset(idx.districts.names) for script, idx in indexes.items()}
+        self._places = {script: idx.places for script, idx in indexes.items()}
+        self._global = {script: idx.global_places for script, idx in indexes.items()}
+        self._global_ngrams = {script: idx.global_ngrams for script, idx in indexes.items()}
+        self.global_search = GAZETTEER_SEARCH
+
+        self._resolve_cached = lru_cache(maxsize=ADDRESS_CACHE_SIZE)(self._resolve_one)
+
+    def _hierarchies_from_indexes(self):
+        """Rebuild the public district lists, hierarchies and global maps from loaded indexes."""
+        ne, en = self._indexes["ne"], self._indexes["en"]
+        self.ne_district_list = list(ne.districts.names)
+        self.ne_hierarchy = {dist: list(index.entries) for dist, index in ne.places.items()}
+        self.ne_global_map = dict(zip(ne.global_places.names, ne.global_places.entries))
+
+        self.en_district_list = list(en.districts.names)
+        self.en_hierarchy = {
+            dist: {
+                "munis": [e for e in index.entries if e["type"] == "muni"],
+                "vdcs": [e for e in index.entries if e["type"] == "vdc"],
+            }
+            for dist, index in en.places.items()
         }
+        self.en_global_map = dict(zip(en.global_places.names, en.global_places.entries))
+
+    def compile_artifact(self, path: str):
+        """Write this validator's gazetteer as a binary artifact (see gazetteer_artifact)."""
+        write_artifact(path, self.source_checksum, GAZETTEER_NGRAM, self._indexes)
+
+    def _exact_district(self, raw_district: str, script: str) -> Optional[str]:
+        candidate = raw_district.title() if script == "en" else raw_district
+        return candidate if candidate in self._district_sets[script] else None
+
+    def _global_matches(self, queries: List[str], script: str, threshold: int) -> List[Tuple[Optional[int], int]]:
+        """Best global (position, score) per query; both search modes agree at or above threshold."""
+        if self.global_search == "exhaustive":
+            return best_matches(queries, self._global[script])
+        ngrams = self._global_ngrams[script]
+        return [ngrams.best_match(default_process(q), threshold) for q in queries]
+
+    def _resolve_many(self, pairs: List[Tuple[str, str]], script: str) -> List[Resolution]:
+        """
+        Resolve stripped (district, municipality) pairs. Districts and places
+        are matched in one vectorized call per district rather than per pair.
+        """
+        district_threshold, place_threshold, global_threshold = _RULES[script]
 
-        if not raw_muni:
-            return result
-        
         # --- STEP 1: Resolve District ---
-        clean_district = None
-        if raw_district:
-            # Check exact match
-            if raw_district in self.ne_district_list:
-                clean_district = raw_district
+        clean = {}
+        fuzzy = []
+        for raw_district in {d for d, _ in pairs if d}:
+            exact = self._exact_district(raw_district, script)
+            if exact:
+                clean[raw_district] = exact
             else:
-                # Fuzzy match District
-                best_dist, score = process.extractOne(raw_district, self.ne_district_list, scorer=fuzz.ratio)
-                if score >= 70:
-                    clean_district = best_dist
-                    result["district"] = clean_district
+                fuzzy.append(raw_district)
+        if fuzzy:
+            districts = self._districts[script]
+            for raw_district, (pos, score) in zip(fuzzy, best_matches(fuzzy, districts)):
+                if score >= district_threshold:
+                    clean[raw_district] = districts.names[pos]
 
         # --- STEP 2: Scoped Search (Within District) ---
-        found_place = None
-        match_score = 0
-
-        if clean_district and clean_district in self.ne_hierarchy:
-            # Get all Munis/VDCs for this district
-            candidates = self.ne_hierarchy[clean_district] # List of dicts
-            candidate_names = [x["base"] for x in candidates]
-
-            # Fuzzy match the base name
-            best_base, score = process.extractOne(raw_muni, candidate_names, scorer=fuzz.ratio)
-            
-            if score >= 70:
-                match_score = score
-                # Find the full object corresponding to the name
-                for x in candidates:
-                    if x["base"] == best_base:
-                        found_place = x
-                        break
-
-            # --- STEP 3: Global Fallback (If Step 2 Failed) ---
-        if not found_place:
-            return result
-        
-        if not found_place and not clean_district:
-            all_bases = list(self.ne_global_map.keys())
-            best_base, score = process.extractOne(raw_muni, all_bases, scorer=fuzz.ratio)
-            
-            # Require higher confidence for global search to avoid false positives
-            if score >= 90: 
-                match_score = score
-                found_place = self.ne_global_map[best_base]
+        by_district = {}
+        for raw_district, raw_muni in pairs:
+            clean_district = clean.get(raw_district)
+            if clean_district in self._places[script]:
+                by_district.setdefault(clean_district, set()).add(raw_muni)
+
+        found = {}
+        for clean_district, munis in by_district.items():
+            munis = list(munis)
+            places = self._places[script][clean_district]
+            for raw_muni, (pos, score) in zip(munis, best_matches(munis, places)):
+                if score >= place_threshold:
+                    found[(clean_district, raw_muni)] = (places.entries[pos], score)
+
+        # --- STEP 3: Global Fallback (district unresolved) ---
+        global_found = {}
+        orphans = list({m for d, m in pairs if not clean.get(d)})
+        if orphans:
+            places = self._global[script]
+            for raw_muni, (pos, score) in zip(orphans, self._global_matches(orphans, script, global_threshold)):
+                # Require higher confidence for global search to avoid false positives
+                if score >= global_threshold:
+                    global_found[raw_muni] = (places.entries[pos], score)
+
+        results = []
+        for raw_district, raw_muni in pairs:
+            clean_district = clean.get(raw_district)
+            if clean_district:
+                place, score = found.get((clean_district, raw_muni), (None, 0))
+                results.append(Resolution(clean_district, place, score))
+            elif raw_muni in global_found:
+                place, score = global_found[raw_muni]
                 # Update district since the original was likely wrong
-                result["district"] = found_place["district"]
-
-
-        # --- STEP 4: Finalize & Validate Ward ---
-        if found_place:
-            result["municipality"] = found_place["full"]
-            result["type"] = found_place["type"]
-            result["confidence"] = match_score
-            
-            # Check Ward validity (Only possible if we have a ward list, i.e., Modern Muni)
-            if raw_ward and found_place["wards"]:
-                if str(raw_ward) in [str(w) for w in found_place["wards"]]:
-                    result["ward_valid"] = True
-                else:
-                    result["ward_valid"] = False
+                results.append(Resolution(place["district"], place, score))
             else:
-                # VDCs don't have ward data in JSON, or ward was missing
-                result["ward_valid"] = None 
+                results.append(Resolution(raw_district, None, 0))
+        return results
 
-        return result
-        
+    def _resolve_one(self, raw_district: str, raw_muni: str, script: str) -> Resolution:
+        return self._resolve_many([(raw_district, raw_muni)], script)[0]
 
-    def get_english_place(self, raw_muni, raw_district, raw_ward):
-        
-        raw_muni = raw_muni.strip()
-        raw_district = raw_district.strip() if raw_district else ""
-        
-        # Output defaults
+    @staticmethod
+    def _place_result(resolution: Resolution, raw_muni: str, raw_ward) -> dict:
+        place = resolution.place
         result = {
-            "district": raw_district,
+            "district": resolution.district,
             "municipality": raw_muni,
             "ward": raw_ward,
             "ward_valid": None,
             "type": "unmatched",
             "confidence": 0
         }
+        if place:
+            result["municipality"] = place["full"]
+            result["type"] = place["type"]
+            result["confidence"] = resolution.confidence
 
-        if not raw_muni:
-            return raw_district, None
+            # Check Ward validity (Only possible if we have a ward list, i.e., Modern Muni)
+            if raw_ward and place["ward_set"]:
+                result["ward_valid"] = str(raw_ward) in place["ward_set"]
+        return result
 
-        # Step 1: Resolve District
-        clean_district = None
-        if raw_district:
-            # Check exact match
-            if raw_district.title() in self.en_district_list:
-                clean_district = raw_district.title()
-            else:
-                # Fuzzy match District
-                best_dist, score = process.extractOne(raw_district, self.en_district_list, scorer=fuzz.ratio)
-                if score >= 75:
-                    clean_district = best_dist
-        
-        # Step 2: Search within District (High Confidence)
-        if clean_district and clean_district in self.en_hierarchy:
-            local_data = self.en_hierarchy[clean_district]
-            
-            # Combine Munis and VDCs for search (Munis are usually preferred)
-            candidates = local_data["munis"] + local_data["vdcs"]
-            candidate_names = [x["base"] for x in candidates]
-
-            # Fuzzy match against base names
-            best_muni_base, score = process.extractOne(raw_muni, candidate_names, scorer=fuzz.ratio)
-
-            # If we found a good match inside the district
-            if score >= 75:
-                # Retrieve full object
-                for x in candidates:
-                    if x["base"] == best_muni_base:
-                        return clean_district, x["full"]
-        
-            return clean_district, raw_muni
+    def get_nepali_place(self, raw_district, raw_muni, raw_ward):
+        raw_district = (raw_district or "").strip()
+        raw_muni = (raw_muni or "").strip()
 
-        if not clean_district and raw_muni:
-            all_bases = list(self.en_global_map.keys())
-            best_base, score = process.extractOne(raw_muni, all_bases, scorer=fuzz.ratio)
+        if not raw_muni:
+            return self._place_result(Resolution(raw_district, None, 0), raw_muni, raw_ward)
 
-            # Very high threshold for global search to prevent false positives
-            if score >= 90: 
-                match = self.en_global_map[best_base]
-                return match["district"], match["full"]
+        resolution = self._resolve_cached(raw_district, raw_muni, "ne")
+        return self._place_result(resolution, raw_muni, raw_ward)
 
-        # Step 4: No match found, return raw data
-        return clean_district or raw_district, raw_muni
+    def get_english_place(self, raw_muni, raw_district, raw_ward):
+        raw_muni = (raw_muni or "").strip()
+        raw_district = raw_district.strip() if raw_district else ""
+
+        if not raw_muni:
+            return raw_district, None
 
+        resolution = self._resolve_cached(raw_district, raw_muni, "en")
+        if resolution.place:
+            return resolution.district, resolution.place["full"]
+        # No match found, return raw data
+        return resolution.district, raw_muni
+
+    def cache_stats(self) -> dict:
+        """Cumulative hits/misses of the single-lookup address cache."""
+        info = self._resolve_cached.cache_info()
+        return {"hit": info.hits, "miss": info.misses}
+
+    def resolve_batch(self, rows: Iterable[Tuple], script: str = "ne") -> List[dict]:
+        """
+        Resolve many (district, municipality, ward) rows in one call.
+
+        Duplicate pairs are matched once and all pairs in a district share a
+        single vectorized scoring pass. Returns one get_nepali_place-style dict
+        per row (district, municipality, ward, ward_valid, type, confidence).
+        """
+        if script not in _RULES:
+            raise ValueError(f"Unknown script: {script}")
+
+        cleaned = [((d or "").strip(), (m or "").strip(), w) for d, m, w in rows]
+        pairs = list({(d, m) for d, m, _ in cleaned if m})
+        resolved = dict(zip(pairs, self._resolve_many(pairs, script)))
+
+        results = []
+        for raw_district, raw_muni, raw_ward in cleaned:
+            resolution = resolved.get((raw_district, raw_muni), Resolution(raw_district, None, 0))
+            results.append(self._place_result(resolution, raw_muni, raw_ward))
+        return results
+
+    def resolve_address(self, raw_data: dict, address: str, side: str) -> dict:
+        """
+        One ADDRESS_FIELDS address of the LLM output, resolved as post_process
+        does it (and through the same cache), so it can be done as soon as the
+        address's fields are generated.
+        """
+        district_key, muni_key, ward_key = ADDRESS_FIELDS[address]
+        district, muni, ward = raw_data.get(district_key), raw_data.get(muni_key), raw_data.get(ward_key)
+        if side == "front":
+            place = self.get_nepali_place(district, muni, ward)
+            return {
+                "District": place["district"] or district,
+                "Municipality/VDC": place["municipality"] or muni,
+                "Ward": place["ward"] or ward,
+                "type": place["type"],
+                "confidence": place["confidence"],
+            }
+        resolved_district, resolved_muni = self.get_english_place(muni, district, ward)
+        return {"District": resolved_district or district, "Municipality/VDC": resolved_muni or muni, "Ward": ward}
 
     def post_process(self, raw_data: dict, side:str) -> dict:
         MUNI_KEY = "Birth_Place_MetroPolitan_Sub_MetroPolitan_Municipality_VDC"
@@ -0,0 +1,282 @@
+# loadtest/run_loadtest.py
+"""
+Offline end-to-end load test for the /preprocess -> /ocr -> /extract chain.
+
+Starts the three FastAPI services plus a stub Ollama locally, replays a
+directory of card images at a fixed rate/concurrency and reports throughput
+and p50/p95/p99 latency per stage and end to end.
+
+    python loadtest/run_loadtest.py --images ./samples --requests 200 \\
+        --concurrency 8 --rate 4 --llm-latency-ms 3000 --stub-ocr
+
+Use --target to replay against an already running deployment instead.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LOADTEST_DIR = Path(__file__).resolve().parent
+GAZETTEER_FILES = (
+    "nepal_municipalities_by_district.json",
+    "nepal_vdcs_by_district.json",
+    "en_nepal_municipalities_by_district.json",
+    "en_nepal_vdcs_by_district.json",
+)
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class ServiceStack:
+    """Runs stub Ollama, llm_service, ocr_service and preprocess_service as local processes."""
+
+    def __init__(self, args, work_dir: Path):
+        self.args = args
+        self.work_dir = work_dir
+        self.procs = []
+        base = args.base_port
+        self.ports = {
+            "preprocess_service": base,
+            "ocr_service": base + 1,
+            "llm_service": base + 2,
+            "stub_ollama": base + 3,
+        }
+
+    @property
+    def preprocess_url(self):
+        return f"http://127.0.0.1:{self.ports['preprocess_service']}/preprocess"
+
+    def _spawn(self, name, module, cwd, extra_env):
+        env = dict(os.environ)
+        env.update(extra_env)
+        log = open(self.work_dir / f"{name}.log", "w")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1",
+             "--port", str(self.ports[name]), "--log-level", "warning"],
+            cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        self.procs.append((name, proc, log))
+
+    def _wait_healthy(self, name, path="/health"):
+        url = f"http://127.0.0.1:{self.ports[name]}{path}"
+        deadline = time.monotonic() + self.args.startup_timeout
+        proc = next(p for n, p, _ in self.procs if n == name)
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{name} exited during startup, see {self.work_dir / (name + '.log')}")
+            try:
+                if httpx.get(url, timeout=2).status_code == 200:
+                    print(f"  {name} ready on :{self.ports[name]}")
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"{name} not healthy after {self.args.startup_timeout}s")
+
+    def start(self):
+        data_dir = str(self.work_dir)
+        for name in GAZETTEER_FILES:
+            shutil.copy(REPO_ROOT / "shared_data" / name, self.work_dir / name)
+
+        print("Starting services...")
+        self._spawn("stub_ollama", "stub_ollama:app", LOADTEST_DIR, {
+            "STUB_LLM_LATENCY_MS": str(self.args.llm_latency_ms),
+        })
+        self._wait_healthy("stub_ollama", "/v1/models")
+
+        self._spawn("llm_service", "app:app", REPO_ROOT / "llm_service", {
+            "OLLAMA_HOST": "127.0.0.1",
+            "OLLAMA_PORT": str(self.ports["stub_ollama"]),
+            "DATA_PATH": data_dir,
+        })
+        self._wait_healthy("llm_service")
+
+        ocr_env = {
+            "SHARED_DATA_PATH": data_dir,
+            "LLM_SERVICE_URL": f"http://127.0.0.1:{self.ports['llm_service']}/extract",
+        }
+        if self.args.stub_ocr:
+            ocr_env["OCR_ENGINE"] = "stub"
+            ocr_env["OCR_STUB_LATENCY_MS"] = str(self.args.ocr_latency_ms)
+        self._spawn("ocr_service", "app:app", REPO_ROOT / "ocr_service", ocr_env)
+        self._wait_healthy("ocr_service")
+
+        self._spawn("preprocess_service", "app:app", REPO_ROOT / "preprocess_service", {
+            "SHARED_DATA_PATH": data_dir,
+            "MODELS_PATH": os.getenv("MODELS_PATH", str(REPO_ROOT / "models")),
+            "OCR_SERVICE_URL": f"http://127.0.0.1:{self.ports['ocr_service']}/ocr",
+        })
+        self._wait_healthy("preprocess_service")
+
+    def stop(self):
+        for _, proc, log in reversed(self.procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+
+
+def load_images(image_dir: Path):
+    paths = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise SystemExit(f"No images found in {image_dir}")
+    return [(p.name, p.read_bytes()) for p in paths]
+
+
+def collect_stages(body: dict) -> dict:
+    """Flatten the per-service timings_ms blocks into one {stage: ms} dict."""
+    stages = dict(body.get("timings_ms") or {})
+    metadata = (body.get("result") or {}).get("metadata") or {}
+    stages.update(metadata.get("timings_ms") or {})
+    return stages
+
+
+async def replay(url, images, args):
+    samples = {"end_to_end": [], "client_queue": []}
+    errors = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+
+        async def one(i, scheduled):
+            name, data = images[i % len(images)]
+            async with semaphore:
+                sent = time.perf_counter()
+                samples["client_queue"].append((sent - scheduled) * 1000)
+                try:
+                    resp = await client.post(url, files={"file": (name, data)})
+                    status = resp.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                elapsed = (time.perf_counter() - sent) * 1000
+
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+                return
+            samples["end_to_end"].append(elapsed)
+            for stage, ms in collect_stages(resp.json()).items():
+                samples.setdefault(stage, []).append(ms)
+
+        start = time.perf_counter()
+        tasks = []
+        for i in range(args.requests):
+            scheduled = start + (i / args.rate if args.rate else 0)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(i, max(scheduled, start))))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+
+    return samples, errors, wall
+
+
+def build_report(samples, errors, wall, args):
+    ok = len(samples["end_to_end"])
+    report = {
+        "requests": args.requests,
+        "succeeded": ok,
+        "errors": {str(k): v for k, v in errors.items()},
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(ok / wall, 3) if wall else 0.0,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "stages": {},
+    }
+    for stage, values in samples.items():
+        values = sorted(values)
+        if not values:
+            continue
+        report["stages"][stage] = {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 2),
+            "p50": round(percentile(values, 50), 2),
+            "p95": round(percentile(values, 95), 2),
+            "p99": round(percentile(values, 99), 2),
+        }
+    return report
+
+
+def print_report(report):
+    print()
+    print(f"Requests: {report['requests']}  OK: {report['succeeded']}  Errors: {report['errors'] or 0}")
+    print(f"Wall time: {report['wall_seconds']}s  Throughput: {report['throughput_rps']} req/s")
+    print()
+    print(f"{'stage':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<16}{s['count']:>8}{s['mean']:>10}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, type=Path, help="directory of card images to replay")
+    parser.add_argument("--requests", type=int, default=None, help="total requests (default: one per image)")
+    parser.add_argument("--concurrency", type=int, default=4, help="max in-flight requests")
+    parser.add_argument("--rate", type=float, default=0.0, help="arrival rate in req/s (0 = closed loop)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--llm-latency-ms", type=int, default=0, help="stub Ollama response delay")
+    parser.add_argument("--stub-ocr", action="store_true", help="replace PaddleOCR/Tesseract with the stub engine")
+    parser.add_argument("--ocr-latency-ms", type=int, default=0, help="stub OCR delay (with --stub-ocr)")
+    parser.add_argument("--base-port", type=int, default=18000, help="first of four local ports to use")
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="seconds to wait for each service")
+    parser.add_argument("--target", default=None, help="existing /preprocess URL; skips starting services")
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report here")
+    parser.add_argument("--keep-artifacts", action="store_true", help="keep the work directory and service logs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    images = load_images(args.images)
+    if args.requests is None:
+        args.requests = len(images)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="nagarikta-loadtest-"))
+    stack = None
+    try:
+        if args.target:
+            url = args.target
+        else:
+            stack = ServiceStack(args, work_dir)
+            stack.start()
+            url = stack.preprocess_url
+
+        print(f"Replaying {args.requests} requests from {len(images)} images against {url}")
+        samples, errors, wall = asyncio.run(replay(url, images, args))
+        report = build_report(samples, errors, wall, args)
+        print_report(report)
+
+        if args.output:
+            args.output.write_text(json.dumps(report, indent=2))
+            print(f"\nReport written to {args.output}")
+    finally:
+        if stack:
+            stack.stop()
+        if args.keep_artifacts:
+            print(f"Artifacts and logs kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
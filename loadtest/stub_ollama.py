@@ -0,0 +1,136 @@
+# loadtest/stub_ollama.py
+"""
+Deterministic stand-in for Ollama's OpenAI-compatible API.
+
+Answers /v1/chat/completions with a fixed, schema-valid card after a
+configurable delay so the service chain can be load-tested without a model:
+
+    STUB_LLM_LATENCY_MS=2000 uvicorn stub_ollama:app --port 11434
+
+With "stream": true the card is sent as server-sent chunks of
+STUB_LLM_CHUNK_CHARS characters, the latency spread evenly over them, followed
+by STUB_LLM_TRAILING_TOKENS whitespace chunks like those a model may generate
+after the object before it stops.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_LLM_LATENCY_MS = int(os.getenv("STUB_LLM_LATENCY_MS", "0"))
+STUB_LLM_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b")
+STUB_LLM_CHUNK_CHARS = int(os.getenv("STUB_LLM_CHUNK_CHARS", "4"))
+STUB_LLM_TRAILING_TOKENS = int(os.getenv("STUB_LLM_TRAILING_TOKENS", "0"))
+
+# Values match the stub OCR text and real gazetteer entries, so
+# post-processing does the same fuzzy-matching work as on a real card.
+FRONT_CARD = {
+    "Name": "राम बहादुर थापा",
+    "Citizenship_Number": "३९-०१-७६-०८९९९",
+    "Date_of_Birth_DOB": "२०४५ महिना: ०२ गते २८",
+    "Fathers_Name": "हरि बहादुर थापा",
+    "Mothers_Name": "सीता थापा",
+    "Gender": "Male",
+    "Spouse_Name": None,
+    "Birth_Place_District": "काठमाण्डौ",
+    "Birth_Place_MetroPolitan_Sub_MetroPolitan_Municipality_VDC": "काठमाण्डौ",
+    "Birth_Place_Ward": "५",
+    "Permanent_District": "ललितपुर",
+    "Permanent_MetroPolitan_Sub_MetroPolitan_Municipality_VDC": "गोदावरी",
+    "Permanent_Ward": "३",
+}
+
+BACK_CARD = {
+    "Name": "Ram Bahadur Thapa",
+    "Citizenship_Number": "39-01-76-08999",
+    "Date_of_Birth_DOB": "1988/06/11",
+    "Gender": "पुरुष",
+    "Birth_Place_District": "Kathmandu",
+    "Birth_Place_MetroPolitan_Sub_MetroPolitan_Municipality_VDC": "Kathmandu",
+    "Birth_Place_Ward": "5",
+    "Permanent_District": "Lalitpur",
+    "Permanent_MetroPolitan_Sub_MetroPolitan_Municipality_VDC": "Godawari",
+    "Permanent_Ward": "3",
+    "Issued_Date": "2006/05/14",
+}
+
+app = FastAPI(title="Stub Ollama (OpenAI-compatible)")
+
+
+def _card_for(body: dict) -> dict:
+    """Pick the canned card from the requested JSON schema, or the system prompt."""
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema") or {}
+    properties = schema.get("properties")
+    if properties:
+        card = BACK_CARD if "Issued_Date" in properties else FRONT_CARD
+        return {key: card.get(key) for key in properties}
+
+    system = next((m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system"), "")
+    return BACK_CARD if "Back side" in system else FRONT_CARD
+
+
+def _stream(body: dict, content: str):
+    """The completion as OpenAI-style chat.completion.chunk server-sent events."""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    pieces = [content[i:i + STUB_LLM_CHUNK_CHARS] for i in range(0, len(content), STUB_LLM_CHUNK_CHARS)]
+    pieces += ["\n"] * STUB_LLM_TRAILING_TOKENS
+    delay = STUB_LLM_LATENCY_MS / 1000 / len(pieces)
+
+    def event(delta: dict, finish_reason=None) -> str:
+        chunk = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", STUB_LLM_MODEL),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    async def events():
+        yield event({"role": "assistant", "content": ""})
+        for piece in pieces:
+            if delay:
+                await asyncio.sleep(delay)
+            yield event({"content": piece})
+        yield event({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    content = json.dumps(_card_for(body), ensure_ascii=False)
+    if body.get("stream"):
+        return _stream(body, content)
+
+    if STUB_LLM_LATENCY_MS:
+        await asyncio.sleep(STUB_LLM_LATENCY_MS / 1000)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", STUB_LLM_MODEL),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content), "total_tokens": len(content)},
+    }
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": STUB_LLM_MODEL, "object": "model", "owned_by": "stub"}]}
+
+
+@app.get("/api/tags")
+def tags():
+    return {"models": [{"name": STUB_LLM_MODEL}]}
@@ -1,21 +1,50 @@
 # ocr_service/app.py
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+# Sets the thread limits the native libraries read at import, so it comes first
+from cpu_budget import budget
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import httpx
+import asyncio
+import json
+import time
+import uuid
 from datetime import datetime
+from functools import partial
 from pydantic import BaseModel
+from typing import Optional
 
 from pathlib import Path
-from config import OCR_TEXT_PATH, LLM_SERVICE_URL
+from config import (
+    OCR_TEXT_PATH, LLM_SERVICE_URL, PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS,
+    ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT_S,
+    MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_TTL_S, MODEL_PIN, MODEL_PRELOAD,
+)
 from run_ocr import run_ocr_for_path
+from engine_policy import policy
+from storage import storage, ObjectNotFound
+from metrics import registry
+from model_registry import models
+from profiling import profiler, downstream_headers
+from admission import admission
 
 
 app = FastAPI()
+admission.install(app, ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT_S, registry)
+profiler.install(app, "ocr_service", PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS)
+registry.install(app, "ocr_service")
+registry.register("cpu_threads", "gauge", lambda: budget.threads)
+models.install(app, MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_TTL_S, MODEL_PIN, MODEL_PRELOAD, registry)
 
 class OCRInput(BaseModel):
-    image_path: str
+    # image_key (an object storage key) is what preprocess_service sends;
+    # image_path still works where both services share a volume
+    image_key: Optional[str] = None
+    image_path: Optional[str] = None
     card_side: str
+    # Higher-resolution copy of the same image for re-reading low-confidence lines
+    detail_key: Optional[str] = None
 
 def check_ocr_text_file(file_path: Path) -> bool:
     """Check if the OCR text in the file is valid (not empty or too short)"""
@@ -34,12 +63,13 @@ def check_ocr_text_file(file_path: Path) -> bool:
         print(f"Warning: Failed to check OCR text file: {e}")
         return False
 
-def save_ocr_text(text: str, image_path: str, card_side: str, engine: str):
+def save_ocr_text(text: str, image_path: str, card_side: str, engine: str, request_id: str):
     """Save raw OCR output to a text file with timestamp"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  
     image_name = Path(image_path).stem
 
-    filename = f"OCR-output_{timestamp}_{image_name}.txt"
+    # Named by the server; the (client-supplied) request id goes in the header below
+    filename = f"OCR-output_{timestamp}_{uuid.uuid4().hex[:12]}_{image_name}.txt"
     file_path = OCR_TEXT_PATH / filename
 
     try:
@@ -48,6 +78,7 @@ def save_ocr_text(text: str, image_path: str, card_side: str, engine: str):
             f.write(f"Image: {image_path}\n")
             f.write(f"Card Side: {card_side}\n")
             f.write(f"OCR Engine: {engine}\n")
+            f.write(f"Request ID: {request_id}\n")
             f.write(f"Timestamp: {datetime.now().isoformat()}\n")
             f.write("="*50 + "\n\n")
             f.write(text.strip())
@@ -56,43 +87,57 @@ def save_ocr_text(text: str, image_path: str, card_side: str, engine: str):
         print(f"Warning: Failed to save OCR text: {e}")
 
 
-@app.post("/ocr")
-async def ocr_entry(input_data: OCRInput):
-    """
-    Expects:
-    {
-        "image_path": "/absolute/path/to/cropped_image.png"
-    }
-    
-    Output:
-        Final JSON from LLM service
-    """
-
+def _existing_image(input_data: OCRInput) -> Path:
+    """Local path of the input image, fetched from object storage (or its cache) when given a key."""
+    if input_data.image_key:
+        try:
+            return Path(storage.local_path(input_data.image_key))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ObjectNotFound:
+            raise HTTPException(status_code=404, detail=f"Image does not exist: {input_data.image_key}")
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Image fetch failed: {type(e).__name__}: {e}")
+    if not input_data.image_path:
+        raise HTTPException(status_code=422, detail="image_key or image_path is required")
     image_path = Path(input_data.image_path)
-    card_side = input_data.card_side
-
     if not image_path.exists():
         raise HTTPException(status_code=404, detail=f"Image does not exist: {image_path}")
+    return image_path
 
-    # --- 1. Run OCR ---
+
+def _detail_image(key: str) -> Optional[str]:
+    """Local path of the detail image; None (OCR goes on without it) when it cannot be had."""
     try:
-        ocr_text, engine_used = run_ocr_for_path(str(image_path), card_side)
+        return storage.local_path(key)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OCR failed: {e}")
-    
-    saved_path = save_ocr_text(ocr_text, str(image_path), card_side, engine_used)
+        print(f"Warning: detail image {key} unavailable: {type(e).__name__}: {e}")
+        return None
 
-    # --- 2. Send OCR text to LLM Microservice ---
+
+def _detail(input_data: OCRInput):
+    """The detail image for run_ocr, fetched only if a line is re-read."""
+    return partial(_detail_image, input_data.detail_key) if input_data.detail_key else None
+
+
+async def call_llm(ocr_text: str, card_side: str, request: Request):
+    """Send OCR text to the LLM service; returns (its JSON, call duration in ms)."""
+    t_llm = time.perf_counter()
     try:
         async with httpx.AsyncClient(timeout=300) as client:
             llm_response = await client.post(
                 LLM_SERVICE_URL,
-                json={"text": ocr_text, "card_side": card_side}
+                json={"text": ocr_text, "card_side": card_side},
+                headers=downstream_headers(request),
             )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed connecting to LLM service: {e}")
     
 
+    if llm_response.status_code == 429:
+        # Shed load upstream too rather than turning it into an error
+        raise HTTPException(status_code=429, detail="LLM service is at capacity",
+                            headers={"Retry-After": llm_response.headers.get("Retry-After", "1")})
     if llm_response.status_code != 200:
         raise HTTPException(
             status_code=500,
@@ -100,21 +145,122 @@ async def ocr_entry(input_data: OCRInput):
         )
 
     final_json = llm_response.json()
+    llm_call_ms = (time.perf_counter() - t_llm) * 1000
+    registry.observe("llm_call", llm_call_ms)
+
+    return final_json, llm_call_ms
 
+
+def annotate(final_json: dict, request_id: str, engine_used: str, card_side: str, saved_path,
+             ocr_ms: float, llm_call_ms: float):
+    """Add this service's metadata to the LLM service's response."""
     if "metadata" not in final_json:
         final_json["metadata"] = {}
     
+    final_json["metadata"]["request_id"] = request_id
     final_json["metadata"]["ocr_engine"] = engine_used
     final_json["metadata"]["card_side"] = card_side
     if saved_path:
         final_json["metadata"]["ocr_output_file"] = saved_path
 
+    timings = final_json["metadata"].setdefault("timings_ms", {})
+    timings["ocr"] = round(ocr_ms, 2)
+    timings["llm_call"] = round(llm_call_ms, 2)
+
+
+@app.post("/ocr")
+async def ocr_entry(input_data: OCRInput, request: Request):
+    """
+    Expects:
+    {
+        "image_key": "3f/3f9a...c2.png",   (object storage key, see storage.py)
+        "card_side": "front"
+    }
+    or "image_path": "/absolute/path/to/cropped_image.png" instead of image_key.
+    
+    Output:
+        Final JSON from LLM service
+    """
+
+    image_path = await run_in_threadpool(_existing_image, input_data)
+    card_side = input_data.card_side
+    request_id = request.state.request_id
+
+    # --- 1. Run OCR ---
+    t_ocr = time.perf_counter()
+    try:
+        # In a thread: OCR takes seconds, and on the event loop it would stall
+        # every other request, admission's queue and 429s included
+        ocr_text, engine_used = await run_in_threadpool(run_ocr_for_path, str(image_path), card_side,
+                                                           _detail(input_data))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR failed: {e}")
+    ocr_ms = (time.perf_counter() - t_ocr) * 1000
+    registry.observe("ocr", ocr_ms)
+
+    saved_path = save_ocr_text(ocr_text, str(image_path), card_side, engine_used, request_id)
+
+    # --- 2. Send OCR text to LLM Microservice ---
+    final_json, llm_call_ms = await call_llm(ocr_text, card_side, request)
+    annotate(final_json, request_id, engine_used, card_side, saved_path, ocr_ms, llm_call_ms)
+
     return JSONResponse(final_json)
 
+
+def ndjson(event: str, **data) -> bytes:
+    return json.dumps({"event": event, **data}, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+@app.post("/ocr/stream")
+async def ocr_stream(input_data: OCRInput, request: Request):
+    """
+    Same work as /ocr, streamed as NDJSON events: "ocr" with the raw text as
+    soon as OCR finishes, then "result" with what /ocr returns, or "error".
+    A client disconnect cancels the pending LLM call.
+    """
+    image_path = await run_in_threadpool(_existing_image, input_data)
+    card_side = input_data.card_side
+    request_id = request.state.request_id
+
+    async def events():
+        try:
+            t_ocr = time.perf_counter()
+            try:
+                # In a thread, so the event can be flushed and a disconnect noticed
+                ocr_text, engine_used = await run_in_threadpool(run_ocr_for_path, str(image_path), card_side,
+                                                                   _detail(input_data))
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"OCR failed: {e}")
+            ocr_ms = (time.perf_counter() - t_ocr) * 1000
+            registry.observe("ocr", ocr_ms)
+            saved_path = save_ocr_text(ocr_text, str(image_path), card_side, engine_used, request_id)
+
+            yield ndjson("ocr", request_id=request_id, card_side=card_side, ocr_engine=engine_used,
+                         text=ocr_text, timings_ms={"ocr": round(ocr_ms, 2)})
+
+            final_json, llm_call_ms = await call_llm(ocr_text, card_side, request)
+            annotate(final_json, request_id, engine_used, card_side, saved_path, ocr_ms, llm_call_ms)
+            yield ndjson("result", result=final_json)
+        except HTTPException as e:
+            yield ndjson("error", status_code=e.status_code, detail=e.detail)
+        except Exception as e:
+            yield ndjson("error", status_code=500, detail=f"{type(e).__name__}: {e}")
+        except asyncio.CancelledError:
+            registry.inc("stream_disconnects")
+            print(f"Client disconnected, cancelled {request_id}")
+            raise
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/ocr/stats")
+def ocr_stats():
+    """Per-side engine outcomes the OCR engine policy has recorded, and the order each side gets now."""
+    return policy.snapshot()
+
 @app.get("/health")
 def health():
     """Health check endpoint for Docker"""
-    return {"status": "running", "service": "ocr_service"}
+    return {"status": "running", "service": "ocr_service", "capacity": admission.capacity()}
 
 if __name__ == "__main__":
     uvicorn.run(
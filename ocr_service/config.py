@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 
 # Shared data path (from environment or default)
 SHARED_DATA_PATH = os.getenv("SHARED_DATA_PATH", "/app/shared_data")
@@ -14,8 +15,103 @@ os.makedirs(SHARED_DATA_PATH, exist_ok=True)
 # OCR Text output path
 OCR_TEXT_PATH = Path(SHARED_DATA_PATH)
 
+# OCR engine: "paddle" (PaddleOCR with Tesseract fallback), "tesseract"
+# (Tesseract only, no Paddle models loaded) or "stub" (canned text after a
+# fixed delay, used by the offline load test)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "paddle")
+OCR_STUB_LATENCY_MS = int(os.getenv("OCR_STUB_LATENCY_MS", "0"))
+
+# PaddleOCR recognition language; PADDLE_LANG_FRONT / _BACK override it for
+# one card side. Each language is its own pipeline in the model registry
+# (paddleocr_<lang>), loaded when a card of that side first needs it.
+PADDLE_LANG = os.getenv("PADDLE_LANG", "ne")
+PADDLE_LANGS = {
+    "default": PADDLE_LANG,
+    "front": os.getenv("PADDLE_LANG_FRONT", PADDLE_LANG),
+    "back": os.getenv("PADDLE_LANG_BACK", PADDLE_LANG),
+}
+
+# Progressive resolution: PaddleOCR reads the 640px working image first; lines
+# recognized with a score below OCR_REFINE_BELOW (0: never) are read again from
+# the higher-resolution detail copy preprocess_service sends, at most
+# OCR_REFINE_MAX_LINES per card, each cropped with OCR_REFINE_PAD line
+# heights of margin
+OCR_REFINE_BELOW = float(os.getenv("OCR_REFINE_BELOW", "0.8"))
+OCR_REFINE_MAX_LINES = int(os.getenv("OCR_REFINE_MAX_LINES", "6"))
+OCR_REFINE_PAD = float(os.getenv("OCR_REFINE_PAD", "0.3"))
+
+# Engine selection for OCR_ENGINE=paddle (see engine_policy.py). "static" runs
+# OCR_ENGINE_ORDER as given, each engine a fallback for the one before;
+# "adaptive" reorders and skips engines per card side from recorded outcomes.
+# OCR_ENGINE_ORDER_FRONT / _BACK override the order for one side.
+OCR_POLICY = os.getenv("OCR_POLICY", "static")
+_ORDER = os.getenv("OCR_ENGINE_ORDER", "paddle,tesseract")
+OCR_ENGINE_ORDER = {
+    side: [e.strip() for e in order.split(",") if e.strip()]
+    for side, order in (("default", _ORDER),
+                        ("front", os.getenv("OCR_ENGINE_ORDER_FRONT", _ORDER)),
+                        ("back", os.getenv("OCR_ENGINE_ORDER_BACK", _ORDER)))
+}
+OCR_POLICY_EXPLORE = float(os.getenv("OCR_POLICY_EXPLORE", "0.05"))
+OCR_POLICY_MIN_SAMPLES = int(os.getenv("OCR_POLICY_MIN_SAMPLES", "20"))
+OCR_POLICY_SKIP_BELOW = float(os.getenv("OCR_POLICY_SKIP_BELOW", "0.05"))
+OCR_POLICY_WINDOW = int(os.getenv("OCR_POLICY_WINDOW", "500"))
+# Recorded outcomes survive restarts in this file (empty: kept in memory only)
+OCR_POLICY_STATS_PATH = os.getenv("OCR_POLICY_STATS_PATH", os.path.join(SHARED_DATA_PATH, "ocr_engine_stats.json"))
+OCR_POLICY_SAVE_INTERVAL_S = float(os.getenv("OCR_POLICY_SAVE_INTERVAL_S", "30"))
+
 # LLM Service URL (Docker service name)
 LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://localhost:8001/extract")
 
+# Object storage for the processed images passed to ocr_service (see
+# storage.py): "local" keeps them under STORAGE_ROOT, which both services must
+# share; "s3" uses STORAGE_S3_BUCKET (STORAGE_S3_ENDPOINT for MinIO or another
+# S3-compatible server), read through a cache of STORAGE_CACHE_MAX_MB. A
+# cached object read in the last STORAGE_CACHE_GRACE_S seconds is not
+# evicted, since its reader may not have opened the file yet
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", os.path.join(SHARED_DATA_PATH, "objects"))
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "")
+STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "nagarikta")
+STORAGE_S3_ENDPOINT = os.getenv("STORAGE_S3_ENDPOINT", "")
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION", "")
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "nagarikta-objects"))
+STORAGE_CACHE_MAX_MB = int(os.getenv("STORAGE_CACHE_MAX_MB", "512"))
+STORAGE_CACHE_GRACE_S = float(os.getenv("STORAGE_CACHE_GRACE_S", "120"))
+
+# Request profiling (see profiling.py): requests with "X-Profile: 1", plus
+# this fraction of all requests, are sampled every PROFILE_INTERVAL_MS
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(SHARED_DATA_PATH, "profiles"))
+
+# Admission control (see admission.py): requests running at once, requests
+# allowed to wait for a slot, and how long they may wait before a 429
+ADMISSION_LIMIT = int(os.getenv("ADMISSION_LIMIT", "4"))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "30"))
+
+# Model lifecycle (see model_registry.py): models are loaded on first use.
+# Loading one evicts the least recently used others to stay within
+# MODEL_MEMORY_BUDGET_MB (0: no budget); models unused for MODEL_IDLE_TTL_S
+# are evicted (0: never). MODEL_PIN names models never evicted,
+# MODEL_PRELOAD models loaded at startup (comma-separated; see GET /models).
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+MODEL_IDLE_TTL_S = float(os.getenv("MODEL_IDLE_TTL_S", "0"))
+MODEL_PIN = [m.strip() for m in os.getenv("MODEL_PIN", "").split(",") if m.strip()]
+MODEL_PRELOAD = [m.strip() for m in os.getenv(
+    "MODEL_PRELOAD", f"paddleocr_{PADDLE_LANG}" if OCR_ENGINE == "paddle" else "").split(",") if m.strip()]
+
+# CPU budget (see cpu_budget.py): threads each native library (OpenCV,
+# OpenMP/BLAS, TensorFlow, PaddleOCR, Tesseract) may use in this process;
+# 0 splits the available CPUs between the WEB_CONCURRENCY uvicorn workers.
+# CPU_AFFINITY pins the process: "auto" (a free slot of CPU_THREADS cores,
+# claimed through lock files in CPU_SLOT_DIR), a CPU list ("0-3,8") or "" (none)
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "")
+CPU_SLOT_DIR = os.getenv("CPU_SLOT_DIR", tempfile.gettempdir())
+
 print(f"[CONFIG] SHARED_DATA_PATH: {SHARED_DATA_PATH}")
-print(f"[CONFIG] LLM_SERVICE_URL: {LLM_SERVICE_URL}")
\ No newline at end of file
+print(f"[CONFIG] LLM_SERVICE_URL: {LLM_SERVICE_URL}")
+print(f"[CONFIG] OCR_ENGINE: {OCR_ENGINE}")
+print(f"[CONFIG] OCR_POLICY: {OCR_POLICY}")
\ No newline at end of file
@@ -0,0 +1,195 @@
+# engine_policy.py
+"""
+Which OCR engines to run for a card side, and in what order.
+
+Every engine attempt is recorded per card side: whether its text passed
+the validity check, its confidence (PaddleOCR's mean recognition score;
+Tesseract reports none through image_to_string) and its latency.
+
+OCR_POLICY=static runs the configured OCR_ENGINE_ORDER[_FRONT|_BACK]
+every time, which keeps deployments deterministic; outcomes are still
+recorded, so /ocr/stats shows what an adaptive order would do.
+
+OCR_POLICY=adaptive orders the engines by expected time to a valid
+result: an engine is tried before another when its mean latency divided
+by its success rate (validity x confidence) is lower, the classic order
+for a sequence of fallbacks. An engine whose validity on that side has
+fallen below OCR_POLICY_SKIP_BELOW is not run at all. Until every engine
+has OCR_POLICY_MIN_SAMPLES attempts on a side the static order is used.
+
+Under the fallback order an engine only runs when the ones before it
+failed, so its stats would describe the hard cards alone. A fraction
+OCR_POLICY_EXPLORE of requests therefore runs and records every engine,
+skipped ones included, in random order; the result they return is still
+the one the normal order would pick, so exploring costs latency only.
+
+Counts are halved once an engine passes OCR_POLICY_WINDOW attempts on a
+side, so old outcomes fade. The stats are saved to OCR_POLICY_STATS_PATH
+at most every OCR_POLICY_SAVE_INTERVAL_S seconds and at exit, and loaded
+at start; several processes sharing the file simply overwrite each other.
+"""
+import atexit
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    OCR_POLICY, OCR_ENGINE_ORDER, OCR_POLICY_EXPLORE, OCR_POLICY_MIN_SAMPLES, OCR_POLICY_SKIP_BELOW,
+    OCR_POLICY_WINDOW, OCR_POLICY_STATS_PATH, OCR_POLICY_SAVE_INTERVAL_S,
+)
+from metrics import registry
+
+STATS_VERSION = 1
+_FIELDS = ("attempts", "valid", "confidence_sum", "confidence_n", "latency_ms_sum")
+
+
+def _empty() -> Dict[str, float]:
+    return {field: 0.0 for field in _FIELDS}
+
+
+def summarize(stats: Dict[str, float]) -> Dict[str, Optional[float]]:
+    attempts = stats["attempts"]
+    return {
+        "attempts": round(attempts, 2),
+        "valid_rate": round(stats["valid"] / attempts, 4) if attempts else None,
+        "mean_confidence": round(stats["confidence_sum"] / stats["confidence_n"], 4) if stats["confidence_n"] else None,
+        "mean_latency_ms": round(stats["latency_ms_sum"] / attempts, 2) if attempts else None,
+    }
+
+
+class EnginePolicy:
+    def __init__(self, mode: str, static_order: Dict[str, List[str]], explore: float, min_samples: int,
+                 skip_below: float, window: int, path: Optional[str], save_interval_s: float):
+        self.mode = mode
+        self.static_order = static_order
+        self.explore = explore
+        self.min_samples = min_samples
+        self.skip_below = skip_below
+        self.window = window
+        self.path = path
+        self.save_interval_s = save_interval_s
+        self._stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._random = random.Random()
+
+    def engines_for(self, side: str) -> List[str]:
+        """The configured order for this side (OCR_ENGINE_ORDER)."""
+        return self.static_order.get(side) or self.static_order["default"]
+
+    def _success(self, stats: Dict[str, float]) -> float:
+        # Laplace-smoothed validity, scaled by confidence where the engine reports one
+        p = (stats["valid"] + 1) / (stats["attempts"] + 2)
+        if stats["confidence_n"]:
+            p *= stats["confidence_sum"] / stats["confidence_n"]
+        return max(p, 1e-6)
+
+    def explore_order(self, side: str) -> Optional[List[str]]:
+        """Every engine for this side in random order when this request explores, else None."""
+        engines = list(self.engines_for(side))
+        if self.mode != "adaptive" or len(engines) < 2 or self._random.random() >= self.explore:
+            return None
+        self._random.shuffle(engines)
+        registry.inc("ocr_policy_explore", side=side)
+        return engines
+
+    def order(self, side: str) -> List[str]:
+        """Engines to try for this side, first choice first."""
+        engines = list(self.engines_for(side))
+        if self.mode != "adaptive" or len(engines) < 2:
+            return engines
+
+        with self._lock:
+            stats = {e: dict(self._stats.get(side, {}).get(e) or _empty()) for e in engines}
+        if any(s["attempts"] < self.min_samples for s in stats.values()):
+            return engines
+
+        kept = [e for e in engines if stats[e]["valid"] / stats[e]["attempts"] >= self.skip_below] or engines
+        # Stable sort: ties keep the static order
+        return sorted(kept, key=lambda e: (stats[e]["latency_ms_sum"] / stats[e]["attempts"]) / self._success(stats[e]))
+
+    def record(self, side: str, engine: str, valid: bool, latency_ms: float, confidence: Optional[float] = None):
+        with self._lock:
+            stats = self._stats.setdefault(side, {}).setdefault(engine, _empty())
+            stats["attempts"] += 1
+            stats["valid"] += 1 if valid else 0
+            stats["latency_ms_sum"] += latency_ms
+            if confidence is not None:
+                stats["confidence_sum"] += confidence
+                stats["confidence_n"] += 1
+            if stats["attempts"] > self.window:
+                for field in _FIELDS:
+                    stats[field] /= 2
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= self.save_interval_s
+        if due:
+            self.save()
+
+    def snapshot(self) -> dict:
+        """What /ocr/stats returns: settings, per-side engine stats and the order each side would get now."""
+        with self._lock:
+            sides = {side: {e: summarize(s) for e, s in engines.items()} for side, engines in self._stats.items()}
+        orders = {side: self.order(side) for side in sorted(set(sides) | {"front", "back"})}
+        return {
+            "policy": self.mode,
+            "explore": self.explore,
+            "min_samples": self.min_samples,
+            "skip_below": self.skip_below,
+            "static_order": self.static_order,
+            "order": orders,
+            "sides": sides,
+        }
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Warning: OCR engine stats not loaded from {self.path}: {e}")
+            return
+        if data.get("version") != STATS_VERSION:
+            return
+        with self._lock:
+            self._stats = {
+                side: {e: {field: float(s.get(field, 0)) for field in _FIELDS} for e, s in engines.items()}
+                for side, engines in data.get("sides", {}).items()
+            }
+        print(f"Loaded OCR engine stats from {self.path}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": STATS_VERSION, "sides": json.loads(json.dumps(self._stats))}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".ocr-engine-stats-", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            print(f"Warning: OCR engine stats not saved to {self.path}: {e}")
+
+
+policy = EnginePolicy(OCR_POLICY, OCR_ENGINE_ORDER, OCR_POLICY_EXPLORE, OCR_POLICY_MIN_SAMPLES,
+                      OCR_POLICY_SKIP_BELOW, OCR_POLICY_WINDOW, OCR_POLICY_STATS_PATH, OCR_POLICY_SAVE_INTERVAL_S)
+policy.load()
+atexit.register(policy.save)
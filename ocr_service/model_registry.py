@@ -0,0 +1,284 @@
+# model_registry.py
+"""
+Lifecycle of the models a service keeps in memory.
+
+Each model is registered with a loader (and optionally an unloader) and
+loaded on first use instead of at import, so a node only holds what its
+traffic needs: the TensorFlow detector only with DETECTOR=tensorflow, a
+PaddleOCR pipeline only for the languages the card sides actually use.
+Loads are timed, and a model's resident size is the growth of the process
+RSS across its load (loads are serialized so the growth is its own).
+
+With a memory budget, loading a model first evicts the least recently used
+ones until the known sizes fit; with an idle TTL, a background sweep evicts
+models unused for that long. Pinned models and models in use are never
+evicted. Eviction drops the registry's reference, runs the unloader and
+collects garbage; how much memory goes back to the OS then depends on the
+framework's allocator, which the next RSS-based size will reflect.
+
+The state is served at GET /models (POST /models/<name>/pin, /unpin and
+/evict for operators) and exported as models_resident_mb, model_loads and
+model_evictions in /metrics.
+"""
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+from fastapi import FastAPI, HTTPException
+
+MB = 1024 * 1024
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(size: Optional[int]) -> Optional[float]:
+    return round(size / MB, 1) if size is not None else None
+
+
+class _Model:
+    def __init__(self, name: str, loader: Callable[[], object], unloader: Optional[Callable[[object], None]],
+                 pinned: bool, size_hint_mb: Optional[float]):
+        self.name = name
+        self.loader = loader
+        self.unloader = unloader
+        self.pinned = pinned
+        self.obj = None
+        self.loaded = False
+        self.in_use = 0
+        self.size_bytes = int(size_hint_mb * MB) if size_hint_mb else None
+        self.load_ms = None
+        self.last_used = None
+        self.loads = 0
+        self.evictions = 0
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.budget_bytes = 0  # 0: no budget
+        self.idle_ttl_s = 0.0  # 0: never evicted for idleness
+        self._models: Dict[str, _Model] = {}
+        self._pin_names = set()
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._metrics = None
+        self._sweeper = None
+
+    def register(self, name: str, loader: Callable[[], object], unloader: Optional[Callable[[object], None]] = None,
+                 pinned: bool = False, size_hint_mb: Optional[float] = None):
+        """Declare a model; nothing is loaded until its first use. size_hint_mb is used until it has been measured."""
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = _Model(name, loader, unloader, pinned or name in self._pin_names, size_hint_mb)
+
+    def _model(self, name: str) -> _Model:
+        try:
+            return self._models[name]
+        except KeyError:
+            raise KeyError(f"Unknown model: {name}")
+
+    @contextmanager
+    def use(self, name: str):
+        """The loaded model, which is not evicted while the block runs."""
+        model = self._acquire(name)
+        try:
+            yield model.obj
+        finally:
+            with self._lock:
+                model.in_use -= 1
+                model.last_used = time.monotonic()
+
+    def get(self, name: str):
+        """Load the model if needed and return it (without holding it in use)."""
+        with self.use(name) as obj:
+            return obj
+
+    def loaded(self, name: str):
+        """The model if it is loaded, else None (never loads it)."""
+        model = self._models.get(name)
+        return model.obj if model is not None and model.loaded else None
+
+    def _acquire(self, name: str) -> _Model:
+        model = self._model(name)
+        with self._lock:
+            if model.loaded:
+                model.in_use += 1
+                return model
+
+        with self._load_lock:
+            with self._lock:
+                if model.loaded:
+                    model.in_use += 1
+                    return model
+                self._make_room(model)
+
+            before, t = rss_bytes(), time.perf_counter()
+            obj = model.loader()
+            load_ms = (time.perf_counter() - t) * 1000
+            after = rss_bytes()
+
+            with self._lock:
+                model.obj, model.loaded = obj, True
+                model.loads += 1
+                model.load_ms = round(load_ms, 1)
+                if before is not None and after is not None and after > before:
+                    model.size_bytes = after - before
+                model.in_use += 1
+                model.last_used = time.monotonic()
+                self._make_room(model)
+            print(f"Model {name} loaded in {load_ms:.0f} ms ({_mb(model.size_bytes)} MB)")
+            if self._metrics is not None:
+                self._metrics.inc("model_loads", model=name)
+            return model
+
+    def _resident_bytes(self) -> int:
+        return sum(m.size_bytes or 0 for m in self._models.values() if m.loaded)
+
+    def _make_room(self, incoming: _Model):
+        """Evict least recently used models until incoming fits the budget (lock held)."""
+        if not self.budget_bytes:
+            return
+        # Before a first load the size is unknown (0); the check after the load then catches up
+        need = 0 if incoming.loaded else incoming.size_bytes or 0
+        while self._resident_bytes() + need > self.budget_bytes:
+            candidates = [m for m in self._models.values()
+                          if m.loaded and not m.pinned and not m.in_use and m is not incoming]
+            if not candidates:
+                print(f"Warning: loading {incoming.name} exceeds the model memory budget "
+                      f"({_mb(self._resident_bytes() + need)} of {_mb(self.budget_bytes)} MB)")
+                if self._metrics is not None:
+                    self._metrics.inc("model_over_budget", model=incoming.name)
+                return
+            self._unload(min(candidates, key=lambda m: m.last_used or 0), "budget")
+
+    def _unload(self, model: _Model, reason: str):
+        obj, model.obj, model.loaded = model.obj, None, False
+        model.evictions += 1
+        if model.unloader is not None:
+            try:
+                model.unloader(obj)
+            except Exception as e:
+                print(f"Warning: unloading {model.name} failed: {e}")
+        del obj
+        gc.collect()
+        print(f"Model {model.name} evicted ({reason})")
+        if self._metrics is not None:
+            self._metrics.inc("model_evictions", model=model.name, reason=reason)
+
+    def evict(self, name: str) -> bool:
+        """Unload a model now; False if it is not loaded, pinned or in use."""
+        model = self._model(name)
+        with self._lock:
+            if not model.loaded or model.pinned or model.in_use:
+                return False
+            self._unload(model, "manual")
+            return True
+
+    def pin(self, name: str, pinned: bool = True):
+        with self._lock:
+            self._model(name).pinned = pinned
+
+    def sweep_idle(self):
+        """Evict unpinned models idle for longer than the TTL."""
+        if not self.idle_ttl_s:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for model in self._models.values():
+                if (model.loaded and not model.pinned and not model.in_use
+                        and now - (model.last_used or now) > self.idle_ttl_s):
+                    self._unload(model, "idle")
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(max(1.0, min(self.idle_ttl_s / 2, 60.0)))
+            self.sweep_idle()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                m.name: {
+                    "loaded": m.loaded,
+                    "pinned": m.pinned,
+                    "in_use": m.in_use,
+                    "size_mb": _mb(m.size_bytes),
+                    "load_ms": m.load_ms,
+                    "idle_s": round(now - m.last_used, 1) if m.loaded and m.last_used else None,
+                    "loads": m.loads,
+                    "evictions": m.evictions,
+                }
+                for m in self._models.values()
+            }
+            resident = self._resident_bytes()
+        return {
+            "budget_mb": _mb(self.budget_bytes) if self.budget_bytes else None,
+            "idle_ttl_s": self.idle_ttl_s or None,
+            "resident_mb": _mb(resident),
+            "rss_mb": _mb(rss_bytes()),
+            "models": models,
+        }
+
+    def configure(self, budget_mb: float = 0, idle_ttl_s: float = 0, pinned: Iterable[str] = ()):
+        self.budget_bytes = int(budget_mb * MB)
+        self.idle_ttl_s = idle_ttl_s
+        with self._lock:
+            self._pin_names.update(pinned)
+            for name in self._pin_names:
+                if name in self._models:
+                    self._models[name].pinned = True
+        if idle_ttl_s and self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_forever, name="model-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def install(self, app: FastAPI, budget_mb: float = 0, idle_ttl_s: float = 0, pinned: Iterable[str] = (),
+                preload: Iterable[str] = (), registry=None):
+        """Apply the settings, load the preload models now and add the /models routes."""
+        self.configure(budget_mb, idle_ttl_s, pinned)
+        if registry is not None:
+            self._metrics = registry
+            registry.register("models_resident_mb", "gauge", lambda: {
+                m.name: _mb(m.size_bytes) or 0 for m in self._models.values() if m.loaded}, label="model")
+        for name in preload:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Warning: preloading model {name} failed: {e}")
+
+        @app.get("/models")
+        def models_state():
+            """Registered models: loaded, pinned, size, load time and idle time, plus the budget."""
+            return self.snapshot()
+
+        def known(name: str):
+            if name not in self._models:
+                raise HTTPException(status_code=404, detail=f"Unknown model: {name}")
+
+        @app.post("/models/{name}/pin")
+        def pin_model(name: str):
+            known(name)
+            self.pin(name)
+            return self.snapshot()["models"][name]
+
+        @app.post("/models/{name}/unpin")
+        def unpin_model(name: str):
+            known(name)
+            self.pin(name, False)
+            return self.snapshot()["models"][name]
+
+        @app.post("/models/{name}/evict")
+        def evict_model(name: str):
+            known(name)
+            return {"evicted": self.evict(name), **self.snapshot()["models"][name]}
+
+
+models = ModelRegistry()
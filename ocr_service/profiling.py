@@ -0,0 +1,197 @@
+# profiling.py
+"""
+Opt-in sampling profiler for single requests.
+
+A request is profiled when it carries "X-Profile: 1" or is picked by the
+sampling rate. While at least one profiled request is running, a daemon
+thread samples every thread's Python stack at a fixed interval; each
+request's samples are written on completion as collapsed stacks
+(<profile dir>/<uuid>_<service>.folded), which flamegraph.pl,
+inferno and speedscope read directly. When nothing is being profiled the
+cost is one header lookup per request.
+
+Stacks from all threads are sampled, so executor threads (LLM wait,
+post-processing) are covered; concurrent requests in the same process
+show up in each other's profiles. Threads blocked idle on a queue or lock
+are dropped.
+"""
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from fastapi import FastAPI, Request
+
+from admission import PRIORITY_HEADER
+from metrics import REQUEST_ID_HEADER, request_id_from
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+# Innermost frames of threads that are parked, not working
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("runners.py", "run"),  # uvloop event loop waiting in C
+}
+
+
+def _truthy(value: Optional[str]) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def downstream_headers(request: Request) -> dict:
+    """Headers that carry this request's id, profiling flag and priority class to the next service."""
+    headers = {REQUEST_ID_HEADER: request.state.request_id}
+    if getattr(request.state, "profile", False):
+        headers[PROFILE_HEADER] = "1"
+    if getattr(request.state, "priority", None) == "batch":
+        headers[PRIORITY_HEADER] = "batch"
+    return headers
+
+
+class _Session:
+    def __init__(self, request_id: str, path: str):
+        self.request_id = request_id
+        self.path = path
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+
+
+class Profiler:
+    def __init__(self):
+        self.out_dir = None
+        self.service = "unknown"
+        self.sample_rate = 0.0
+        self.interval = 0.005
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def should_profile(self, request: Request) -> bool:
+        if _truthy(request.headers.get(PROFILE_HEADER)):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, request_id: str) -> _Session:
+        # Named by the server: the request id may come from the client
+        session = _Session(request_id, os.path.join(self.out_dir, f"{uuid.uuid4().hex}_{self.service}.folded"))
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: _Session) -> Optional[str]:
+        with self._lock:
+            self._sessions.discard(session)
+        elapsed_ms = (time.perf_counter() - session.started) * 1000
+
+        path = session.path
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in session.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            print(f"Failed to write profile {path}: {e}")
+            return None
+        print(f"Profile for {session.request_id}: {sum(session.stacks.values())} samples "
+              f"over {elapsed_ms:.0f} ms → {path}")
+        return path
+
+    def _sample(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                frames.append(names.get(ident, f"thread-{ident}"))
+                stacks.append(";".join(reversed(frames)))
+
+            for session in sessions:
+                session.stacks.update(stacks)
+            time.sleep(self.interval)
+
+    def install(self, app: FastAPI, service: str, out_dir: str, sample_rate: float, interval_ms: float):
+        """Add the profiling middleware (call before metrics' install, which must wrap it)."""
+        self.service = service
+        self.out_dir = out_dir
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        app.add_middleware(_ProfileMiddleware, profiler=self)
+
+
+class _ProfileMiddleware:
+    """
+    Plain ASGI middleware, so a session covers the whole response, streamed
+    bodies included: it ends when the last body chunk is sent, not when the
+    endpoint returns its StreamingResponse.
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler = self.profiler
+        request = Request(scope)
+        state = scope.setdefault("state", {})
+        if not profiler.should_profile(request):
+            state["profile"] = False
+            await self.app(scope, receive, send)
+            return
+
+        state["profile"] = True
+        request_id = state.get("request_id") or request_id_from(request.headers.get(REQUEST_ID_HEADER))
+        session = profiler.start(request_id)
+        stopped = False
+
+        async def send_profiled(message):
+            nonlocal stopped
+            if message["type"] == "http.response.start":
+                # The headers go out before the body runs, so this is where the profile will be
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_FILE_HEADER.lower().encode(), session.path.encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and not stopped:
+                # Written before the last chunk goes out, so it is there once the client has the response
+                stopped = True
+                profiler.stop(session)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            if not stopped:
+                profiler.stop(session)
+
+
+profiler = Profiler()
@@ -1,53 +1,75 @@
 # ocr_service/run_ocr.py
+from cpu_budget import budget
 import cv2
 import numpy as np
 import pytesseract
-from typing import Tuple, Optional
+import time
+from typing import Callable, Dict, List, Tuple, Optional, Union
 import re
 
-_PADDLE_OCR: Optional[object] = None
-_PADDLE_OCR_ERROR: Optional[str] = None
+from config import (
+    OCR_ENGINE, OCR_STUB_LATENCY_MS, OCR_ENGINE_ORDER, PADDLE_LANGS,
+    OCR_REFINE_BELOW, OCR_REFINE_MAX_LINES, OCR_REFINE_PAD,
+)
+from engine_policy import policy
+from metrics import registry
+from model_registry import models
 
-def _init_paddleocr():
+cv2.setNumThreads(budget.threads)
+
+# PaddleOCR pipelines live in the model registry, one per language
+# (paddleocr_<lang>), loaded when a card side using that language first needs
+# one. Initialization errors are remembered per language so a broken install
+# falls through to Tesseract at once instead of retrying every request.
+_PADDLE_ERRORS: Dict[str, str] = {}
+
+
+def _init_paddleocr(lang: str):
     """
-    Initialize PaddleOCR instance at module load time.
-    Called once when the module is imported.
+    Build a PaddleOCR pipeline for lang (the registry's loader).
     """
-    global _PADDLE_OCR, _PADDLE_OCR_ERROR
-    
-    if _PADDLE_OCR is not None:
-        return _PADDLE_OCR
-    
     try:
-        print("Initializing PaddleOCR...")
-        
+        print(f"Initializing PaddleOCR ({lang})...")
+
         from paddleocr import PaddleOCR
-        
-        _PADDLE_OCR = PaddleOCR(
+
+        ocr = PaddleOCR(
             use_doc_orientation_classify=True,
             use_doc_unwarping=True,
             use_textline_orientation=True,
-            lang="ne"
+            lang=lang,
+            cpu_threads=budget.threads
         )
-        
+
         print("PaddleOCR initialized successfully!")
-        return _PADDLE_OCR
-        
+        return ocr
+
     except Exception as e:
-        _PADDLE_OCR_ERROR = str(e)
+        _PADDLE_ERRORS[lang] = str(e)
         print(f"PaddleOCR initialization failed: {e}")
-        return None
+        raise
+
+
+for _lang in set(PADDLE_LANGS.values()):
+    models.register(f"paddleocr_{_lang}", lambda lang=_lang: _init_paddleocr(lang))
+
+
+def _paddle_lang(card_side: Optional[str]) -> str:
+    return PADDLE_LANGS.get(card_side, PADDLE_LANGS["default"])
 
 
-def get_paddleocr():
+def get_paddleocr(card_side: Optional[str] = None):
     """
-    Get the PaddleOCR instance.
+    Get the PaddleOCR instance for card_side's language, loading it if needed.
     Returns None if initialization failed.
     """
-    global _PADDLE_OCR
-    if _PADDLE_OCR is None and _PADDLE_OCR_ERROR is None:
-        _init_paddleocr()
-    return _PADDLE_OCR
+    lang = _paddle_lang(card_side)
+    if lang in _PADDLE_ERRORS:
+        return None
+    try:
+        return models.get(f"paddleocr_{lang}")
+    except Exception:
+        return None
 
 
 def is_paddleocr_available() -> bool:
@@ -57,10 +79,6 @@ def is_paddleocr_available() -> bool:
     return get_paddleocr() is not None
 
 
-# Initialize PaddleOCR when module is loaded
-_init_paddleocr()
-
-
 def _is_valid_ocr_result(text: str, min_length: int = 10, min_alpha_ratio: float = 0.3) -> bool:
     """
     Check if OCR result is valid and not garbage.
@@ -106,24 +124,130 @@ def _is_valid_ocr_result(text: str, min_length: int = 10, min_alpha_ratio: float
     return True
 
 
-def _try_paddleocr(image):
+# A detail image, its path, or a function returning the path (or None), so an
+# image that has to be fetched is only fetched if some line needs it
+Detail = Union[np.ndarray, str, Callable[[], Optional[str]], None]
+
+
+def _scores(res) -> List[float]:
+    scores = res.get('rec_scores')  # a list or an array, depending on the Paddle version
+    return [] if scores is None else [float(s) for s in scores]
+
+
+def _line_boxes(res) -> Optional[List]:
+    """[x1, y1, x2, y2] per recognized line, or None."""
+    boxes = res.get('rec_boxes')
+    if boxes is not None and len(boxes) == len(res['rec_texts']):
+        return [list(map(float, box)) for box in boxes]
+    polys = res.get('rec_polys')
+    if polys is not None and len(polys) == len(res['rec_texts']):
+        return [[float(np.min(p[:, 0])), float(np.min(p[:, 1])), float(np.max(p[:, 0])), float(np.max(p[:, 1]))]
+                for p in map(np.asarray, polys)]
+    return None
+
+
+# Mean absolute difference (gray levels) below which Paddle's doc preprocessing
+# is taken to have left the page as it was
+_UNWARP_IDENTITY_TOL = 2.0
+
+
+def _boxes_on_input(res, image: np.ndarray) -> bool:
     """
-    Try PaddleOCR for text extraction.
+    Whether the page's line boxes are in the input image's coordinates. Doc
+    preprocessing can rotate the page and unwarp it (a non-linear warp), and
+    boxes on a transformed page cannot be mapped onto the detail image.
     """
-    ocr = get_paddleocr()
-    
-    if ocr is None:
-        raise RuntimeError(f"PaddleOCR not available: {_PADDLE_OCR_ERROR or 'Unknown error'}")
+    doc = res.get('doc_preprocessor_res')
+    if not doc:
+        return True
+    if doc.get('angle') not in (None, 0, -1):
+        return False
+    if not (doc.get('model_settings') or {}).get('use_doc_unwarping', True):
+        return True
+    # Unwarping ran; only an identity warp keeps the coordinates
+    out = doc.get('output_img')
+    if out is None or out.shape != image.shape:
+        return False
+    return float(np.mean(cv2.absdiff(np.asarray(out, dtype=np.uint8), image))) < _UNWARP_IDENTITY_TOL
+
+
+def _refine_lines(ocr, res, image: np.ndarray, detail: Detail) -> Tuple[List[str], List[float]]:
+    """
+    Read the page's low-confidence lines again from the detail image.
+
+    Only those lines are cropped (with OCR_REFINE_PAD of margin) and run
+    through the pipeline without its page-level models; a line keeps the new
+    reading when it scores higher. Boxes are mapped onto the detail image by
+    scale only, so a page Paddle rotated or unwarped is left as read.
+    """
+    texts = list(res['rec_texts'])
+    scores = _scores(res)
+    if detail is None or not OCR_REFINE_BELOW or len(scores) != len(texts):
+        return texts, scores
+    low = sorted((i for i, s in enumerate(scores) if s < OCR_REFINE_BELOW), key=lambda i: scores[i])
+    low = low[:OCR_REFINE_MAX_LINES]
+    if not low:
+        return texts, scores
+
+    boxes = _line_boxes(res)
+    if boxes is None or not _boxes_on_input(res, image):
+        registry.inc("ocr_refined_lines", len(low), result="unmapped")
+        return texts, scores
+    ref_shape = image.shape
+
+    if callable(detail):
+        detail = detail()
+    if isinstance(detail, str):
+        detail = cv2.imread(detail, cv2.IMREAD_GRAYSCALE)
+    if detail is None:
+        return texts, scores
+    sy, sx = detail.shape[0] / ref_shape[0], detail.shape[1] / ref_shape[1]
+
+    with registry.timer("ocr_refine"):
+        for i in low:
+            x1, y1, x2, y2 = boxes[i]
+            pad = OCR_REFINE_PAD * (y2 - y1)
+            top, bottom = max(0, int((y1 - pad) * sy)), min(detail.shape[0], int((y2 + pad) * sy) + 1)
+            left, right = max(0, int((x1 - pad) * sx)), min(detail.shape[1], int((x2 + pad) * sx) + 1)
+            if bottom <= top or right <= left:
+                continue
+            crop = cv2.cvtColor(detail[top:bottom, left:right], cv2.COLOR_GRAY2BGR)
+            line_texts, line_scores = [], []
+            for out in ocr.predict(crop, use_doc_orientation_classify=False, use_doc_unwarping=False,
+                                   use_textline_orientation=False):
+                if isinstance(out, dict) and 'rec_texts' in out:
+                    line_texts.extend(out['rec_texts'])
+                    line_scores.extend(_scores(out))
+            if line_texts and float(np.mean(line_scores)) > scores[i]:
+                texts[i], scores[i] = " ".join(line_texts), float(np.mean(line_scores))
+                registry.inc("ocr_refined_lines", result="improved")
+            else:
+                registry.inc("ocr_refined_lines", result="kept")
+    return texts, scores
+
+
+def _try_paddleocr(image, card_side: Optional[str] = None, detail: Detail = None):
+    """
+    Try PaddleOCR for text extraction. Returns (text, mean recognition score or None).
+    Low-confidence lines are re-read from detail, the higher-resolution copy, when given.
+    """
+    lang = _paddle_lang(card_side)
+    if lang in _PADDLE_ERRORS:
+        raise RuntimeError(f"PaddleOCR not available: {_PADDLE_ERRORS[lang]}")
     
     try:
-        # Paddle expects numpy array
-        result = ocr.predict(image)
-        text_lines = []
-        for res in result:
-            if isinstance(res, dict) and 'rec_texts' in res:
-                text_lines.extend(res['rec_texts'])
+        # Paddle expects numpy array; the pipeline is not evicted while it runs
+        with models.use(f"paddleocr_{lang}") as ocr:
+            result = ocr.predict(image)
+            text_lines, scores = [], []
+            for res in result:
+                if isinstance(res, dict) and 'rec_texts' in res:
+                    page_texts, page_scores = _refine_lines(ocr, res, image, detail)
+                    text_lines.extend(page_texts)
+                    scores.extend(page_scores)
         text = "\n".join(text_lines) if text_lines else "No text found"
-        return text
+        confidence = float(np.mean(scores)) if len(scores) else None
+        return text, confidence
     except Exception as e:
         # bubble up to caller to allow fallback
         raise
@@ -189,55 +313,145 @@ def _run_tesseract(image):
     return text
 
 
-def run_ocr_for_path(image_path: str, card_side: str = "front") -> Tuple[str, str]:
+_STUB_TEXT = {
+    "front": (
+        "नेपाल सरकार\n"
+        "ना.प्र.नं. ३९-०१-७६-०८९९९\n"
+        "नाम थर: राम बहादुर थापा\n"
+        "लिङ्ग: पुरुष\n"
+        "जन्म स्थान\n"
+        "जिल्ला: काठमाण्डौ\n"
+        "न.पा.: काठमाण्डौ\n"
+        "वडा नं. ५\n"
+        "स्थायी बासस्थान\n"
+        "जिल्ला: ललितपुर\n"
+        "न.पा.: गोदावरी\n"
+        "वडा नं. ३\n"
+        "जन्म मिति: साल २०४५ महिना ०२ गते २८\n"
+        "बाबुको नाम थर: हरि बहादुर थापा\n"
+        "आमाको नाम थर: सीता थापा"
+    ),
+    "back": (
+        "Citizenship Certificate No. 39-01-76-08999\n"
+        "Full Name: Ram Bahadur Thapa\n"
+        "Sex: Male\n"
+        "Birth Place: District: Kathmandu\n"
+        "Municipality: Kathmandu Ward No. 5\n"
+        "Permanent Address: District: Lalitpur\n"
+        "Municipality: Godawari Ward No. 3\n"
+        "Date of Birth (AD): Year 1988 Month 06 Day 11"
+    ),
+}
+
+
+def _run_stub(card_side: str) -> str:
+    """
+    Deterministic stand-in for the OCR engines so the service chain can be
+    load-tested without PaddleOCR/Tesseract models.
+    """
+    if OCR_STUB_LATENCY_MS:
+        time.sleep(OCR_STUB_LATENCY_MS / 1000)
+    return _STUB_TEXT.get(card_side, _STUB_TEXT["back"])
+
+
+# OCR_ENGINE_ORDER key -> (name reported as ocr_engine, timing stage,
+#                          (image, side, detail) -> (text, confidence))
+_ENGINES = {
+    "paddle": ("PaddleOCR", "paddleocr", _try_paddleocr),
+    "tesseract": ("Tesseract", "tesseract", lambda image, card_side, detail: (_run_tesseract(image), None)),
+}
+
+for _side, _order in OCR_ENGINE_ORDER.items():
+    if not _order or set(_order) - set(_ENGINES):
+        raise ValueError(f"OCR_ENGINE_ORDER for {_side} must list engines from {sorted(_ENGINES)}, got {_order}")
+
+
+def run_ocr_for_path(image_path: str, card_side: str = "front", detail: Detail = None) -> Tuple[str, str]:
     """
     OCR pipeline with PaddleOCR as primary engine.
     Tesseract is used only as a fallback if PaddleOCR fails or returns garbage.
+    The order of the two, per card side, comes from engine_policy.
+    detail is the higher-resolution copy PaddleOCR re-reads low-confidence
+    lines from; given as a path (or a function returning one), it is only read
+    if some line needs it.
     """
 
     print(f"OCR Processing: {image_path}")
-    print(f"Card Side: {card_side}")
 
     img = cv2.imread(image_path)
     if img is None:
         raise RuntimeError(f"Cannot load image: {image_path}")
 
-    image = np.ascontiguousarray(img, dtype=np.uint8)
-
-    # ---------------- Primary OCR: PaddleOCR ----------------
-    try:
-        print("→ Using PaddleOCR")
-        text = _try_paddleocr(image)
-        engine = "PaddleOCR"
+    return run_ocr_for_image(img, card_side, detail)
 
-        if _is_valid_ocr_result(text, card_side):
-            return _finalize(text, engine)
 
-        print("PaddleOCR returned low-quality output")
+def run_ocr_for_image(img: np.ndarray, card_side: str = "front", detail: Detail = None) -> Tuple[str, str]:
+    """Engine selection and fallback of run_ocr_for_path, for an already decoded BGR image."""
+    print(f"Card Side: {card_side}")
 
-    except Exception as e:
-        print(f"PaddleOCR failed: {e}")
+    image = np.ascontiguousarray(img, dtype=np.uint8)
 
-    # ---------------- Fallback OCR: Tesseract ----------------
-    try:
-        print("Falling back to Tesseract")
-        fallback_text = _run_tesseract(image)
-        fallback_engine = "Tesseract (fallback)"
+    if OCR_ENGINE == "stub":
+        return _finalize(_run_stub(card_side), "Stub")
+
+    if OCR_ENGINE == "tesseract":
+        with registry.timer("tesseract"):
+            return _finalize(_run_tesseract(image), "Tesseract")
+
+    # ---------------- PaddleOCR / Tesseract, in the policy's order ----------------
+    order = policy.order(card_side)
+    skipped = [key for key in policy.engines_for(card_side) if key not in order]
+    explore_order = policy.explore_order(card_side)
+    if explore_order:
+        # Run and record every engine, then pick the result as the order below would
+        outcomes = {key: _attempt(key, _ENGINES[key][0], image, card_side, detail) for key in explore_order}
+        order = order + skipped
+    else:
+        outcomes = {}
+        for key in skipped:
+            registry.inc("ocr_engine_skipped", side=card_side, engine=key)
+
+    best_effort = None
+    for i, key in enumerate(order):
+        name = _ENGINES[key][0]
+        engine = name + (" (fallback)" if i else "")
+        outcome = outcomes[key] if explore_order else _attempt(key, engine, image, card_side, detail)
+        if outcome is None:
+            continue
+        text, valid = outcome
+        if valid:
+            return _finalize(text, engine)
+        if best_effort is None:
+            best_effort = (text, name)
 
-        if _is_valid_ocr_result(fallback_text, card_side):
-            return _finalize(fallback_text, fallback_engine)
+    # ---------------- Best-effort return ----------------
+    text, engine = best_effort or ("", _ENGINES[order[0]][0])
+    print(f" Returning {engine} output")
+    return _finalize(text, engine)
 
-        print("Tesseract also returned low-quality output")
 
+def _attempt(key: str, engine: str, image: np.ndarray, card_side: str, detail: Detail) -> Optional[Tuple[str, bool]]:
+    """Run one engine and record the outcome with the policy; (text, valid), or None if it raised."""
+    _, stage, run = _ENGINES[key]
+    print(f"→ Using {engine}")
+    t = time.perf_counter()
+    try:
+        with registry.timer(stage):
+            text, confidence = run(image, card_side, detail)
     except Exception as e:
-        print(f"Tesseract failed: {e}")
+        policy.record(card_side, key, False, (time.perf_counter() - t) * 1000)
+        print(f"{engine} failed: {e}")
+        return None
 
-    # ---------------- Best-effort return ----------------
-    print(" Returning PaddleOCR output")
-    return _finalize(text if 'text' in locals() else "", "PaddleOCR")
+    valid = _is_valid_ocr_result(text)
+    policy.record(card_side, key, valid, (time.perf_counter() - t) * 1000, confidence)
+    if not valid:
+        print(f"{engine} returned low-quality output")
+    return text, valid
 
 
 def _finalize(text: str, engine: str) -> Tuple[str, str]:
+    registry.inc("ocr_engine", engine=engine)
     print(f"OCR completed using {engine}")
     print(f"Text length: {len(text)} characters")
     return text, engine
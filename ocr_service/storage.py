@@ -0,0 +1,237 @@
+# storage.py
+"""
+Content-addressed object storage for images passed between services.
+
+preprocess_service puts each processed image here and sends ocr_service
+its key rather than a file path, so the two can run on different nodes.
+A key is the SHA-256 of the content plus the file extension, fanned out
+by its first two hex digits ("3f/3f9a...c2.png"): storing the same bytes
+twice is a no-op, and an object never changes once written, so cached
+copies never go stale.
+
+STORAGE_BACKEND selects the backend:
+  local  files under STORAGE_ROOT (a shared volume, as before)
+  s3     an S3-compatible bucket (AWS, or MinIO for a local stand-in);
+         credentials come from the usual AWS_* environment variables
+
+Writes and reads stream in chunks. The s3 backend reads through a local
+cache of at most STORAGE_CACHE_MAX_MB, evicting the least recently used
+objects; the local backend reads its files in place. local_path hands out
+a path that the caller opens later, so objects read within the last
+STORAGE_CACHE_GRACE_S seconds are never evicted: the cache can run over
+its limit for that long rather than delete a file about to be read.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Optional
+
+from config import (
+    STORAGE_BACKEND, STORAGE_ROOT, STORAGE_S3_BUCKET, STORAGE_S3_PREFIX, STORAGE_S3_ENDPOINT,
+    STORAGE_S3_REGION, STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_MB, STORAGE_CACHE_GRACE_S,
+)
+from metrics import registry
+
+CHUNK_SIZE = 1 << 20
+_KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+
+
+class ObjectNotFound(KeyError):
+    pass
+
+
+def valid_key(key: str) -> bool:
+    """Keys are only ever produced by content_key; anything else (e.g. a path) is refused."""
+    return bool(_KEY_RE.match(key or ""))
+
+
+def content_key(digest: str, suffix: str) -> str:
+    return f"{digest[:2]}/{digest}{suffix.lower()}"
+
+
+def _hash_stream(stream: BinaryIO, sink: Optional[BinaryIO] = None) -> str:
+    """SHA-256 of the stream, copying it to sink on the way."""
+    h = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+        if sink is not None:
+            sink.write(chunk)
+    return h.hexdigest()
+
+
+def _check_key(key: str):
+    if not valid_key(key):
+        raise ValueError(f"Invalid object key: {key!r}")
+
+
+class LocalStorage:
+    """Objects as files under root, read in place."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_stream(self, stream: BinaryIO, suffix: str) -> str:
+        fd, tmp = tempfile.mkstemp(prefix=".upload-", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                digest = _hash_stream(stream, f)
+            key = content_key(digest, suffix)
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return key
+
+    def local_path(self, key: str) -> str:
+        _check_key(key)
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise ObjectNotFound(key)
+        return path
+
+    def location(self, key: str) -> str:
+        return self._path(key)
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, read through a bounded local cache."""
+
+    def __init__(self, bucket: str, prefix: str, endpoint_url: Optional[str], region: Optional[str],
+                 cache_dir: str, cache_max_bytes: int, cache_grace_s: float):
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs STORAGE_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.cache = LocalStorage(cache_dir)
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_grace_s = cache_grace_s
+        self._client = None
+        self._lock = threading.Lock()
+        self._cached = {}  # key -> size, in least recently used order
+        self._read_at = {}  # key -> time.monotonic() of the last local_path for it
+        found = []
+        for dirpath, _, names in os.walk(cache_dir):
+            for name in names:
+                key = content_key(name.split(".")[0], os.path.splitext(name)[1])
+                if valid_key(key):
+                    st = os.stat(os.path.join(dirpath, name))
+                    found.append((st.st_mtime, key, st.st_size))
+        # Hits touch the file, so mtime order is use order across restarts too
+        for _, key, size in sorted(found):
+            self._cached[key] = size
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Only the s3 backend needs boto3
+            import boto3
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region)
+        return self._client
+
+    def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_stream(self, stream: BinaryIO, suffix: str) -> str:
+        # The key is the content hash, so the content is spooled (in memory up to a few MB) to hash it first
+        with tempfile.SpooledTemporaryFile(max_size=8 * CHUNK_SIZE) as spool:
+            key = content_key(_hash_stream(stream, spool), suffix)
+            if self._exists(key):
+                registry.inc("storage_put", result="exists")
+                return key
+            spool.seek(0)
+            # Multipart for large objects, streamed from the spool
+            self.client.upload_fileobj(spool, self.bucket, self.prefix + key)
+        registry.inc("storage_put", result="uploaded")
+        return key
+
+    def local_path(self, key: str) -> str:
+        _check_key(key)
+        path = self.cache._path(key)
+        with self._lock:
+            if key in self._cached and os.path.exists(path):
+                self._cached[key] = self._cached.pop(key)
+                self._read_at[key] = time.monotonic()
+                os.utime(path)
+                registry.inc("storage_cache", result="hit")
+                return path
+        registry.inc("storage_cache", result="miss")
+
+        from botocore.exceptions import ClientError
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".download-", dir=self.cache.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                try:
+                    self.client.download_fileobj(self.bucket, self.prefix + key, f)
+                except ClientError as e:
+                    if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                        raise ObjectNotFound(key)
+                    raise
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        with self._lock:
+            self._cached[key] = os.path.getsize(path)
+            self._read_at[key] = time.monotonic()
+            self._evict()
+        return path
+
+    def _evict(self):
+        total = sum(self._cached.values())
+        recent = time.monotonic() - self.cache_grace_s
+        for key in list(self._cached):
+            if total <= self.cache_max_bytes:
+                break
+            if self._read_at.get(key, 0) > recent:
+                continue
+            total -= self._cached.pop(key)
+            self._read_at.pop(key, None)
+            try:
+                os.unlink(self.cache._path(key))
+            except OSError:
+                pass
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+
+def open_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(STORAGE_S3_BUCKET, STORAGE_S3_PREFIX, STORAGE_S3_ENDPOINT or None,
+                         STORAGE_S3_REGION or None, STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_MB * 1024 * 1024,
+                         STORAGE_CACHE_GRACE_S)
+    if STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected local or s3")
+    return LocalStorage(STORAGE_ROOT)
+
+
+storage = open_storage()
+
+
+def put_bytes(data, suffix: str) -> str:
+    """Store bytes (or a buffer such as cv2.imencode's output); returns the key."""
+    return storage.put_stream(io.BytesIO(memoryview(data).cast("B")), suffix)
+
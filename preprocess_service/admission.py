@@ -0,0 +1,175 @@
+# admission.py
+"""
+Admission control: a per-service concurrency limit with a short priority queue.
+
+At most `limit` requests run at once; up to `queue_size` more wait for a
+slot, interactive requests ahead of batch ones. A request is turned away
+with 429 and a Retry-After header (queue length x observed service time /
+limit) when the queue is full, or when it has waited queue_timeout seconds,
+so overload shows up as fast rejections rather than upstream timeouts.
+
+Requests marked "X-Priority: batch" (bulk and queued work) are dequeued
+after interactive ones and may only use half the queue, which keeps room
+for counter traffic during spikes. The header is passed downstream with the
+request id. The slot is held until the response body is complete, so
+streaming responses count for their whole duration.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+
+from fastapi import FastAPI
+
+PRIORITY_HEADER = "X-Priority"
+INTERACTIVE, BATCH = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Never queued or rejected
+EXEMPT_PATHS = {"/health", "/metrics", "/docs", "/openapi.json"}
+
+
+def priority_from(value) -> int:
+    return BATCH if (value or "").strip().lower() == "batch" else INTERACTIVE
+
+
+class AdmissionController:
+    def __init__(self, limit: int = 8, queue_size: int = 32, queue_timeout: float = 30.0):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = {INTERACTIVE: 0, BATCH: 0}
+        self.rejected = {INTERACTIVE: 0, BATCH: 0}
+        self.service_ms = None  # moving average of admitted requests' duration
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    def _queue_full(self, priority: int) -> bool:
+        waiting = sum(self.queued.values())
+        if priority == BATCH:
+            return waiting >= self.queue_size // 2
+        return waiting >= self.queue_size
+
+    async def acquire(self, priority: int) -> bool:
+        """Wait for a slot; False if the request should be rejected."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if self._queue_full(priority):
+            return False
+
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), granted))
+        self.queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            # The slot may have been handed over as the wait timed out
+            return granted.done() and not granted.cancelled()
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                self.release()
+            raise
+        finally:
+            self.queued[priority] -= 1
+            if not granted.done():
+                granted.cancel()
+
+    def release(self):
+        # Hand the slot straight to the next live waiter, so active stays the same
+        while self._waiters:
+            _, _, granted = heapq.heappop(self._waiters)
+            if not granted.done():
+                granted.set_result(True)
+                return
+        self.active -= 1
+
+    def observe(self, ms: float):
+        self.service_ms = ms if self.service_ms is None else 0.8 * self.service_ms + 0.2 * ms
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new request."""
+        service_s = (self.service_ms or 1000) / 1000
+        waiting = sum(self.queued.values())
+        return max(1, math.ceil((waiting + 1) * service_s / self.limit))
+
+    def capacity(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.active,
+            "queue_size": self.queue_size,
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self.queued.items()},
+            "rejected": {PRIORITY_NAMES[p]: n for p, n in self.rejected.items()},
+            "avg_service_ms": round(self.service_ms, 2) if self.service_ms is not None else None,
+            "retry_after_s": self.retry_after(),
+        }
+
+    def install(self, app: FastAPI, limit: int, queue_size: int, queue_timeout: float, registry=None,
+                batch_paths=()):
+        """
+        Wrap the app in admission control (call before profiler/metrics installs,
+        so rejections are still counted and carry the request id).
+        batch_paths are routes whose requests are batch priority by default.
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        if registry is not None:
+            registry.register("admission_in_flight", "gauge", lambda: self.active)
+            registry.register("admission_queued", "gauge",
+                              lambda: {PRIORITY_NAMES[p]: n for p, n in self.queued.items()}, label="priority")
+            registry.register("admission_rejected", "counter",
+                              lambda: {PRIORITY_NAMES[p]: n for p, n in self.rejected.items()}, label="priority")
+        app.add_middleware(_AdmissionMiddleware, controller=self, batch_paths=frozenset(batch_paths))
+
+
+class _AdmissionMiddleware:
+    """Plain ASGI middleware, so the slot covers the whole response, streamed bodies included."""
+
+    def __init__(self, app, controller: AdmissionController, batch_paths: frozenset):
+        self.app = app
+        self.controller = controller
+        self.batch_paths = batch_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        header = next((v.decode("latin-1") for k, v in scope["headers"] if k == PRIORITY_HEADER.lower().encode()), None)
+        priority = priority_from(header) if header else (BATCH if scope["path"] in self.batch_paths else INTERACTIVE)
+        scope.setdefault("state", {})["priority"] = PRIORITY_NAMES[priority]
+
+        controller = self.controller
+        if not await controller.acquire(priority):
+            controller.rejected[priority] += 1
+            await _reject(send, controller.retry_after())
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
+            controller.observe((time.perf_counter() - start) * 1000)
+
+
+async def _reject(send, retry_after: int):
+    body = json.dumps({"detail": "Service is at capacity, retry later"}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+admission = AdmissionController()
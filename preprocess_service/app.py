@@ -1,44 +1,96 @@
 # preprocess_service/app.py
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+# Sets the thread limits the native libraries read at import, so it comes first
+from cpu_budget import budget
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import cv2
 import numpy as np
 import uvicorn
-import shutil, os, uuid
+import shutil, os, time, json, asyncio, uuid
 import httpx
+from typing import Optional, Tuple
 
 from model_inference import detect_card
-from preprocessing import preprocess_pipeline
-from face_detector import face_detector
-from config import OCR_SERVICE_URL, OCR_CALL_TIMEOUT, SHARED_DATA_PATH
+from preprocessing import preprocess_pipeline, encode_detail
+from face_detector import face_detector, face_score
+from quality import assess_quality, quality_issues
+from card_merge import merge_sides
+from storage import storage, put_bytes
+from config import (
+    OCR_SERVICE_URL, OCR_STREAM_URL, OCR_CALL_TIMEOUT, SHARED_DATA_PATH, MIN_RESOLUTION, QUALITY_GATE,
+    SESSION_SWAP_MARGIN,
+    PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS,
+    ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT_S,
+    MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_TTL_S, MODEL_PIN, MODEL_PRELOAD,
+)
+from metrics import registry, REQUEST_ID_HEADER, REQUEST_ID_MAX_LEN
+from model_registry import models
+from profiling import profiler, downstream_headers
+from admission import admission
 
 app = FastAPI()
+admission.install(app, ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT_S, registry)
+profiler.install(app, "preprocess_service", PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS)
+registry.install(app, "preprocess_service")
+registry.register("cpu_threads", "gauge", lambda: budget.threads)
+models.install(app, MODEL_MEMORY_BUDGET_MB, MODEL_IDLE_TTL_S, MODEL_PIN, MODEL_PRELOAD, registry)
 
 DATA_DIR = SHARED_DATA_PATH
 os.makedirs(DATA_DIR, exist_ok=True)
 
 
-@app.post("/preprocess")
-async def preprocess_image(file: UploadFile = File(...)):
-    # 1) save upload
-    uid = uuid.uuid4().hex
-    ext = os.path.splitext(file.filename)[1] or ".png"
-    raw_path = os.path.join(DATA_DIR, f"{uid}_raw{ext}")
-    with open(raw_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+def _record(timings: dict, stage: str, start: float):
+    """Store a stage duration in the response timings and the /metrics histogram."""
+    ms = (time.perf_counter() - start) * 1000
+    timings[stage] = round(ms, 2)
+    registry.observe(stage, ms)
 
-    # 2) load with cv2
-    img = cv2.imread(raw_path)
-    (img_height, img_width) = img.shape[:2]
-    max_width = 640
-
-    if img_width < max_width:
-        raise HTTPException(status_code = 422, detail="Low Image quality. Try with higher resolution image.")
 
+def check_quality(img, timings: dict) -> dict:
+    """Reject unreadable, low-resolution or unusable photos before detection; returns the quality measures."""
     if img is None:
         raise HTTPException(status_code=400, detail="Could not read uploaded image")
+    if img.shape[1] < MIN_RESOLUTION:
+        registry.inc("quality_rejected", check="resolution")
+        raise HTTPException(status_code=422, detail="Low Image quality. Try with higher resolution image.")
+    if not QUALITY_GATE:
+        return {}
+
+    t = time.perf_counter()
+    metrics = assess_quality(img)
+    _record(timings, "quality", t)
+    issues = quality_issues(metrics)
+    if issues:
+        for issue in issues:
+            registry.inc("quality_rejected", check=issue["check"])
+        raise HTTPException(status_code=422, detail={
+            "message": " ".join(issue["message"] for issue in issues),
+            "reasons": issues,
+            "quality": metrics,
+        })
+    return metrics
+
+
+def save_upload(file: UploadFile, tag: str = ""):
+    """
+    Write the upload to DATA_DIR as <uuid><tag>_raw<ext> and decode it; returns (path, image or None).
+    The name is generated here, never taken from the client's request id or file name.
+    """
+    ext = os.path.splitext(file.filename or "")[1] or ".png"
+    raw_path = os.path.join(DATA_DIR, f"{uuid.uuid4().hex}{tag}_raw{ext}")
+    with open(raw_path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
+    return raw_path, cv2.imread(raw_path)
+
 
-    # 3) detect and crop (detect_card should accept ndarray or path and return ndarray)
+def detect_and_preprocess(img, raw_path: str, timings: dict):
+    """
+    Detect and crop the card, then run the preprocess pipeline; returns the processed image
+    and its detail copy for OCR refinement (None when the card is too small to need one).
+    """
+    # detect_card accepts ndarray or path and returns ndarray
+    t = time.perf_counter()
     try:
         cropped = detect_card(img, image_path=raw_path)
         if cropped is None:
@@ -47,45 +99,371 @@ async def preprocess_image(file: UploadFile = File(...)):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Detection error: {e}")
+    _record(timings, "detect", t)
 
-    # 4) preprocess pipeline (returns uint8 ndarray)
+    # preprocess pipeline (returns uint8 ndarray)
+    t = time.perf_counter()
     try:
-        processed = preprocess_pipeline(cropped)  # must be contiguous uint8 
+        processed, detail = preprocess_pipeline(cropped, return_detail=True)  # must be contiguous uint8 
         processed = np.ascontiguousarray(processed, dtype=np.uint8)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Preprocessing error: {e}")
-    
-    #5) Face-Detection
-    detected_side = face_detector(processed)
-    print(f"Card is: {detected_side} facing.")
+    _record(timings, "preprocess", t)
+    return processed, detail
+
 
-    # 6) save processed image
-    proc_path = os.path.join(DATA_DIR, f"{uid}_proc.png")
-    ok = cv2.imwrite(proc_path, processed)
+def store_processed(processed) -> str:
+    """PNG-encode the processed image and put it in object storage; returns its key."""
+    ok, buf = cv2.imencode(".png", processed)
     if not ok:
-        raise HTTPException(status_code=500, detail=f"Failed to write processed file: {proc_path}")
+        raise HTTPException(status_code=500, detail="Failed to encode processed image")
+    try:
+        return put_bytes(buf, ".png")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store processed image: {type(e).__name__}: {e}")
 
-    # 7) Call OCR microservice (which in turn calls LLM) and return final JSON
+
+def store_detail(detail) -> Optional[str]:
+    """Store the detail copy (encoded as OCR_DETAIL_FORMAT); its key, or None without one."""
+    if detail is None:
+        return None
+    try:
+        buf, suffix = encode_detail(detail)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        return put_bytes(buf, suffix)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store detail image: {type(e).__name__}: {e}")
+
+
+async def store_images(processed, detail, timings: dict) -> Tuple[str, Optional[str]]:
+    """
+    Both images of a card, stored concurrently; returns (processed key, detail
+    key or None). Each is timed as its own stage, "store" and "store_detail".
+    """
+    def timed(store, image, stage: str):
+        t = time.perf_counter()
+        key = store(image)
+        if image is not None:
+            _record(timings, stage, t)
+        return key
+
+    proc_key, detail_key = await asyncio.gather(run_in_threadpool(timed, store_processed, processed, "store"),
+                                                run_in_threadpool(timed, store_detail, detail, "store_detail"))
+    return proc_key, detail_key
+
+
+def ocr_request(proc_key: str, card_side: str, detail_key: Optional[str]) -> dict:
+    body = {"image_key": proc_key, "card_side": card_side}
+    if detail_key:
+        body["detail_key"] = detail_key
+    return body
+
+
+async def call_ocr(proc_key: str, card_side: str, headers: dict, detail_key: Optional[str] = None) -> dict:
+    """OCR (and, through it, LLM) call for one stored processed image; returns the final JSON."""
     try:
         async with httpx.AsyncClient(timeout=OCR_CALL_TIMEOUT) as client:
-            resp = await client.post(OCR_SERVICE_URL, json={"image_path": proc_path,"card_side":detected_side})
+            resp = await client.post(
+                OCR_SERVICE_URL,
+                json=ocr_request(proc_key, card_side, detail_key),
+                headers=headers,
+            )
             resp.raise_for_status()
-            final_json = resp.json()
+            return resp.json()
     except httpx.HTTPStatusError as e:
         # downstream returned non-200
         detail = f"OCR service returned {e.response.status_code}: {e.response.text}"
+        if e.response.status_code == 429:
+            raise HTTPException(status_code=429, detail=detail,
+                                headers={"Retry-After": e.response.headers.get("Retry-After", "1")})
         raise HTTPException(status_code=502, detail=detail)
     except Exception as e:
         # network error, timeout, etc.
         raise HTTPException(status_code=502, detail=f"OCR/LLM call failed: {type(e).__name__}: {e}")
 
+
+@app.post("/preprocess")
+async def preprocess_image(request: Request, file: UploadFile = File(...)):
+    timings = {}
+
+    # 1) save upload and load with cv2
+    t = time.perf_counter()
+    uid = request.state.request_id
+    # Every CPU stage runs in a thread: on the event loop it would stall all
+    # other requests, admission's queue and 429s included
+    raw_path, img = await run_in_threadpool(save_upload, file)
+    _record(timings, "decode", t)
+    quality = await run_in_threadpool(check_quality, img, timings)
+
+    # 2-4) detect, crop and preprocess
+    processed, detail = await run_in_threadpool(detect_and_preprocess, img, raw_path, timings)
+
+    #5) Face-Detection
+    t = time.perf_counter()
+    detected_side = await run_in_threadpool(face_detector, processed)
+    _record(timings, "side_detect", t)
+    registry.inc("card_side", side=detected_side)
+    print(f"Card is: {detected_side} facing.")
+
+    # 6) store processed image (and detail copy); ocr_service fetches them by key
+    proc_key, detail_key = await store_images(processed, detail, timings)
+
+    # 7) Call OCR microservice (which in turn calls LLM) and return final JSON
+    t = time.perf_counter()
+    final_json = await call_ocr(proc_key, detected_side, downstream_headers(request), detail_key)
+    _record(timings, "ocr_call", t)
+
     # Return both paths for debugging plus the final structured JSON the LLM produced
-    return JSONResponse({"raw_path": raw_path, "processed_path": proc_path, "result": final_json})
+    return JSONResponse({
+        "request_id": uid,
+        "raw_path": raw_path,
+        "processed_key": proc_key,
+        "processed_path": storage.location(proc_key),
+        "result": final_json,
+        "quality": quality,
+        "timings_ms": timings,
+    })
+
+def sse_or_ndjson(event: str, data: dict, sse: bool) -> bytes:
+    body = json.dumps(data, ensure_ascii=False)
+    if sse:
+        return f"event: {event}\ndata: {body}\n\n".encode("utf-8")
+    return json.dumps({"event": event, **data}, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+@app.post("/preprocess/stream")
+async def preprocess_stream(request: Request, file: UploadFile = File(...)):
+    """
+    /preprocess with progress: each stage's result is sent as soon as it is ready.
+
+    Events, as NDJSON lines {"event": ..., ...} or, with "Accept: text/event-stream",
+    as server-sent events:
+      detected  crop box in pixels and the input size
+      side      detected card side and the processed image's storage key and location
+      ocr       raw OCR text and engine
+      result    the /preprocess response body
+      error     status_code and detail; ends the stream
+
+    Unreadable, low-resolution or low-quality uploads still fail with a plain
+    400/422 before streaming starts. Disconnecting cancels the OCR/LLM calls downstream.
+    """
+    timings = {}
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    t = time.perf_counter()
+    uid = request.state.request_id
+    raw_path, img = await run_in_threadpool(save_upload, file)
+    _record(timings, "decode", t)
+    quality = await run_in_threadpool(check_quality, img, timings)
+
+    def event(name: str, **data) -> bytes:
+        return sse_or_ndjson(name, data, sse)
+
+    async def events():
+        try:
+            # CPU stages run in threads so events flush between them and disconnects are seen
+            t = time.perf_counter()
+            try:
+                detected = await run_in_threadpool(detect_card, img, image_path=raw_path, return_box=True)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Detection error: {e}")
+            if detected is None:
+                raise HTTPException(status_code=404, detail="No ID card detected")
+            cropped, (left, top, right, bottom) = detected
+            _record(timings, "detect", t)
+            yield event("detected", request_id=uid,
+                        box={"left": left, "top": top, "right": right, "bottom": bottom},
+                        image_size={"width": img.shape[1], "height": img.shape[0]},
+                        timings_ms=dict(timings))
+
+            t = time.perf_counter()
+            try:
+                processed, detail = await run_in_threadpool(preprocess_pipeline, cropped, return_detail=True)
+                processed = np.ascontiguousarray(processed, dtype=np.uint8)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Preprocessing error: {e}")
+            _record(timings, "preprocess", t)
+
+            t = time.perf_counter()
+            detected_side = await run_in_threadpool(face_detector, processed)
+            _record(timings, "side_detect", t)
+            registry.inc("card_side", side=detected_side)
+
+            proc_key, detail_key = await store_images(processed, detail, timings)
+            proc_path = storage.location(proc_key)
+            yield event("side", request_id=uid, card_side=detected_side, processed_key=proc_key,
+                        processed_path=proc_path,
+                        timings_ms={k: timings[k] for k in ("preprocess", "side_detect", "store", "store_detail")
+                                    if k in timings})
+
+            t = time.perf_counter()
+            try:
+                async with httpx.AsyncClient(timeout=OCR_CALL_TIMEOUT) as client:
+                    async with client.stream(
+                        "POST", OCR_STREAM_URL,
+                        json=ocr_request(proc_key, detected_side, detail_key),
+                        headers=downstream_headers(request),
+                    ) as resp:
+                        if resp.status_code != 200:
+                            body = (await resp.aread()).decode("utf-8", "replace")
+                            raise HTTPException(status_code=429 if resp.status_code == 429 else 502,
+                                                detail=f"OCR service returned {resp.status_code}: {body}")
+                        async for line in resp.aiter_lines():
+                            if not line.strip():
+                                continue
+                            msg = json.loads(line)
+                            name = msg.pop("event")
+                            if name == "error":
+                                raise HTTPException(
+                                    status_code=429 if msg.get("status_code") == 429 else 502,
+                                    detail=f"OCR service returned {msg.get('status_code')}: {msg.get('detail')}")
+                            if name != "result":
+                                yield event(name, **msg)
+                                continue
+
+                            _record(timings, "ocr_call", t)
+                            yield event("result", request_id=uid, raw_path=raw_path, processed_key=proc_key,
+                                        processed_path=proc_path, result=msg["result"], quality=quality,
+                                        timings_ms=timings)
+                            return
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=f"OCR/LLM call failed: {type(e).__name__}: {e}")
+            raise HTTPException(status_code=502, detail="OCR service closed the stream without a result")
+        except HTTPException as e:
+            yield event("error", request_id=uid, status_code=e.status_code, detail=e.detail)
+        except Exception as e:
+            yield event("error", request_id=uid, status_code=500, detail=f"{type(e).__name__}: {e}")
+        except asyncio.CancelledError:
+            registry.inc("stream_disconnects")
+            print(f"Client disconnected, cancelled {uid}")
+            raise
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+async def _for_side(side: str, coro):
+    """Await one side's work, naming the side in any error."""
+    try:
+        return await coro
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail={"side": side, "detail": e.detail}, headers=e.headers)
+
+
+async def both_sides(front, back):
+    """Run the two sides' coroutines together; if one fails the other is cancelled."""
+    tasks = [asyncio.ensure_future(_for_side("front", front)), asyncio.ensure_future(_for_side("back", back))]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+def assign_sides(front_score: float, back_score: float) -> str:
+    """
+    "confirmed" or "swapped" when the face scores decide which upload is the
+    photo side, "declared" (kept as uploaded) when they cannot tell.
+    """
+    decisive = (front_score > 0) != (back_score > 0) or abs(front_score - back_score) > SESSION_SWAP_MARGIN
+    if not decisive:
+        return "declared"
+    return "confirmed" if front_score > back_score else "swapped"
+
+
+@app.post("/session")
+async def card_session(request: Request, front: UploadFile = File(...), back: UploadFile = File(...)):
+    """
+    Both sides of one card in one call, processed concurrently end to end.
+
+    The side classifier's face scores confirm the front/back labels or swap
+    them when the uploads were mixed up. The two results are merged into one
+    record with the fields both sides carry cross-checked (see card_merge.py).
+    Errors name the side they come from: {"detail": {"side", "detail"}}.
+    """
+    uid = request.state.request_id
+    timings = {"front": {}, "back": {}}
+    uploads = {}
+    for side, file in (("front", front), ("back", back)):
+        t = time.perf_counter()
+        raw_path, img = await run_in_threadpool(save_upload, file, f"_{side}")
+        _record(timings[side], "decode", t)
+        uploads[side] = {"raw_path": raw_path, "img": img}
+
+    def prepare(side: str):
+        upload = uploads[side]
+        upload["quality"] = check_quality(upload["img"], timings[side])
+        processed, upload["detail"] = detect_and_preprocess(upload.pop("img"), upload["raw_path"], timings[side])
+        t = time.perf_counter()
+        score = face_score(processed)
+        _record(timings[side], "side_detect", t)
+        return processed, score
+
+    # CPU stages in two threads at once
+    (front_img, front_score), (back_img, back_score) = await both_sides(
+        run_in_threadpool(prepare, "front"), run_in_threadpool(prepare, "back"))
+
+    assignment = assign_sides(front_score, back_score)
+    registry.inc("session_sides", assignment=assignment)
+    if assignment == "swapped":
+        print(f"Session {uid}: uploads were swapped (face scores {front_score:.2f} / {back_score:.2f})")
+        front_img, back_img = back_img, front_img
+        front_score, back_score = back_score, front_score
+        uploads["front"], uploads["back"] = uploads["back"], uploads["front"]
+        timings["front"], timings["back"] = timings["back"], timings["front"]
+
+    async def store(side: str, processed):
+        return await store_images(processed, uploads[side].pop("detail"), timings[side])
+
+    (front_key, front_detail), (back_key, back_detail) = await both_sides(store("front", front_img),
+                                                                          store("back", back_img))
+    keys = {"front": front_key, "back": back_key}
+    detail_keys = {"front": front_detail, "back": back_detail}
+
+    async def ocr(side: str):
+        # Each side gets its own downstream request id, so their logs and metadata stay apart;
+        # uid is cut so the suffixed id still passes downstream's length check
+        side_id = f"{uid[:REQUEST_ID_MAX_LEN - len(side) - 1]}-{side}"
+        headers = {**downstream_headers(request), REQUEST_ID_HEADER: side_id}
+        t = time.perf_counter()
+        result = await call_ocr(keys[side], side, headers, detail_keys[side])
+        _record(timings[side], "ocr_call", t)
+        return result
+
+    front_json, back_json = await both_sides(ocr("front"), ocr("back"))
+    merged = merge_sides(front_json, back_json)
+    registry.inc("session_checks", consistent=merged["consistent"])
+
+    sides = {}
+    for side, result in (("front", front_json), ("back", back_json)):
+        sides[side] = {
+            "raw_path": uploads[side]["raw_path"],
+            "processed_key": keys[side],
+            "processed_path": storage.location(keys[side]),
+            "result": result,
+            "quality": uploads[side]["quality"],
+            "timings_ms": timings[side],
+        }
+    return JSONResponse({
+        "request_id": uid,
+        "side_assignment": {
+            "status": assignment,
+            "face_scores": {"front": round(front_score, 3), "back": round(back_score, 3)},
+        },
+        **merged,
+        **sides,
+    })
+
 
 @app.get("/health")
 def health():
     """Health check endpoint for Docker"""
-    return {"status": "running", "service": "preprocess_service"}
+    return {"status": "running", "service": "preprocess_service", "capacity": admission.capacity()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+# card_merge.py
+"""
+One record from the two sides of a card, with the fields both sides carry
+cross-checked.
+
+The front is in Nepali and the back in English, so values are compared in
+a script-neutral form: numbers as their digits (Devanagari digits read as
+ASCII, leading zeros kept), gender by meaning, and districts and municipalities through
+the gazetteer, whose Nepali and English files list the same places in the
+same order. Dates of birth are compared in full when both sides use the
+same calendar; the front is usually in Bikram Sambat and the back in AD,
+and then only the years are checked (BS runs 56-57 years ahead).
+
+Each check is "match", "mismatch", "missing" (absent on a side) or
+"unchecked" (no way to compare, e.g. a place missing from the gazetteer).
+A mismatched field is left empty in the record, so it gets a human look.
+"""
+import json
+import re
+from functools import lru_cache
+
+from config import GAZETTEER_NE_PATH, GAZETTEER_EN_PATH
+
+_ASCII_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+_GENDERS = (("female", "female"), ("महिला", "female"), ("male", "male"), ("पुरुष", "male"),
+            ("other", "other"), ("अन्य", "other"))
+
+BACK_KEYS = {
+    "birth_district": "Birth Place District",
+    "birth_municipality": "Birth Place MetroPolitan/Sub-MetroPolitan/Municipality/VDC",
+    "birth_ward": "Birth Place Ward",
+    "permanent_district": "Permanent District",
+    "permanent_municipality": "Permanent MetroPolitan/Sub-MetroPolitan/Municipality/VDC",
+    "permanent_ward": "Permanent Ward",
+}
+
+
+def _key(name) -> str:
+    return " ".join(str(name).split()).casefold()
+
+
+@lru_cache(maxsize=1)
+def _place_names():
+    """({nepali district: english}, {(nepali district, nepali municipality): english}) from the gazetteer."""
+    districts, municipalities = {}, {}
+    try:
+        with open(GAZETTEER_NE_PATH, "r", encoding="utf-8") as f:
+            ne = json.load(f)
+        with open(GAZETTEER_EN_PATH, "r", encoding="utf-8") as f:
+            en = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: gazetteer not loaded, places will be unchecked: {e}")
+        return districts, municipalities
+
+    for ne_province, en_province in zip(ne.values(), en.values()):
+        if len(ne_province) != len(en_province):
+            continue
+        for (ne_district, ne_munis), (en_district, en_munis) in zip(ne_province.items(), en_province.items()):
+            districts[_key(ne_district)] = en_district.strip()
+            # The two files disagree on a district or two; only pair municipalities where they line up
+            if [len(w) for w in ne_munis.values()] != [len(w) for w in en_munis.values()]:
+                continue
+            for ne_muni, en_muni in zip(ne_munis, en_munis):
+                municipalities[(_key(ne_district), _key(ne_muni))] = en_muni.strip()
+    return districts, municipalities
+
+
+def _numbers(value) -> list:
+    return [int(n) for n in re.findall(r"\d+", str(value).translate(_ASCII_DIGITS))]
+
+
+def _gender(value):
+    text = _key(value)
+    return next((g for token, g in _GENDERS if token in text), text)
+
+
+def _check(front, back, same) -> str:
+    if front in (None, "") or back in (None, ""):
+        return "missing"
+    result = same(front, back)
+    if result is None:
+        return "unchecked"
+    return "match" if result else "mismatch"
+
+
+def _digits(value) -> str:
+    return re.sub(r"\D", "", str(value).translate(_ASCII_DIGITS))
+
+
+def _same_number(front, back):
+    # Compared as strings: "01-23" and "1-023" are different numbers
+    return _digits(front) == _digits(back)
+
+
+def _same_ward(front, back):
+    a, b = _numbers(front), _numbers(back)
+    return None if not a or not b else a[0] == b[0]
+
+
+def _same_date(front, back):
+    a, b = _numbers(front), _numbers(back)
+    if len(a) < 3 or len(b) < 3:
+        return None
+    if abs(a[0] - b[0]) < 30:
+        return a[:3] == b[:3]
+    # One side in Bikram Sambat, the other in AD: only the year can be checked without a calendar table
+    return abs(a[0] - b[0]) in (56, 57)
+
+
+def _same_district(front, back):
+    english = _place_names()[0].get(_key(front))
+    return None if english is None else _key(english) == _key(back)
+
+
+def _same_municipality(front_district):
+    def same(front, back):
+        english = _place_names()[1].get((_key(front_district or ""), _key(front)))
+        return None if english is None else _key(english) == _key(back)
+    return same
+
+
+def merge_sides(front: dict, back: dict) -> dict:
+    """
+    front: the front's post-processed result (with "final_clean"); back: the back's.
+    Returns {"record", "checks", "consistent", "mismatches"}.
+    """
+    f = front.get("final_clean", front) if isinstance(front, dict) else {}
+    b = back if isinstance(back, dict) else {}
+    birth, perm = f.get("Birth Place") or {}, f.get("Permanent Address") or {}
+
+    compared = {
+        "citizenship_number": (f.get("Citizenship Number"), b.get("Citizenship Number"), _same_number),
+        "date_of_birth": (f.get("Date of Birth (DOB)"), b.get("Date of Birth (DOB)"), _same_date),
+        "gender": (f.get("Gender"), b.get("Gender"), lambda x, y: _gender(x) == _gender(y)),
+        "birth_district": (birth.get("District"), b.get(BACK_KEYS["birth_district"]), _same_district),
+        "birth_municipality": (birth.get("Municipality/VDC"), b.get(BACK_KEYS["birth_municipality"]),
+                               _same_municipality(birth.get("District"))),
+        "birth_ward": (birth.get("Ward"), b.get(BACK_KEYS["birth_ward"]), _same_ward),
+        "permanent_district": (perm.get("District"), b.get(BACK_KEYS["permanent_district"]), _same_district),
+        "permanent_municipality": (perm.get("Municipality/VDC"), b.get(BACK_KEYS["permanent_municipality"]),
+                                   _same_municipality(perm.get("District"))),
+        "permanent_ward": (perm.get("Ward"), b.get(BACK_KEYS["permanent_ward"]), _same_ward),
+    }
+
+    checks, record = {}, {
+        "name": b.get("Name") or None,
+        "name_ne": f.get("Name"),
+        "father_name": f.get("Father's Name"),
+        "mother_name": f.get("Mother's Name"),
+        "spouse_name": f.get("Spouse Name"),
+        "issued_date": b.get("Issued Date") or None,
+    }
+    for field, (front_value, back_value, same) in compared.items():
+        status = _check(front_value, back_value, same)
+        checks[field] = {"status": status, "front": front_value, "back": back_value}
+        # The English side is the record's script; the front fills in what the back lacks
+        record[field] = None if status == "mismatch" else (back_value if back_value not in (None, "") else front_value)
+    # The front's date is kept as well: the back's is usually AD, the front's BS
+    record["date_of_birth_bs"] = f.get("Date of Birth (DOB)")
+
+    mismatches = [field for field, check in checks.items() if check["status"] == "mismatch"]
+    return {"record": record, "checks": checks, "consistent": not mismatches, "mismatches": mismatches}
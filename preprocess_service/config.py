@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Shared data path
@@ -19,22 +20,123 @@ os.makedirs(SHARED_DATA_PATH, exist_ok=True)
 
 # Output path for cropped images
 CROPPED_OUTPUT_PATH = Path(SHARED_DATA_PATH)
+# Crops are only written for debugging (SAVE_CROPS=1), as PNG; compression
+# level 0-9, where 1 encodes fast at a modest size
+SAVE_CROPS = os.getenv("SAVE_CROPS", "0") == "1"
+CROP_PNG_COMPRESSION = int(os.getenv("CROP_PNG_COMPRESSION", "1"))
 
 # Model paths
 MODEL_DIR = Path(MODELS_PATH)
 PATH_TO_MODEL = str(MODEL_DIR)
 PATH_TO_LABELS = str(MODEL_DIR / "labelmap.pbtxt")
 
+# Card detector: "tensorflow" (the SavedModel in MODELS_PATH) or "contour"
+# (OpenCV edges and quadrilateral fit, see contour_detector.py; TensorFlow
+# is then never imported)
+DETECTOR = os.getenv("DETECTOR", "tensorflow")
+
 # Inference settings
 MIN_SCORE = 0.6
 MIN_RESOLUTION = 640
 
+# Contour detector: width/height of the rectified card, edge map size, and
+# the smallest share of the frame a card outline may cover
+CARD_ASPECT = float(os.getenv("CARD_ASPECT", "1.587"))
+CONTOUR_MAX_SIDE = int(os.getenv("CONTOUR_MAX_SIDE", "640"))
+CONTOUR_MIN_AREA = float(os.getenv("CONTOUR_MIN_AREA", "0.2"))
+
+# Quality gate (see quality.py), measured on a copy downsampled to
+# QUALITY_MAX_SIDE px. Sharpness is the Laplacian variance over the card,
+# glare the fraction of its pixels at or above QUALITY_GLARE_LEVEL, brightness
+# its mean gray level, card area its share of the frame. QUALITY_GATE=0 turns
+# the gate off.
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") != "0"
+QUALITY_MAX_SIDE = int(os.getenv("QUALITY_MAX_SIDE", "512"))
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "40"))
+QUALITY_GLARE_LEVEL = int(os.getenv("QUALITY_GLARE_LEVEL", "250"))
+QUALITY_MAX_GLARE = float(os.getenv("QUALITY_MAX_GLARE", "0.25"))
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "50"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "235"))
+QUALITY_MIN_CARD_AREA = float(os.getenv("QUALITY_MIN_CARD_AREA", "0.15"))
+
+# Hough-based deskew in preprocess_pipeline; "0" skips it for uploads that
+# are already straight
+DESKEW = os.getenv("DESKEW", "1") != "0"
+
+# OCR reads the card at 640px on its longest side. A detail copy of the
+# deskewed card, up to OCR_DETAIL_MAX_DIM px, goes with it so ocr_service can
+# re-read low-confidence lines at higher resolution (0: no detail copy)
+OCR_DETAIL_MAX_DIM = int(os.getenv("OCR_DETAIL_MAX_DIM", "1600"))
+# Every card pays for storing the detail copy, though few have it read:
+# "jpeg" at OCR_DETAIL_JPEG_QUALITY encodes in a fraction of the time and
+# size of "png" (lossless)
+OCR_DETAIL_FORMAT = os.getenv("OCR_DETAIL_FORMAT", "jpeg")
+OCR_DETAIL_JPEG_QUALITY = int(os.getenv("OCR_DETAIL_JPEG_QUALITY", "90"))
+
+# Gazetteer files /session uses to compare Nepali and English place names
+GAZETTEER_NE_PATH = os.getenv("GAZETTEER_NE_PATH", os.path.join(SHARED_DATA_PATH, "nepal_municipalities_by_district.json"))
+GAZETTEER_EN_PATH = os.getenv("GAZETTEER_EN_PATH", os.path.join(SHARED_DATA_PATH, "en_nepal_municipalities_by_district.json"))
+
+# /session swaps the uploaded sides when the "back" image's face score beats
+# the "front" one's by more than this (both or neither having a face)
+SESSION_SWAP_MARGIN = float(os.getenv("SESSION_SWAP_MARGIN", "1.0"))
+
 # OCR Service URL (Docker service name)
 OCR_SERVICE_URL = os.getenv("OCR_SERVICE_URL", "http://localhost:9000/ocr")
+# Streaming variant, used by /preprocess/stream
+OCR_STREAM_URL = os.getenv("OCR_STREAM_URL", f"{OCR_SERVICE_URL.rstrip('/')}/stream")
 
 # Timeout for OCR -> LLM pipeline
 OCR_CALL_TIMEOUT = 300
 
+# Object storage for the processed images passed to ocr_service (see
+# storage.py): "local" keeps them under STORAGE_ROOT, which both services must
+# share; "s3" uses STORAGE_S3_BUCKET (STORAGE_S3_ENDPOINT for MinIO or another
+# S3-compatible server), read through a cache of STORAGE_CACHE_MAX_MB. A
+# cached object read in the last STORAGE_CACHE_GRACE_S seconds is not
+# evicted, since its reader may not have opened the file yet
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", os.path.join(SHARED_DATA_PATH, "objects"))
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "")
+STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "nagarikta")
+STORAGE_S3_ENDPOINT = os.getenv("STORAGE_S3_ENDPOINT", "")
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION", "")
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "nagarikta-objects"))
+STORAGE_CACHE_MAX_MB = int(os.getenv("STORAGE_CACHE_MAX_MB", "512"))
+STORAGE_CACHE_GRACE_S = float(os.getenv("STORAGE_CACHE_GRACE_S", "120"))
+
+# Request profiling (see profiling.py): requests with "X-Profile: 1", plus
+# this fraction of all requests, are sampled every PROFILE_INTERVAL_MS
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(SHARED_DATA_PATH, "profiles"))
+
+# Admission control (see admission.py): requests running at once, requests
+# allowed to wait for a slot, and how long they may wait before a 429
+ADMISSION_LIMIT = int(os.getenv("ADMISSION_LIMIT", "8"))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "30"))
+
+# Model lifecycle (see model_registry.py): models are loaded on first use.
+# Loading one evicts the least recently used others to stay within
+# MODEL_MEMORY_BUDGET_MB (0: no budget); models unused for MODEL_IDLE_TTL_S
+# are evicted (0: never). MODEL_PIN names models never evicted,
+# MODEL_PRELOAD models loaded at startup (comma-separated; see GET /models).
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+MODEL_IDLE_TTL_S = float(os.getenv("MODEL_IDLE_TTL_S", "0"))
+MODEL_PIN = [m.strip() for m in os.getenv("MODEL_PIN", "").split(",") if m.strip()]
+MODEL_PRELOAD = [m.strip() for m in os.getenv("MODEL_PRELOAD", "").split(",") if m.strip()]
+
+# CPU budget (see cpu_budget.py): threads each native library (OpenCV,
+# OpenMP/BLAS, TensorFlow, PaddleOCR, Tesseract) may use in this process;
+# 0 splits the available CPUs between the WEB_CONCURRENCY uvicorn workers.
+# CPU_AFFINITY pins the process: "auto" (a free slot of CPU_THREADS cores,
+# claimed through lock files in CPU_SLOT_DIR), a CPU list ("0-3,8") or "" (none)
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "")
+CPU_SLOT_DIR = os.getenv("CPU_SLOT_DIR", tempfile.gettempdir())
+
 print(f"[CONFIG] SHARED_DATA_PATH: {SHARED_DATA_PATH}")
 print(f"[CONFIG] MODELS_PATH: {MODELS_PATH}")
+print(f"[CONFIG] DETECTOR: {DETECTOR}")
 print(f"[CONFIG] OCR_SERVICE_URL: {OCR_SERVICE_URL}")
\ No newline at end of file
@@ -0,0 +1,93 @@
+# contour_detector.py
+"""
+Card detection with OpenCV only (DETECTOR=contour).
+
+The card is found as the largest convex quadrilateral among the outer
+contours of a downsampled edge map, falling back to the minimum-area
+rectangle of the largest contour when its corners are rounded or partly
+hidden. The four corners are then warped to a straight card with the
+canonical CARD_ASPECT, so unlike the TensorFlow box this also removes
+rotation and perspective.
+
+No quadrilateral covering CONTOUR_MIN_AREA of the frame means the photo
+is (nearly) all card, and the whole image is used, as the TensorFlow
+backend does when nothing scores above MIN_SCORE.
+"""
+import cv2
+import numpy as np
+
+from config import CARD_ASPECT, CONTOUR_MAX_SIDE, CONTOUR_MIN_AREA
+
+
+def _edges(gray: np.ndarray) -> np.ndarray:
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    # Thresholds around the median level adapt to the photo's exposure
+    median = float(np.median(blurred))
+    edges = cv2.Canny(blurred, int(max(0, 0.66 * median)), int(min(255, 1.33 * median)))
+    return cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+
+
+def order_corners(pts: np.ndarray) -> np.ndarray:
+    """Four points as top-left, top-right, bottom-right, bottom-left."""
+    pts = pts.reshape(4, 2).astype(np.float32)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).ravel()
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]],
+                    dtype=np.float32)
+
+
+def find_card_quad(image: np.ndarray):
+    """Corners of the card in image pixels (tl, tr, br, bl), or None."""
+    h, w = image.shape[:2]
+    step = max(1, max(h, w) // CONTOUR_MAX_SIDE)
+    small = image[::step, ::step]
+    gray = small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    min_area = CONTOUR_MIN_AREA * gray.shape[0] * gray.shape[1]
+
+    contours, _ = cv2.findContours(_edges(gray), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
+    if not contours or cv2.contourArea(contours[0]) < min_area:
+        return None
+
+    quad = None
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            quad = approx
+            break
+    if quad is None:
+        quad = cv2.boxPoints(cv2.minAreaRect(contours[0]))
+
+    return order_corners(quad) * step
+
+
+def rectify(image: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    """Warp the quadrilateral to an upright card with the canonical aspect ratio."""
+    tl, tr, br, bl = corners
+    width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+    height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+    # Keep the photo's orientation; only the proportions are normalized
+    if width >= height:
+        out_w, out_h = int(round(width)), int(round(width / CARD_ASPECT))
+    else:
+        out_w, out_h = int(round(height / CARD_ASPECT)), int(round(height))
+
+    target = np.array([[0, 0], [out_w - 1, 0], [out_w - 1, out_h - 1], [0, out_h - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(image, matrix, (out_w, out_h), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+
+
+def detect(image: np.ndarray):
+    """Returns (rectified card, (left, top, right, bottom) bounds of the corners in the image)."""
+    h, w = image.shape[:2]
+    corners = find_card_quad(image)
+    if corners is None:
+        return image, (0, 0, w, h)
+
+    left, top = np.floor(corners.min(axis=0)).astype(int)
+    right, bottom = np.ceil(corners.max(axis=0)).astype(int)
+    box = (max(0, int(left)), max(0, int(top)), min(w, int(right)), min(h, int(bottom)))
+    return rectify(image, corners), box
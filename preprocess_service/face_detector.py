@@ -1,6 +1,19 @@
+import threading
+
 import cv2
 import numpy as np
 
+# A CascadeClassifier must not be shared between threads; stages run in the threadpool
+_local = threading.local()
+
+
+def _cascade():
+    """The Haar face cascade, loaded once per thread."""
+    if getattr(_local, "cascade", None) is None:
+        _local.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _local.cascade
+
+
 def face_detector(image_input: np.ndarray) -> str:
     # Load image
     if not isinstance(image_input, np.ndarray) or image_input.size == 0:
@@ -9,7 +22,7 @@ def face_detector(image_input: np.ndarray) -> str:
 
     
     # Load Pre-trained Face Detector 
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    face_cascade = _cascade()
     
     # Detect faces
     faces = face_cascade.detectMultiScale(
@@ -22,4 +35,25 @@ def face_detector(image_input: np.ndarray) -> str:
     if len(faces) > 0:
         return "front" 
     else:
-        return "back"  
\ No newline at end of file
+        return "back"
+
+
+def face_score(image_input: np.ndarray) -> float:
+    """
+    Confidence that the image shows the photo side: the cascade's final-stage
+    weight for the strongest face found, 0.0 when there is none. Only
+    meaningful relative to another image's score, as /session compares them.
+    """
+    if not isinstance(image_input, np.ndarray) or image_input.size == 0:
+        return 0.0
+
+    faces, _, weights = _cascade().detectMultiScale3(
+        image_input,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=(30, 30),
+        outputRejectLevels=True,
+    )
+    if len(faces) == 0:
+        return 0.0
+    return max(0.0, float(np.max(weights)))
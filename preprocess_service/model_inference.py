@@ -1,15 +1,20 @@
 # model_inference.py
 import os
 import cv2
-import tensorflow as tf
 import numpy as np
-from PIL import Image as PILImage
 from pathlib import Path
 
-from config import PATH_TO_MODEL, PATH_TO_LABELS, MIN_SCORE, CROPPED_OUTPUT_PATH
+import contour_detector
+from config import (
+    PATH_TO_MODEL, PATH_TO_LABELS, MIN_SCORE, CROPPED_OUTPUT_PATH, DETECTOR, SAVE_CROPS, CROP_PNG_COMPRESSION,
+)
+from cpu_budget import budget
+from model_registry import models
 
-# Module-level caches so the model is loaded only once.
-_DETECT_FN = None
+# TensorFlow is imported by the functions that need it, so DETECTOR=contour
+# runs (and starts) without it.
+
+# The label map is tiny and parsed once; the model itself is in model_registry.
 _CATEGORY_INDEX = None
 
 def parse_labelmap(labelmap_path=PATH_TO_LABELS):
@@ -40,17 +45,15 @@ def parse_labelmap(labelmap_path=PATH_TO_LABELS):
         return {1: {'id': 1, 'name': 'object'}}
 
 
-def load_model(model_path=PATH_TO_MODEL):
+def _load_saved_model(model_path):
     """
-    Load the TF SavedModel and cache the signature. Raises RuntimeError if loading fails.
+    Load the TF SavedModel and return its detection signature. Raises RuntimeError if loading fails.
     """
-    global _DETECT_FN
-    if _DETECT_FN is not None:
-        return _DETECT_FN
-
     if not model_path or not os.path.exists(model_path):
         raise RuntimeError(f"SavedModel path not found: {model_path}")
 
+    import tensorflow as tf
+    budget.tensorflow(tf)
     try:
         detect_module = tf.saved_model.load(model_path)
         # prefer serving_default if present
@@ -59,18 +62,29 @@ def load_model(model_path=PATH_TO_MODEL):
         else:
             # fallback: try calling the module directly (some SavedModels expose call)
             detect_fn = detect_module
-        _DETECT_FN = detect_fn
         print("   -> Model loaded successfully.")
-        return _DETECT_FN
+        return detect_fn
     except Exception as e:
         raise RuntimeError(f"Could not load SavedModel from {model_path}: {e}")
 
 
-def load_image(image):
+# The service's detector lives in the model registry: loaded on first use,
+# evictable under MODEL_MEMORY_BUDGET_MB / MODEL_IDLE_TTL_S
+models.register("tf_detector", lambda: _load_saved_model(PATH_TO_MODEL))
+
+
+def load_model(model_path=PATH_TO_MODEL):
     """
-    Accepts either a path (str / Path) or a BGR numpy array and returns (bgr_array, input_tensor).
-    input_tensor is uint8 [1,H,W,3] suitable for many TF detection signatures.
+    The detection signature for model_path: the registry's tf_detector for the configured
+    PATH_TO_MODEL, a fresh (unmanaged) load for any other path.
     """
+    if model_path == PATH_TO_MODEL:
+        return models.get("tf_detector")
+    return _load_saved_model(model_path)
+
+
+def read_bgr(image):
+    """Accepts either a path (str / Path) or a BGR numpy array and returns a uint8 BGR array."""
     if isinstance(image, (str, Path)):
         img = cv2.imread(str(image))
         if img is None:
@@ -78,10 +92,18 @@ def load_image(image):
     elif isinstance(image, np.ndarray):
         img = image
     else:
-        raise TypeError("load_image expects a file path or numpy.ndarray (BGR).")
+        raise TypeError("Expected a file path or numpy.ndarray (BGR).")
+    return img.astype(np.uint8, copy=False)
 
-    # Ensure uint8 BGR
-    img = img.astype(np.uint8, copy=False)
+
+def load_image(image):
+    """
+    Accepts either a path (str / Path) or a BGR numpy array and returns (bgr_array, input_tensor).
+    input_tensor is uint8 [1,H,W,3] suitable for many TF detection signatures.
+    """
+    import tensorflow as tf
+
+    img = read_bgr(image)
     # Create tensor shaped [1, H, W, 3]
     input_tensor = tf.convert_to_tensor(np.expand_dims(img, axis=0), dtype=tf.uint8)
     return img, input_tensor
@@ -157,71 +179,92 @@ def get_crop_coordinates(scores, boxes, classes, category_index, min_score):
     return [ymin, xmin, ymax, xmax]
 
 
-def crop_image(image_cv, ymin, xmin, ymax, xmax):
-    """
-    Crop and return a PIL.Image (RGB). If coordinates are full image, return a PIL copy of the input.
-    """
-    im_height, im_width = image_cv.shape[:2]
+def box_to_pixels(image_shape, ymin, xmin, ymax, xmax):
+    """Normalized box -> (left, top, right, bottom) pixel bounds, clamped to the image."""
+    im_height, im_width = image_shape[:2]
     left = int(max(0, xmin) * im_width)
     right = int(min(1.0, xmax) * im_width)
     top = int(max(0, ymin) * im_height)
     bottom = int(min(1.0, ymax) * im_height)
+    return left, top, right, bottom
+
+
+def crop_image(image_cv, ymin, xmin, ymax, xmax):
+    """
+    Crop a BGR ndarray to a normalized box. Returns a view into image_cv (no pixels are
+    copied), or image_cv itself for a degenerate box.
+    """
+    left, top, right, bottom = box_to_pixels(image_cv.shape, ymin, xmin, ymax, xmax)
 
     # Protect against degenerate boxes
     if right <= left or bottom <= top:
-        # return whole image as PIL
-        pil = PILImage.fromarray(cv2.cvtColor(image_cv, cv2.COLOR_BGR2RGB))
-        return pil
+        return image_cv
+    return image_cv[top:bottom, left:right]
+
 
-    image_pil = PILImage.fromarray(cv2.cvtColor(image_cv, cv2.COLOR_BGR2RGB))
-    roi_box = (left, top, right, bottom)
-    cropped_im = image_pil.crop(roi_box)
-    return cropped_im
+def save_crop(cropped_bgr, image_path=None):
+    """Debug copy of the crop (SAVE_CROPS=1), as PNG at the fast CROP_PNG_COMPRESSION level."""
+    if not SAVE_CROPS:
+        return
+    os.makedirs(CROPPED_OUTPUT_PATH, exist_ok=True)
+    # Filename derived from image_path if provided
+    if image_path and isinstance(image_path, (str, Path)):
+        out_name = f"{Path(image_path).stem}_cropped.png"
+    else:
+        out_name = "input-image-cropped.png"
+    output_file = os.path.join(CROPPED_OUTPUT_PATH, out_name)
+    cv2.imwrite(output_file, cropped_bgr, [cv2.IMWRITE_PNG_COMPRESSION, CROP_PNG_COMPRESSION])
+    print(f"6. Cropped Image saved to {output_file}")
 
 
-def detect_card(image, image_path: str = None):
+def detect_card(image, image_path: str = None, return_box: bool = False):
     """
     Public entrypoint used by preprocess_service.
-    Accepts image (ndarray BGR) or path string. Returns cropped BGR numpy array (uint8, contiguous).
+    Accepts image (ndarray BGR) or path string. Returns the cropped BGR uint8 array, or
+    (cropped, (left, top, right, bottom)) with the crop's pixel bounds when return_box is set.
+    The TensorFlow crop is a view into the input image, not a contiguous copy; call
+    np.ascontiguousarray where a packed buffer is needed. With DETECTOR=contour the crop
+    is the rectified card and the bounds are its corners' extent.
     """
-    global _DETECT_FN, _CATEGORY_INDEX
+    global _CATEGORY_INDEX
+
+    if DETECTOR == "contour":
+        return detect_card_contour(image, image_path, return_box)
 
-    # Load model & category index once
-    if _DETECT_FN is None:
-        _DETECT_FN = load_model(PATH_TO_MODEL)
     if _CATEGORY_INDEX is None:
         _CATEGORY_INDEX = parse_labelmap(PATH_TO_LABELS)
 
     # Load image into cv2 BGR and prepare tensor
     img_cv, input_tensor = load_image(image)
 
-    # Run detection
-    boxes, scores, classes = run_detection(_DETECT_FN, input_tensor)
+    # Run detection; the model is loaded if needed and not evicted while in use
+    with models.use("tf_detector") as detect_fn:
+        boxes, scores, classes = run_detection(detect_fn, input_tensor)
 
     # Get crop coordinates
     ymin, xmin, ymax, xmax = get_crop_coordinates(scores, boxes, classes, _CATEGORY_INDEX, MIN_SCORE)
 
-    # Crop image (returns PIL)
-    cropped_pil = crop_image(img_cv, ymin, xmin, ymax, xmax)
+    cropped_bgr = crop_image(img_cv, ymin, xmin, ymax, xmax)
+    save_crop(cropped_bgr, image_path)
 
-    # Ensure output directory exists
-    os.makedirs(CROPPED_OUTPUT_PATH, exist_ok=True)
-    # Save cropped as PNG (filename derived from image_path if provided)
-    if image_path and isinstance(image_path, (str, Path)):
-        input_path = Path(image_path)
-        out_name = f"{input_path.stem}_cropped{input_path.suffix or '.png'}"
-    else:
-        out_name = "input-image-cropped.png"
-    output_file = os.path.join(CROPPED_OUTPUT_PATH, out_name)
-    cropped_pil.save(output_file, format='PNG')
-    print(f"6. Cropped Image saved to {output_file}")
+    if return_box:
+        left, top, right, bottom = box_to_pixels(img_cv.shape, ymin, xmin, ymax, xmax)
+        if right <= left or bottom <= top:
+            left, top, right, bottom = 0, 0, img_cv.shape[1], img_cv.shape[0]
+        return cropped_bgr, (left, top, right, bottom)
+    return cropped_bgr
+
+
+def detect_card_contour(image, image_path: str = None, return_box: bool = False):
+    """detect_card with the OpenCV backend (contour_detector)."""
+    img_cv = read_bgr(image)
+    cropped_bgr, box = contour_detector.detect(img_cv)
+    if box != (0, 0, img_cv.shape[1], img_cv.shape[0]):
+        print(f"   -> Card outline found at {box}")
+    save_crop(cropped_bgr, image_path)
 
-    # Convert PIL -> numpy BGR uint8
-    cropped_np = np.array(cropped_pil)
-    if cropped_np.ndim == 3 and cropped_np.shape[2] == 4:
-        cropped_np = cropped_np[:, :, :3]
-    cropped_bgr = cv2.cvtColor(cropped_np, cv2.COLOR_RGB2BGR)
-    cropped_bgr = np.ascontiguousarray(cropped_bgr, dtype=np.uint8)
+    if return_box:
+        return cropped_bgr, box
     return cropped_bgr
 
 
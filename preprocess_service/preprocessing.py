@@ -2,15 +2,20 @@
 import cv2
 import numpy as np
 
-# Avoid OpenCV thread conflicts with other native libs
-cv2.setNumThreads(0)
+from config import DESKEW, OCR_DETAIL_MAX_DIM, OCR_DETAIL_FORMAT, OCR_DETAIL_JPEG_QUALITY
+from cpu_budget import budget
+from metrics import registry
+
+# OpenCV's pool within the process's CPU budget, shared with the other native libs
+cv2.setNumThreads(budget.threads)
 
 def skew_correction(gray_image):
     """
     Input: 2D uint8 grayscale image
     Output: rotated grayscale image (uint8)
     """
-    orig = gray_image.copy().astype(np.uint8)
+    # Only read below, so the caller's array is used as is
+    orig = gray_image.astype(np.uint8, copy=False)
 
     # Otsu threshold + blur -> edges
     _, thresh = cv2.threshold(orig, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
@@ -22,8 +27,8 @@ def skew_correction(gray_image):
 
     slopes = []
     if hough_lines is not None:
-        for line in hough_lines:
-            x1, y1, x2, y2 = line[0]
+        # (N, 1, 4) on OpenCV 4, (N, 4) on OpenCV 5
+        for x1, y1, x2, y2 in hough_lines.reshape(-1, 4):
             dx = (x2 - x1)
             if dx != 0:
                 slopes.append((y2 - y1) / dx)
@@ -51,9 +56,15 @@ def skew_correction(gray_image):
     return rotated.astype(np.uint8)
 
 
-def resize_image(rotated_image):
+# Longest side of the image OCR reads, and the white border around it
+WORKING_DIM = 640
+BORDER = 20
+# A detail copy less than this much larger than the working image is not worth sending
+MIN_DETAIL_GAIN = 1.25
+
+
+def resize_image(rotated_image, max_dim=WORKING_DIM):
     (h, w) = rotated_image.shape[:2]
-    max_dim = 640
     if w > h:
         ratio = max_dim / float(w)
         new_w = max_dim
@@ -68,14 +79,14 @@ def resize_image(rotated_image):
     return scaled_img
 
 
-def add_border(scaled_img):
+def add_border(scaled_img, border=BORDER):
     # Convert grayscale -> BGR if needed
     if scaled_img.ndim == 2:
         scaled_img = cv2.cvtColor(scaled_img, cv2.COLOR_GRAY2BGR)
 
     border_image = cv2.copyMakeBorder(
         src=scaled_img,
-        top=20, bottom=20, left=20, right=20,
+        top=border, bottom=border, left=border, right=border,
         borderType=cv2.BORDER_CONSTANT,
         value=(255, 255, 255)
     )
@@ -84,10 +95,43 @@ def add_border(scaled_img):
     return border_image
 
 
-def preprocess_pipeline(cropped_image):
+def detail_image(rotated_gray):
+    """
+    The deskewed card in grayscale at up to OCR_DETAIL_MAX_DIM, bordered in
+    proportion, so it is the working image scaled up uniformly: a box in the
+    working image times detail.shape / working.shape is the same region here.
+    None when the card is not sufficiently larger than the working size.
+    """
+    longest = max(rotated_gray.shape[:2])
+    max_dim = min(longest, OCR_DETAIL_MAX_DIM)
+    if not OCR_DETAIL_MAX_DIM or max_dim < WORKING_DIM * MIN_DETAIL_GAIN:
+        return None
+    scale = max_dim / WORKING_DIM
+    if longest > max_dim:
+        rotated_gray = cv2.resize(rotated_gray, None, fx=max_dim / longest, fy=max_dim / longest,
+                                  interpolation=cv2.INTER_AREA)
+    border = round(BORDER * scale)
+    return cv2.copyMakeBorder(rotated_gray, border, border, border, border, cv2.BORDER_CONSTANT, value=255)
+
+
+def encode_detail(detail):
+    """The detail image encoded as OCR_DETAIL_FORMAT; returns (buffer, file suffix)."""
+    if OCR_DETAIL_FORMAT == "png":
+        ok, buf = cv2.imencode(".png", detail, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        suffix = ".png"
+    else:
+        ok, buf = cv2.imencode(".jpg", detail, [cv2.IMWRITE_JPEG_QUALITY, OCR_DETAIL_JPEG_QUALITY])
+        suffix = ".jpg"
+    if not ok:
+        raise RuntimeError("Failed to encode detail image")
+    return buf, suffix
+
+
+def preprocess_pipeline(cropped_image, return_detail: bool = False):
     """
     Expects:  numpy ndarray (uint8)
-    Returns:  numpy ndarray (uint8, C-contiguous)
+    Returns:  numpy ndarray (uint8, C-contiguous), or (that, detail_image or None)
+              when return_detail is set
     """
     if not isinstance(cropped_image, np.ndarray):
         raise TypeError("preprocess_pipeline expects a numpy.ndarray")
@@ -98,11 +142,17 @@ def preprocess_pipeline(cropped_image):
     # Convert to grayscale for skew detection
     gray_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    rotated_gray = skew_correction(gray_image)
+    if DESKEW:
+        with registry.timer("deskew"):
+            rotated_gray = skew_correction(gray_image)
+    else:
+        rotated_gray = gray_image
     resized_gray = resize_image(rotated_gray)
     final_bgr = add_border(resized_gray)
 
     final_bgr = np.ascontiguousarray(final_bgr, dtype=np.uint8)
+    if return_detail:
+        return final_bgr, detail_image(rotated_gray)
     return final_bgr
 
 
@@ -0,0 +1,103 @@
+# quality.py
+"""
+Upload quality gate, run before card detection.
+
+Photos that are blurred, washed out by glare, badly exposed or show the
+card as a small patch of the frame go through detection, deskew, both OCR
+engines and the LLM only to come back empty. assess_quality measures them on
+a copy downsampled to QUALITY_MAX_SIDE pixels (a few milliseconds on any
+upload size) and quality_issues lists what is wrong, with a message the
+user can act on.
+
+The card region is estimated from edges (closed Canny edges, largest outer
+contour), so the brightness, glare and sharpness measures cover the card
+rather than the table around it. A card filling the frame gives a ratio near
+1; a busy background can only make the estimate larger, so the area check
+errs on the side of letting photos through.
+"""
+import cv2
+import numpy as np
+
+from config import (
+    QUALITY_MAX_SIDE, QUALITY_MIN_SHARPNESS, QUALITY_GLARE_LEVEL, QUALITY_MAX_GLARE,
+    QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS, QUALITY_MIN_CARD_AREA,
+)
+
+
+def _downsample(img: np.ndarray) -> np.ndarray:
+    h, w = img.shape[:2]
+    # Strided view first (no copy), so large uploads never go through a full-size resize or cvtColor
+    step = max(1, max(h, w) // QUALITY_MAX_SIDE)
+    small = img[::step, ::step]
+    h, w = small.shape[:2]
+    scale = QUALITY_MAX_SIDE / max(h, w)
+    if scale < 1:
+        small = cv2.resize(small, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    return small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def _card_mask(gray: np.ndarray) -> np.ndarray:
+    """Filled outline of the largest edge cluster; the whole frame if there is none."""
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+    closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    mask = np.zeros_like(gray)
+    if not contours:
+        mask[:] = 255
+        return mask
+    hull = cv2.convexHull(max(contours, key=cv2.contourArea))
+    cv2.drawContours(mask, [hull], -1, 255, thickness=cv2.FILLED)
+    return mask
+
+
+def assess_quality(img: np.ndarray) -> dict:
+    """Blur, glare, exposure and card-area measures of a BGR (or gray) image."""
+    gray = _downsample(img)
+    mask = _card_mask(gray)
+    card = mask > 0
+    pixels = gray[card]
+
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    return {
+        # Variance of the Laplacian: low when edges are smeared
+        "sharpness": round(float(laplacian[card].var()), 1),
+        "glare": round(float(np.count_nonzero(pixels >= QUALITY_GLARE_LEVEL)) / pixels.size, 4),
+        "brightness": round(float(pixels.mean()), 1),
+        "card_area": round(float(np.count_nonzero(card)) / card.size, 4),
+    }
+
+
+def quality_issues(metrics: dict) -> list:
+    """
+    One {"check", "value", "threshold", "message"} per failed check; empty if usable.
+
+    Exposure is checked first: a dark photo also has weak edges, so it is not
+    additionally called blurry, and the card area is only judged on sharp,
+    well-exposed photos, where its edges can be found.
+    """
+    issues = []
+
+    def fail(check, metric, threshold, message):
+        issues.append({"check": check, "value": metrics[metric], "threshold": threshold, "message": message})
+
+    if metrics["brightness"] < QUALITY_MIN_BRIGHTNESS:
+        fail("underexposed", "brightness", QUALITY_MIN_BRIGHTNESS,
+             "The photo is too dark. Take it in better light.")
+    elif metrics["brightness"] > QUALITY_MAX_BRIGHTNESS:
+        fail("overexposed", "brightness", QUALITY_MAX_BRIGHTNESS,
+             "The photo is overexposed. Reduce the light on the card or turn off the flash.")
+    if metrics["glare"] > QUALITY_MAX_GLARE:
+        fail("glare", "glare", QUALITY_MAX_GLARE,
+             "Part of the card is washed out by glare. Avoid direct light or flash on the card.")
+    if issues:
+        return issues
+
+    if metrics["sharpness"] < QUALITY_MIN_SHARPNESS:
+        fail("blurry", "sharpness", QUALITY_MIN_SHARPNESS,
+             "The photo is blurry. Hold the camera steady and let it focus before taking the picture.")
+    elif metrics["card_area"] < QUALITY_MIN_CARD_AREA:
+        fail("card_too_small", "card_area", QUALITY_MIN_CARD_AREA,
+             "The card is too small in the photo. Move closer so the card fills most of the frame.")
+    return issues
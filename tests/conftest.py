@@ -0,0 +1,16 @@
+# tests/conftest.py
+"""
+Tests run from the repository root with `python -m pytest tests`.
+
+The services use flat imports and share module names (each has its own
+config.py), so their modules are loaded with embedded.load_service, which
+keeps each service's copies apart, rather than by putting service
+directories on sys.path.
+"""
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
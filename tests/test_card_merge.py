@@ -0,0 +1,97 @@
+# tests/test_card_merge.py
+import pytest
+
+from embedded import load_service
+
+card_merge = load_service("preprocess_service", ["card_merge"])["card_merge"]
+
+
+@pytest.fixture(autouse=True)
+def gazetteer(monkeypatch):
+    # A two-place stand-in for the gazetteer pairing, keyed as _place_names keys it
+    districts = {card_merge._key("ललितपुर"): "Lalitpur"}
+    municipalities = {(card_merge._key("ललितपुर"), card_merge._key("गोदावरी नगरपालिका")): "Godawari Municipality"}
+    monkeypatch.setattr(card_merge, "_place_names", lambda: (districts, municipalities))
+
+
+def front(**overrides) -> dict:
+    clean = {
+        "Name": "राम बहादुर थापा",
+        "Citizenship Number": "२७-०१-७४-०५८२१",
+        "Date of Birth (DOB)": "२०४५ महिना: ०२ गते २८",
+        "Gender": "पुरुष",
+        "Birth Place": {"District": "ललितपुर", "Municipality/VDC": "गोदावरी नगरपालिका", "Ward": "३"},
+        "Permanent Address": {"District": "ललितपुर", "Municipality/VDC": "गोदावरी नगरपालिका", "Ward": "३"},
+    }
+    clean.update(overrides)
+    return {"final_clean": clean}
+
+
+def back(**overrides) -> dict:
+    result = {
+        "Name": "Ram Bahadur Thapa",
+        "Citizenship Number": "27-01-74-05821",
+        "Date of Birth (DOB)": "1988/06/11",
+        "Gender": "Male",
+        "Birth Place District": "Lalitpur",
+        "Birth Place MetroPolitan/Sub-MetroPolitan/Municipality/VDC": "Godawari Municipality",
+        "Birth Place Ward": "3",
+        "Permanent District": "Lalitpur",
+        "Permanent MetroPolitan/Sub-MetroPolitan/Municipality/VDC": "Godawari Municipality",
+        "Permanent Ward": "03",
+    }
+    result.update(overrides)
+    return result
+
+
+def test_matching_sides_merge_into_one_record():
+    merged = card_merge.merge_sides(front(), back())
+    assert merged["consistent"] and merged["mismatches"] == []
+    assert {check["status"] for check in merged["checks"].values()} == {"match"}
+    record = merged["record"]
+    assert record["name"] == "Ram Bahadur Thapa" and record["name_ne"] == "राम बहादुर थापा"
+    assert record["citizenship_number"] == "27-01-74-05821"
+    assert record["date_of_birth"] == "1988/06/11" and record["date_of_birth_bs"] == "२०४५ महिना: ०२ गते २८"
+
+
+@pytest.mark.parametrize("a, b, same", [
+    ("२७-०१-७४-०५८२१", "27-01-74-05821", True),
+    ("27 01 74 05821", "27-01-74-05821", True),
+    ("01-23", "1-023", False),
+    ("27-01-74-5821", "27-01-74-05821", False),
+])
+def test_citizenship_numbers_compare_digit_for_digit(a, b, same):
+    assert card_merge._same_number(a, b) is same
+
+
+def test_mismatched_field_is_left_empty():
+    merged = card_merge.merge_sides(front(), back(**{"Citizenship Number": "27-01-74-05822"}))
+    assert not merged["consistent"] and merged["mismatches"] == ["citizenship_number"]
+    assert merged["record"]["citizenship_number"] is None
+    assert merged["checks"]["citizenship_number"]["back"] == "27-01-74-05822"
+
+
+@pytest.mark.parametrize("bs, ad, status", [
+    ("२०४५ महिना: ०२ गते २८", "1988/06/11", "match"),     # BS vs AD: only the year offset is checked
+    ("२०४५ महिना: ०२ गते २८", "1990/06/11", "mismatch"),
+    ("1988/06/11", "1988/06/11", "match"),                # same calendar: compared in full
+    ("1988/06/12", "1988/06/11", "mismatch"),
+    ("२०४५", "1988/06/11", "unchecked"),
+])
+def test_dates_of_birth(bs, ad, status):
+    merged = card_merge.merge_sides(front(**{"Date of Birth (DOB)": bs}), back(**{"Date of Birth (DOB)": ad}))
+    assert merged["checks"]["date_of_birth"]["status"] == status
+
+
+def test_places_missing_from_the_gazetteer_are_unchecked():
+    birth = {"District": "काठमाडौं", "Municipality/VDC": "काठमाडौं महानगरपालिका", "Ward": "३"}
+    merged = card_merge.merge_sides(front(**{"Birth Place": birth}), back())
+    assert merged["checks"]["birth_district"]["status"] == "unchecked"
+    assert merged["checks"]["birth_municipality"]["status"] == "unchecked"
+    assert merged["consistent"]
+
+
+def test_field_absent_on_one_side_is_missing_and_filled_from_the_other():
+    merged = card_merge.merge_sides(front(), back(**{"Gender": None}))
+    assert merged["checks"]["gender"]["status"] == "missing"
+    assert merged["record"]["gender"] == "पुरुष"
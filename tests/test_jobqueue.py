@@ -0,0 +1,112 @@
+# tests/test_jobqueue.py
+from types import SimpleNamespace
+
+import pytest
+
+from embedded import jobqueue
+from embedded.jobqueue import JobQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # jobqueue only reads time.time(); SQLite's own lock timeout is unaffected
+    monkeypatch.setattr(jobqueue, "time", SimpleNamespace(time=clock))
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    q = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_s=60, max_attempts=3, retry_backoff_s=5)
+    q.submit("job-1", {"image": "card.png"})
+    return q
+
+
+def available_at(queue: JobQueue, task) -> float:
+    return queue._db.execute("SELECT available_at FROM tasks WHERE id = ?", (task.id,)).fetchone()[0]
+
+
+def test_ack_hands_the_job_to_the_next_stage(queue):
+    task = queue.claim("preprocess")
+    assert task.payload == {"image": "card.png"} and task.attempts == 1
+    assert queue.ack(task, "ocr", {"key": "ab/abc.png"})
+
+    assert queue.claim("preprocess") is None
+    ocr = queue.claim("ocr")
+    assert ocr.payload == {"key": "ab/abc.png"}
+    assert queue.ack(ocr, result={"ok": True})
+    job = queue.job("job-1")
+    assert job["status"] == "done" and job["result"] == {"ok": True}
+
+
+def test_stale_ack_is_refused(queue, clock):
+    first = queue.claim("preprocess")
+    clock.now += 61  # the first worker's lease runs out
+    second = queue.claim("preprocess")
+    assert second.id == first.id and second.attempts == 2
+
+    assert not queue.ack(first, result={"from": "first"})
+    assert queue.fail(first, "late failure") is False
+    assert queue.job("job-1")["status"] == "running"
+
+    assert queue.ack(second, result={"from": "second"})
+    assert queue.job("job-1")["result"] == {"from": "second"}
+
+
+def test_retries_back_off(queue, clock):
+    task = queue.claim("preprocess")
+    assert queue.fail(task, "LLM unreachable")
+    assert available_at(queue, task) == clock.now + 5
+    assert queue.claim("preprocess") is None
+    assert queue.job("job-1")["status"] == "queued"
+
+    clock.now += 5
+    task = queue.claim("preprocess")
+    assert task.attempts == 2
+    assert queue.fail(task, "LLM unreachable")
+    assert available_at(queue, task) == clock.now + 10
+
+
+def test_dead_letter_after_max_attempts_and_requeue(queue, clock):
+    for attempt in range(1, 4):
+        task = queue.claim("preprocess")
+        assert task.attempts == attempt
+        retried = queue.fail(task, f"crash {attempt}")
+        clock.now += 3600
+    assert not retried
+
+    assert queue.claim("preprocess") is None
+    job = queue.job("job-1")
+    assert job["status"] == "failed" and job["status_code"] == 500 and job["error"] == "crash 3"
+    assert queue.stats()["tasks"]["preprocess"]["dead"] == 1
+
+    assert queue.requeue_dead() == 1
+    assert queue.job("job-1")["status"] == "queued"
+    task = queue.claim("preprocess")
+    assert task.attempts == 1
+    assert queue.stats()["tasks"]["preprocess"] == {"ready": 0, "leased": 1, "dead": 0}
+
+
+def test_lease_expiring_on_every_attempt_is_dead_lettered(queue, clock):
+    for _ in range(3):
+        assert queue.claim("preprocess") is not None
+        clock.now += 61
+    assert queue.claim("preprocess") is None
+    assert queue.job("job-1")["error"] == "lease expired on every attempt"
+
+
+def test_reject_fails_the_job_without_retry(queue):
+    task = queue.claim("preprocess")
+    queue.reject(task, 404, "No ID card detected")
+    job = queue.job("job-1")
+    assert job["status"] == "failed" and job["status_code"] == 404
+    assert queue.claim("preprocess") is None
+    assert queue.requeue_dead() == 0
@@ -0,0 +1,63 @@
+# tests/test_json_repair.py
+import pytest
+
+from embedded import load_service
+
+_llm = load_service("llm_service", ["json_repair", "schema"])
+repair_json = _llm["json_repair"].repair_json
+FrontSideCard, BackSideCard = _llm["schema"].FrontSideCard, _llm["schema"].BackSideCard
+
+
+def test_valid_json_is_untouched():
+    data, fixes = repair_json('{"Name": "राम", "Gender": "Male"}', FrontSideCard)
+    assert data == {"Name": "राम", "Gender": "Male"}
+    assert fixes == []
+
+
+def test_markdown_fences_and_prose_are_stripped():
+    data, fixes = repair_json('Here is the card:\n```json\n{"Name": "Ram"}\n```', BackSideCard)
+    assert data == {"Name": "Ram"}
+    assert "stripped_wrapping" in fixes
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"Name": "Ram", "Citizenship_Number": "12-3', {"Name": "Ram", "Citizenship_Number": "12-3"}),
+    ('{"Name": "Ram",', {"Name": "Ram"}),
+    ('{"Name": "Ram", "Citizen', {"Name": "Ram"}),
+    ('{"Name": "Ram", "Citizenship_Number"', {"Name": "Ram"}),
+    ('{"Name": "Ram", "Citizenship_Number":', {"Name": "Ram"}),
+])
+def test_truncated_output_is_closed(raw, expected):
+    data, fixes = repair_json(raw, BackSideCard)
+    assert data == expected
+    assert "closed_truncated" in fixes
+
+
+def test_trailing_text_after_the_object_is_ignored():
+    data, _ = repair_json('{"Name": "Ram"} and {"Name": "Shyam"}', BackSideCard)
+    assert data == {"Name": "Ram"}
+
+
+def test_keys_are_aliased_and_unknown_keys_dropped():
+    data, fixes = repair_json('{"Citizenship Number": "12-34", "Blood Group": "O+"}', BackSideCard)
+    assert data == {"Citizenship_Number": "12-34"}
+    assert "aliased_key:Citizenship Number" in fixes and "dropped_key:Blood Group" in fixes
+
+
+def test_values_are_stringified_nulled_and_coerced():
+    raw = '{"Permanent_Ward": 5, "Spouse_Name": "N/A", "Name": ["Ram"], "Gender": "पुरुष (Male)"}'
+    data, fixes = repair_json(raw, FrontSideCard)
+    assert data == {"Permanent_Ward": "5", "Spouse_Name": None, "Name": None, "Gender": "Male"}
+    assert {"stringified:Permanent_Ward", "nulled:Name", "coerced_literal:Gender"} <= set(fixes)
+    FrontSideCard.model_validate(data)
+
+
+def test_gender_is_coerced_into_the_back_schema_script():
+    data, _ = repair_json('{"Gender": "F"}', BackSideCard)
+    assert data == {"Gender": "महिला"}
+
+
+def test_unparseable_output_gives_none():
+    assert repair_json("no json here", BackSideCard)[0] is None
+    assert repair_json('{"Name": 5x5}', BackSideCard)[0] is None
+    assert repair_json("[1, 2]", BackSideCard)[0] is None
@@ -0,0 +1,94 @@
+# tools/shared_modules.py
+"""
+Keeps the modules every service carries its own copy of identical.
+
+Each service is built from its own directory (its Docker build context) and
+the embedded pipeline loads each service's modules as separate instances,
+so infrastructure modules such as metrics.py are copied into every service
+that uses them rather than imported from one place. This checks that the
+copies have not drifted apart, and brings them back in line:
+
+    python tools/shared_modules.py              # exit 1 and a diff if copies differ
+    python tools/shared_modules.py --sync preprocess_service
+
+--sync copies that service's version of each shared module over the other
+services' copies: edit the module in one service, then sync from it.
+"""
+import argparse
+import difflib
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SERVICES = ("preprocess_service", "ocr_service", "llm_service")
+
+# Module -> the services that carry a copy of it
+SHARED: Dict[str, Tuple[str, ...]] = {
+    "admission.py": SERVICES,
+    "cpu_budget.py": SERVICES,
+    "metrics.py": SERVICES,
+    "model_registry.py": SERVICES,
+    "profiling.py": SERVICES,
+    "storage.py": ("preprocess_service", "ocr_service"),
+}
+
+
+def copies(module: str) -> List[Path]:
+    return [REPO_ROOT / service / module for service in SHARED[module]]
+
+
+def check() -> List[str]:
+    """A unified diff per copy that differs from the first service's copy."""
+    problems = []
+    for module in SHARED:
+        first, *others = copies(module)
+        reference = first.read_text(encoding="utf-8").splitlines(keepends=True)
+        for other in others:
+            if not other.exists():
+                problems.append(f"{other.relative_to(REPO_ROOT)} is missing\n")
+                continue
+            lines = other.read_text(encoding="utf-8").splitlines(keepends=True)
+            if lines != reference:
+                problems.append("".join(difflib.unified_diff(
+                    reference, lines, str(first.relative_to(REPO_ROOT)), str(other.relative_to(REPO_ROOT)))))
+    return problems
+
+
+def sync(source: str) -> List[Path]:
+    """Copy source's version of every shared module it carries over the others; returns the files written."""
+    written = []
+    for module, services in SHARED.items():
+        if source not in services:
+            continue
+        src = REPO_ROOT / source / module
+        for dst in copies(module):
+            if dst != src and (not dst.exists() or dst.read_bytes() != src.read_bytes()):
+                shutil.copyfile(src, dst)
+                written.append(dst)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync", metavar="SERVICE", choices=SERVICES,
+                        help="copy this service's shared modules over the other copies")
+    args = parser.parse_args()
+
+    if args.sync:
+        for path in sync(args.sync):
+            print(f"Updated {path.relative_to(REPO_ROOT)}")
+
+    problems = check()
+    for problem in problems:
+        sys.stdout.write(problem)
+    if problems:
+        print(f"{len(problems)} shared module copies differ; edit one and run --sync SERVICE", file=sys.stderr)
+        sys.exit(1)
+    print(f"All copies of {len(SHARED)} shared modules are identical")
+
+
+if __name__ == "__main__":
+    main()